@@ -1,20 +1,39 @@
-import base64
-import binascii
 import json
 import logging
 import os
 import traceback
+import uuid
 from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, Body, Depends, Header, Response, status
+from fastapi import APIRouter, Body, Depends, Header, Request, Response, status
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from app.core import config as cfg
 from app.core.auth import require_bot_token
 from app.core.db import get_connection
-from app.services import LlmTimeoutError, ask_llm
-from app.services.limits_service import apply_rate_limits_or_return
+from app.core.metrics import CHAT_REJECTIONS
+from app.core.timing import RequestTimer, start_request_timer
+from app.core.tracing import start_server_span
+from app.services import CircuitOpenError, LlmTimeoutError, ask_llm
+from app.services.limits_service import apply_rate_limits_or_return, daily_limit_for_plan
+from app.services.interactions_log import log_interaction
+from app.services.llm_policies import get_llm_policy
+from app.services.media_service import (
+    build_vision_cache_key,
+    check_attachments_budget,
+    discard_media_file,
+    insert_media_asset,
+    load_media_attachments,
+    normalize_inline_attachments,
+    decode_inline_attachment,
+    resolve_media_attachments,
+    store_uploaded_image,
+    stream_upload_to_disk,
+    vision_answer_cache_get,
+    vision_answer_cache_put,
+)
 from app.services.pet_profile_service import (
     build_pet_dict_from_row,
     deep_merge_dict,
@@ -39,29 +58,16 @@ from app.services.sessions import (
     upsert_session_turn,
 )
 from app.services.prompts import get_system_prompt
+from app.services.text_markers import (
+    PHOTO_INTENT_MARKERS,
+    VISION_HISTORY_REFUSAL_MARKERS,
+    VISION_REFUSAL_IGNORED,
+    VISION_REFUSAL_MARKERS,
+)
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn.error")
 
-VISION_REFUSAL_MARKERS = [
-    "не могу видеть изображ",
-    "не вижу изображ",
-    "не могу просматривать изображ",
-    "я не вижу изображение",
-    "i can't see the image",
-    "i cannot see the image",
-    "cannot view images",
-    "can't view images",
-    "i can't access images",
-    "as a text-based model",
-    "i'm unable to view images",
-]
-VISION_HISTORY_REFUSAL_MARKERS = [
-    "не могу сказать, кто изображ",
-    "не вижу фото",
-    "не могу просматривать изображ",
-]
-
 MAX_ATTACHMENT_BYTES = 3_000_000
 TEXT_FREE_PHOTO_NOTE = (
     "ℹ️ Примечание: анализ фото доступен только в Pro. "
@@ -92,7 +98,7 @@ def normalize_attachments(attachments: list[dict] | None) -> list[dict]:
         return []
     if not isinstance(attachments, list):
         raise ValueError("invalid_attachments")
-    if len(attachments) > 1:
+    if len(attachments) > cfg.VISION_MAX_ATTACHMENTS:
         raise ValueError("too_many_attachments")
     normalized = []
     for item in attachments:
@@ -102,64 +108,24 @@ def normalize_attachments(attachments: list[dict] | None) -> list[dict]:
         if att_type != "image":
             raise ValueError("unsupported_attachment_type")
         source = item.get("source")
+        if source == "media":
+            try:
+                media_id = str(uuid.UUID(str(item.get("media_id"))))
+            except ValueError:
+                raise ValueError("invalid_media_id")
+            normalized.append({"type": "image", "source": "media", "media_id": media_id})
+            continue
         if source != "inline":
             raise ValueError("unsupported_attachment_source")
         data = item.get("data")
         if not isinstance(data, str) or not data.strip():
             raise ValueError("invalid_attachment_data")
-        data = data.strip()
-        payload = data
-        if payload.startswith("data:") and "," in payload:
-            payload = payload.split(",", 1)[1]
-        try:
-            decoded = base64.b64decode(payload, validate=True)
-        except (binascii.Error, ValueError):
-            raise ValueError("invalid_attachment_base64")
-        if len(decoded) > MAX_ATTACHMENT_BYTES:
-            raise ValueError("attachment_too_large")
-        mime = item.get("mime") or "image/jpeg"
-        normalized.append(
-            {
-                "type": "image",
-                "source": "inline",
-                "mime": mime,
-                "data": payload,
-            }
-        )
+        normalized.append(decode_inline_attachment(data.strip(), MAX_ATTACHMENT_BYTES))
     return normalized
 
 
 def has_photo_intent(text: str | None) -> bool:
-    if not text:
-        return False
-    t = text.lower()
-    return any(
-        phrase in t
-        for phrase in [
-            "можно фото",
-            "могу фото",
-            "прислать фото",
-            "отправить фото",
-            "скинуть фото",
-            "прикрепить фото",
-            "фото прикрепить",
-            "фото прислать",
-            "фото скинуть",
-            "фото отправить",
-            "фото можно",
-            "фото могу",
-            "фото принимаешь",
-            "принимаешь фото",
-            "оценить по фото",
-            "посмотри фото",
-            "что на фото",
-            "что на снимке",
-            "нужно фото",
-            "лучше фото",
-            "скинуть снимок",
-            "прислать снимок",
-        ]
-    )
+    return PHOTO_INTENT_MARKERS.search(text)
 
 
 def format_lifestyle_block(lifestyle: dict | None) -> str | None:
@@ -208,12 +174,109 @@ def format_lifestyle_block(lifestyle: dict | None) -> str | None:
     return "🏡 Условия жизни и питание:\n" + "\n".join(lines)
 
 
+def build_final_user_text(
+    original_text: str, session_prefix: str, effective_pet_profile: dict | None
+) -> str:
+    # Тот же текст собирает scripts/replay_prompts.py из истории — менять только здесь
+    final_user_text = original_text
+    if session_prefix:
+        final_user_text = f"{session_prefix}\n\nТекущий вопрос: {original_text}"
+    if effective_pet_profile:
+        lifestyle_block = format_lifestyle_block(
+            effective_pet_profile.get("lifestyle")
+            if isinstance(effective_pet_profile, dict)
+            else None
+        )
+        prefix = "ПРОФИЛЬ ПИТОМЦА (из анкеты пользователя):\n"
+        if lifestyle_block:
+            prefix += lifestyle_block + "\n\n"
+        pet_profile_json = json.dumps(effective_pet_profile, ensure_ascii=False)
+        final_user_text = prefix + pet_profile_json + "\n\n" + final_user_text
+    return final_user_text
+
+
+def select_policy_name(has_image: bool, user_plan: str | None) -> str:
+    if has_image:
+        return "pro_vision"
+    if user_plan == "pro":
+        return "pro_default"
+    return "free_default"
+
+
 
 @router.post("/chat/ask", dependencies=[Depends(require_bot_token)])
 def chat_ask(
     response: Response,
     x_request_id: str | None = Header(default=None, alias="X-Request-Id"),
+    traceparent: str | None = Header(default=None),
     payload: ChatAskPayload = Body(...),
+):
+    # traceparent от бота продолжает его трейс: стадии и HTTP к LLM — дочерние span'ы
+    span = start_server_span(
+        "POST /v1/chat/ask",
+        traceparent,
+        request_id=x_request_id,
+        telegram_user_id=payload.user.telegram_user_id,
+    )
+    timer = start_request_timer(span)
+    result = None
+    try:
+        result = _chat_ask(response, x_request_id, payload, timer)
+        return result
+    finally:
+        _count_rejection("chat_ask", result)
+        status_code = _result_status(result)
+        if timer.enabled:
+            _finish_chat_timing(timer, response, result, status_code, x_request_id, payload)
+        if span is not None:
+            span.end(error=status_code >= 500, http_status=status_code)
+
+
+def _result_status(result) -> int:
+    if isinstance(result, Response):
+        return result.status_code
+    return 200 if result is not None else 500
+
+
+def _count_rejection(route: str, result) -> None:
+    if not isinstance(result, JSONResponse) or result.status_code not in (402, 429):
+        return
+    try:
+        error_text = json.loads(result.body.decode("utf-8")).get("error") or "unknown"
+    except Exception:
+        error_text = "unknown"
+    CHAT_REJECTIONS.labels(route, str(result.status_code), error_text).inc()
+
+
+def _finish_chat_timing(
+    timer: RequestTimer,
+    response: Response,
+    result,
+    status_code: int,
+    x_request_id: str | None,
+    payload: ChatAskPayload,
+) -> None:
+    total = timer.total()
+    timer.observe(total=total)
+    logger.info(
+        "CHAT_TIMING rid=%s user=%s status=%s trace=%s %s",
+        x_request_id,
+        payload.user.telegram_user_id,
+        status_code,
+        timer.span.trace_id if timer.span is not None else "-",
+        timer.log_fields(total),
+    )
+    if cfg.SERVER_TIMING_HEADER:
+        # Возвращённый JSONResponse не получает заголовки из response — ставим на тот, что уйдёт клиенту
+        target = result if isinstance(result, Response) else response
+        target.headers["Server-Timing"] = timer.server_timing(total)
+
+
+def _chat_ask(
+    response: Response,
+    x_request_id: str | None,
+    payload: ChatAskPayload,
+    timer: RequestTimer,
 ):
     validation_response = validate_x_request_id(x_request_id)
     if validation_response:
@@ -221,7 +284,8 @@ def chat_ask(
 
     with get_connection() as conn:
         with conn.cursor() as cur:
-            dedup_response = dedup_begin_or_return(cur, response, x_request_id)
+            with timer.stage("dedup"):
+                dedup_response = dedup_begin_or_return(cur, response, x_request_id)
             if dedup_response is not None:
                 return dedup_response
 
@@ -244,8 +308,7 @@ def chat_ask(
             has_image = bool(attachments)
 
             now = datetime.now(timezone.utc)
-            daily_limit = int(os.getenv("FREE_DAILY_LIMIT", "3"))
-            cooldown_sec_default = int(os.getenv("COOLDOWN_SEC", "25"))
+            cooldown_sec_default = cfg.COOLDOWN_SEC
             window_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
             window_end = window_start + timedelta(days=1)
             vision_limit_month = cfg.PRO_VISION_IMAGE_LIMIT_MONTH
@@ -262,28 +325,31 @@ def chat_ask(
             count = None
             vision_images_used = 0
             vision_images_reset_at = None
+            vision_cache_key = None
+            cached_vision_answer = None
             if telegram_user_id is not None:
-                cur.execute(
-                    "select id, plan, vision_images_used, vision_images_reset_at "
-                    "from users where telegram_user_id = %s",
-                    (telegram_user_id,),
-                )
-                user_row = cur.fetchone()
-                if not user_row:
-                    cur.execute(
-                        "insert into users "
-                        "(telegram_user_id, created_at, plan, locale, last_seen_at, "
-                        "research_used, research_limit, research_reset_at) "
-                        "values (%s, now(), 'free', null, null, 0, 2, date_trunc('month', now()) + interval '1 month') "
-                        "on conflict (telegram_user_id) do nothing",
-                        (telegram_user_id,),
-                    )
+                with timer.stage("user"):
                     cur.execute(
                         "select id, plan, vision_images_used, vision_images_reset_at "
                         "from users where telegram_user_id = %s",
                         (telegram_user_id,),
                     )
                     user_row = cur.fetchone()
+                    if not user_row:
+                        cur.execute(
+                            "insert into users "
+                            "(telegram_user_id, created_at, plan, locale, last_seen_at, "
+                            "research_used, research_limit, research_reset_at) "
+                            "values (%s, now(), 'free', null, null, 0, 2, date_trunc('month', now()) + interval '1 month') "
+                            "on conflict (telegram_user_id) do nothing",
+                            (telegram_user_id,),
+                        )
+                        cur.execute(
+                            "select id, plan, vision_images_used, vision_images_reset_at "
+                            "from users where telegram_user_id = %s",
+                            (telegram_user_id,),
+                        )
+                        user_row = cur.fetchone()
                 if user_row:
                     user_id = user_row[0]
                     user_plan = user_row[1]
@@ -298,6 +364,28 @@ def chat_ask(
                         )
                     # Pro vision quota (monthly) — only for image requests
                     if has_image and user_plan == "pro":
+                        try:
+                            with timer.stage("media"):
+                                attachments = resolve_media_attachments(
+                                    cur, user_id, attachments
+                                )
+                                # До квоты и LLM: файл, удалённый с диска, — 400 media_expired, а не 502
+                                attachments = load_media_attachments(attachments)
+                                check_attachments_budget(
+                                    attachments, cfg.VISION_MAX_TOTAL_BYTES
+                                )
+                        except ValueError as exc:
+                            error_text = str(exc) or "media_not_found"
+                            dedup_mark_failed(cur, x_request_id, error_text)
+                            return JSONResponse(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                content={"ok": False, "error": error_text},
+                            )
+                        vision_cache_key = build_vision_cache_key(
+                            user_id, attachments, payload.text, payload.mode
+                        )
+                        cached_vision_answer = vision_answer_cache_get(vision_cache_key)
+
                         # 1) reset if needed (DB time)
                         cur.execute(
                             "update users "
@@ -312,8 +400,10 @@ def chat_ask(
                             vision_images_used = int(row_reset[0] or 0)
                             vision_images_reset_at = row_reset[1]
 
-                        # 2) check limit
-                        if int(vision_images_used or 0) >= int(vision_limit_month):
+                        # 2) check limit (повтор того же фото из кэша квоту не тратит)
+                        if cached_vision_answer is None and int(
+                            vision_images_used or 0
+                        ) >= int(vision_limit_month):
                             dedup_mark_failed(
                                 cur, x_request_id, "vision_limit_exceeded"
                             )
@@ -341,24 +431,25 @@ def chat_ask(
                                 },
                             )
 
-                        vision_remaining = int(vision_limit_month) - int(
-                            vision_images_used or 0
+                        vision_remaining = max(
+                            0, int(vision_limit_month) - int(vision_images_used or 0)
                         )
                         vision_reset_at_out = (
                             vision_images_reset_at.isoformat().replace("+00:00", "Z")
                             if vision_images_reset_at
                             else None
                         )
-                    limits_result = apply_rate_limits_or_return(
-                        cur,
-                        user_id,
-                        user_plan,
-                        now,
-                        daily_limit,
-                        cooldown_sec_default,
-                        window_start,
-                        window_end,
-                    )
+                    with timer.stage("rate_limits"):
+                        limits_result = apply_rate_limits_or_return(
+                            cur,
+                            user_id,
+                            user_plan,
+                            now,
+                            daily_limit_for_plan(user_plan),
+                            cooldown_sec_default,
+                            window_start,
+                            window_end,
+                        )
                     if isinstance(limits_result, JSONResponse):
                         try:
                             error_payload = json.loads(limits_result.body.decode("utf-8"))
@@ -369,11 +460,26 @@ def chat_ask(
                         return limits_result
                     limits_remaining_today, limits_reset_at = limits_result
 
-            (
-                effective_pet_profile,
-                pet_profile_source,
-                pet_profile_pet_id,
-            ) = resolve_effective_pet_profile(cur, user_plan, user_id, pet_dict)
+            # Pillow — только после проверок плана, квоты и лимитов; повтор из кэша vision фото не трогает
+            if has_image and cached_vision_answer is None:
+                try:
+                    with timer.stage("media"):
+                        attachments = normalize_inline_attachments(attachments)
+                        check_attachments_budget(attachments, cfg.VISION_MAX_TOTAL_BYTES)
+                except ValueError as exc:
+                    error_text = str(exc) or "invalid_image"
+                    dedup_mark_failed(cur, x_request_id, error_text)
+                    return JSONResponse(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        content={"ok": False, "error": error_text},
+                    )
+
+            with timer.stage("pet_profile"):
+                (
+                    effective_pet_profile,
+                    pet_profile_source,
+                    pet_profile_pet_id,
+                ) = resolve_effective_pet_profile(cur, user_plan, user_id, pet_dict)
             has_effective_pet_profile = bool(effective_pet_profile)
             pet_profile_keys = (
                 list(effective_pet_profile.keys())
@@ -392,7 +498,8 @@ def chat_ask(
             active_session_id = None
             active_mode = DEFAULT_MODE
             if user_id:
-                active_session = get_active_session(cur, user_id)
+                with timer.stage("session"):
+                    active_session = get_active_session(cur, user_id)
                 if active_session:
                     active_session_id = active_session.get("id")
                     session_context = normalize_session_context(
@@ -415,142 +522,49 @@ def chat_ask(
             elif payload.mode and payload.mode.strip():
                 active_mode = payload.mode.strip().lower()
 
-            original_text = payload.text
-            final_user_text = original_text
-            if session_prefix:
-                final_user_text = f"{session_prefix}\n\nТекущий вопрос: {original_text}"
-            if has_effective_pet_profile:
-                lifestyle_block = format_lifestyle_block(
-                    effective_pet_profile.get("lifestyle")
-                    if isinstance(effective_pet_profile, dict)
-                    else None
+            with timer.stage("prompt"):
+                original_text = payload.text
+                final_user_text = build_final_user_text(
+                    original_text, session_prefix, effective_pet_profile
                 )
-                prefix = "ПРОФИЛЬ ПИТОМЦА (из анкеты пользователя):\n"
-                if lifestyle_block:
-                    prefix += lifestyle_block + "\n\n"
-                pet_profile_json = json.dumps(
-                    effective_pet_profile, ensure_ascii=False
+                policy_name = select_policy_name(has_image, user_plan)
+
+                selected_mode = (
+                    active_mode
+                    if active_mode in {"care", "vaccines", "emergency"}
+                    else DEFAULT_MODE
                 )
-                final_user_text = (
-                    prefix + pet_profile_json + "\n\n" + final_user_text
+                system_prompt = get_system_prompt(
+                    selected_mode,
+                    has_image,
+                    policy_name,
+                    session_context=session_context,
                 )
-            # Decide policy
-            if has_image:
-                policy_name = "pro_vision"
-            elif user_plan == "pro":
-                policy_name = "pro_default"
-            else:
-                policy_name = "free_default"
-
-            selected_mode = (
-                active_mode
-                if active_mode in {"care", "vaccines", "emergency"}
-                else DEFAULT_MODE
-            )
-            system_prompt = get_system_prompt(
-                selected_mode,
-                has_image,
-                policy_name,
-                session_context=session_context,
-            )
             logger.info(
                 "CHAT_PROMPT active_mode=%s selected_mode=%s",
                 active_mode,
                 selected_mode,
             )
 
-            # --- TEXT_PROVIDER + Free/Pro text models (manual switch) ---
-
-            text_provider = (os.getenv("TEXT_PROVIDER") or "openai").strip().lower()
-            if text_provider not in ("openai", "openrouter"):
-                text_provider = "openai"
-
-            # Text models (per provider, per plan)
-            openai_text_model_free = (
-                os.getenv("OPENAI_TEXT_MODEL_FREE")
-                or os.getenv("OPENAI_MODEL")
-                or "gpt-4.1-mini"
-            )
-            openai_text_model_pro = (
-                os.getenv("OPENAI_TEXT_MODEL_PRO")
-                or os.getenv("OPENAI_MODEL_PRO")
-                or os.getenv("OPENAI_MODEL")
-                or "gpt-4.1-mini"
-            )
-
-            openrouter_text_model_free = (
-                os.getenv("OPENROUTER_TEXT_MODEL_FREE")
-                or os.getenv("OPENROUTER_TEXT_MODEL")
-                or "openai/gpt-4o-mini"
-            )
-            openrouter_text_model_pro = (
-                os.getenv("OPENROUTER_TEXT_MODEL_PRO")
-                or os.getenv("OPENROUTER_TEXT_MODEL")
-                or "openai/gpt-4o-mini"
-            )
-
-            # Choose provider/model for TEXT policies from TEXT_PROVIDER
-            if text_provider == "openrouter":
-                free_text_model = openrouter_text_model_free
-                pro_text_model = openrouter_text_model_pro
-            else:
-                free_text_model = openai_text_model_free
-                pro_text_model = openai_text_model_pro
-
-            policies = {
-                # Text (Free/Pro) — provider is switchable via TEXT_PROVIDER
-                "free_default": {
-                    "provider": text_provider,
-                    "model": free_text_model,
-                    "temperature": 0.2,
-                    "max_tokens": 400,
-                    "timeout_sec": 60,
-                },
-                "pro_default": {
-                    "provider": text_provider,
-                    "model": pro_text_model,
-                    "temperature": 0.2,
-                    "max_tokens": 600,
-                    "timeout_sec": 60,
-                },
-
-                # Vision (Pro only) — ALWAYS OpenRouter
-                "pro_vision": {
-                    "provider": "openrouter",
-                    "model": os.getenv("OPENROUTER_VISION_MODEL", "openai/gpt-4o-mini"),
-                    "temperature": 0.2,
-                    "max_tokens": 600,
-                    "timeout_sec": 90,
-                },
-
-                # Research — оставляем как было (OpenAI)
-                "pro_research": {
-                    "provider": "openai",
-                    "model": os.getenv("OPENAI_MODEL_RESEARCH", "gpt-4o-mini"),
-                    "temperature": 0.1,
-                    "max_tokens": 800,
-                    "timeout_sec": 90,
-                },
-            }
-
-            llm_params = policies.get(policy_name, {}).copy()
-
-            # Hard rule: if has_image -> always openrouter vision model
-            if has_image:
-                llm_params["provider"] = "openrouter"
-                llm_params["model"] = os.getenv(
-                    "OPENROUTER_VISION_MODEL", "openai/gpt-4o-mini"
+            llm_policy = get_llm_policy(policy_name)
+            if llm_policy is None:
+                # Ключа нет ни в llm_policies, ни в ENV-политиках — настройка, а не сбой провайдера
+                logger.error("LLM_POLICY_MISSING policy=%s request_id=%s", policy_name, x_request_id)
+                dedup_mark_failed(cur, x_request_id, "llm_policy_missing")
+                return JSONResponse(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    content={"error": "llm_policy_missing"},
                 )
 
             logger.info(
                 "CHAT_HAS_IMAGE=%s policy=%s provider=%s",
                 "true" if has_image else "false",
                 policy_name,
-                llm_params.get("provider"),
+                llm_policy.provider,
             )
 
-            provider = llm_params.get("provider")
-            model = llm_params.get("model")
+            provider = llm_policy.provider
+            model = llm_policy.model
 
             # Provider config guards (manual switching)
             if provider == "openrouter":
@@ -569,30 +583,46 @@ def chat_ask(
                     )
 
             logger.info(
-                "CHAT_POLICY policy=%s provider=%s model=%s has_image=%s",
+                "CHAT_POLICY policy=%s provider=%s model=%s has_image=%s source=%s",
                 policy_name,
                 provider,
                 model,
                 has_image,
+                llm_policy.source,
             )
 
             try:
-                answer_text = ask_llm(
-                    final_user_text,
-                    system_prompt,
-                    attachments=attachments if has_image else None,
-                    provider=provider,
-                    model=model,
-                    temperature=llm_params.get("temperature"),
-                    max_tokens=llm_params.get("max_tokens"),
-                    timeout_sec=llm_params.get("timeout_sec"),
-                )
+                if cached_vision_answer is not None:
+                    logger.info(
+                        "VISION_DEDUP_HIT rid=%s user_id=%s", x_request_id, user_id
+                    )
+                    answer_text = cached_vision_answer
+                else:
+                    with timer.stage("llm"):
+                        answer_text = ask_llm(
+                            final_user_text,
+                            system_prompt,
+                            attachments=attachments if has_image else None,
+                            provider=provider,
+                            model=model,
+                            temperature=llm_policy.temperature,
+                            max_tokens=llm_policy.max_tokens,
+                            timeout_sec=llm_policy.timeout_sec,
+                            policy=policy_name,
+                        )
             except LlmTimeoutError:
                 dedup_mark_failed(cur, x_request_id, "llm_timeout")
                 return JSONResponse(
                     status_code=status.HTTP_504_GATEWAY_TIMEOUT,
                     content={"error": "llm_timeout"},
                 )
+            except CircuitOpenError as e:
+                logger.warning("LLM_CIRCUIT_OPEN request_id=%s provider=%s", x_request_id, provider)
+                dedup_mark_failed(cur, x_request_id, str(e))
+                return JSONResponse(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    content={"error": "llm_unavailable"},
+                )
             except Exception as e:
                 logger.exception(
                     "LLM failed request_id=%s user=%s err=%r",
@@ -617,8 +647,7 @@ def chat_ask(
                 answer_text += "\n\n" + TEXT_FREE_PHOTO_NOTE
 
             if has_image and answer_text:
-                answer_lower = answer_text.lower()
-                refused = any(marker in answer_lower for marker in VISION_REFUSAL_MARKERS)
+                refused = VISION_REFUSAL_MARKERS.search(answer_text)
                 if refused:
                     logger.info(
                         "VISION_GUARD refused=True rid=%s excerpt=%s",
@@ -654,8 +683,11 @@ def chat_ask(
                         },
                     )
 
+            if cached_vision_answer is None:
+                vision_answer_cache_put(vision_cache_key, answer_text)
+
             # increment monthly vision usage only after successful LLM response
-            if has_image and user_plan == "pro":
+            if has_image and user_plan == "pro" and cached_vision_answer is None:
                 cur.execute(
                     "update users "
                     "set vision_images_used = vision_images_used + 1 "
@@ -679,22 +711,18 @@ def chat_ask(
             if user_id:
                 try:
                     answer_to_save = answer_text
-                    if has_image and answer_text:
-                        answer_lower = answer_text.lower()
-                        if any(
-                            marker in answer_lower
-                            for marker in VISION_HISTORY_REFUSAL_MARKERS
-                        ):
-                            answer_to_save = "[vision_refusal_ignored]"
-                    upsert_session_turn(
-                        cur,
-                        user_id,
-                        payload.text,
-                        answer_to_save,
-                        user_plan=user_plan,
-                        session_context=session_context,
-                        active_session_id=active_session_id,
-                    )
+                    if has_image and VISION_HISTORY_REFUSAL_MARKERS.search(answer_text):
+                        answer_to_save = VISION_REFUSAL_IGNORED
+                    with timer.stage("session_save"):
+                        upsert_session_turn(
+                            cur,
+                            user_id,
+                            payload.text,
+                            answer_to_save,
+                            user_plan=user_plan,
+                            session_context=session_context,
+                            active_session_id=active_session_id,
+                        )
                 except Exception:
                     logger.exception(
                         "Failed to update session request_id=%s user_id=%s",
@@ -738,12 +766,25 @@ def chat_ask(
             }
 
             try:
-                dedup_mark_done(cur, x_request_id, result)
+                with timer.stage("dedup_done"):
+                    dedup_mark_done(cur, x_request_id, result)
             except Exception as exc:
                 error_text = str(exc).splitlines()[0][:200]
                 dedup_mark_failed(cur, x_request_id, error_text)
                 raise
 
+    # После commit: в журнал interactions пишет фоновый поток пачками, ответ его не ждёт
+    log_interaction(
+        user_id,
+        pet_profile_pet_id,
+        "vision" if has_image else "text",
+        selected_mode,
+        original_text,
+        answer_text,
+        (session_context or {}).get("summary"),
+        policy_name,
+        int(timer.total() * 1000),
+    )
     return result
 
 
@@ -760,6 +801,19 @@ def pets_active_save(
     response: Response,
     x_request_id: str | None = Header(default=None, alias="X-Request-Id"),
     payload: SaveActivePetPayload = Body(...),
+):
+    result = None
+    try:
+        result = _pets_active_save(response, x_request_id, payload)
+        return result
+    finally:
+        _count_rejection("pets_active_save", result)
+
+
+def _pets_active_save(
+    response: Response,
+    x_request_id: str | None,
+    payload: SaveActivePetPayload,
 ):
     validation_response = validate_x_request_id(x_request_id)
     if validation_response:
@@ -905,12 +959,97 @@ def history():
     )
 
 
+def _get_user_id_and_plan(telegram_user_id: int):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "select id, plan from users where telegram_user_id = %s",
+                (telegram_user_id,),
+            )
+            return cur.fetchone()
+
+
+def _register_media_asset(media_id: uuid.UUID, user_id, stored: dict):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return insert_media_asset(cur, media_id, user_id, stored)
+
+
 @router.post("/media/init", dependencies=[Depends(require_bot_token)])
-def media_init():
-    return JSONResponse(
-        status_code=status.HTTP_402_PAYMENT_REQUIRED,
-        content={"error": "pro_required"},
+async def media_init(request: Request, telegram_user_id: int):
+    """
+    Бинарная загрузка фото (тело запроса = байты картинки, Content-Type: image/*).
+    Возвращает media_id для attachments: [{"type": "image", "source": "media", "media_id": ...}].
+    """
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/"):
+        return JSONResponse(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            content={"ok": False, "error": "unsupported_media_type"},
+        )
+    content_length = request.headers.get("content-length") or ""
+    if content_length.isdigit() and int(content_length) > cfg.MEDIA_MAX_BYTES:
+        return JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content={"ok": False, "error": "media_too_large"},
+        )
+
+    user_row = await run_in_threadpool(_get_user_id_and_plan, telegram_user_id)
+    if not user_row or user_row[1] != "pro":
+        return JSONResponse(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            content={"ok": False, "error": "pro_required"},
+        )
+    user_id = user_row[0]
+
+    try:
+        tmp_path, upload_size = await stream_upload_to_disk(
+            request.stream(), cfg.MEDIA_MAX_BYTES
+        )
+    except ValueError as exc:
+        error_text = str(exc) or "invalid_media"
+        return JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            if error_text == "media_too_large"
+            else status.HTTP_400_BAD_REQUEST,
+            content={"ok": False, "error": error_text},
+        )
+
+    media_id = uuid.uuid4()
+    try:
+        stored = await store_uploaded_image(tmp_path, media_id)
+    except ValueError as exc:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"ok": False, "error": str(exc) or "invalid_image"},
+        )
+
+    try:
+        expires_at = await run_in_threadpool(
+            _register_media_asset, media_id, user_id, stored
+        )
+    except Exception:
+        logger.exception("Failed to register media user_id=%s", user_id)
+        discard_media_file(stored["storage_url"])
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"ok": False, "error": "media_register_failed"},
+        )
+
+    logger.info(
+        "MEDIA_UPLOAD ok=True user_id=%s media_id=%s upload_bytes=%s stored_bytes=%s",
+        telegram_user_id,
+        media_id,
+        upload_size,
+        stored["size_bytes"],
     )
+    return {
+        "ok": True,
+        "media_id": str(media_id),
+        "mime": stored["mime"],
+        "size_bytes": stored["size_bytes"],
+        "expires_at": expires_at.isoformat().replace("+00:00", "Z") if expires_at else None,
+    }
 
 
 @router.post("/data/delete", dependencies=[Depends(require_bot_token)])
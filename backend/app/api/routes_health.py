@@ -1,17 +1,35 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
 
 from app.core.config import APP_VERSION
-from app.core.db import db_ping
+from app.services.health_service import db_status, liveness, readiness
 
 router = APIRouter()
 
+# async: health-эндпоинты не занимают поток threadpool и не открывают соединение с БД —
+# статус БД берётся из фоновой проверки (run_db_probe)
+
+
 @router.get("/health")
-def health() -> dict:
-    ok, err = db_ping()
+async def health() -> dict:
+    db = db_status()
+    ok = db["status"] == "ok"
     return {
         "ok": True,
         "version": APP_VERSION,
         "db": "ok" if ok else "fail",
-        "db_error": err if not ok else None,
+        "db_error": None if ok else db["error"] or f"probe_{db['status']}",
     }
 
+
+@router.get("/health/live")
+async def health_live() -> dict:
+    return liveness()
+
+
+@router.get("/health/ready")
+async def health_ready():
+    ready, body = readiness()
+    if not ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+    return body
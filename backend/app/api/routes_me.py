@@ -1,16 +1,41 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, Header, Response, status
+from fastapi.responses import JSONResponse
 
 from app.core.auth import require_bot_token
+from app.core.db import get_connection
+from app.services.me_service import compute_etag, load_me
 
 router = APIRouter()
 
 
+def _not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+
 @router.get("/me", dependencies=[Depends(require_bot_token)])
-def me() -> dict:
-    return {
-        "plan": "free",
-        "limits": {"remaining_in_window": 0, "cooldown_sec": 0, "reset_at": None},
-        "pets": [],
-        "consents": {"terms_accepted": False, "data_policy_accepted": False},
-        "research": {"available": False, "used_this_period": 0, "limit": 0, "reset_at": None},
-    }
+def me(
+    telegram_user_id: int,
+    if_none_match: str | None = Header(default=None, alias="If-None-Match"),
+):
+    """
+    План, лимиты и активный питомец одним запросом. Только чтение: пользователя не создаёт,
+    квоты не тратит. Кэша в процессе нет (воркеров несколько, а сбросить его в соседнем нельзя):
+    ответ всегда из БД, бот хранит ETag и при неизменных данных получает 304 без тела.
+    """
+    now = datetime.now(timezone.utc)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            payload = load_me(cur, telegram_user_id, now)
+    etag = compute_etag(payload)
+
+    if if_none_match and etag in [item.strip() for item in if_none_match.split(",")]:
+        return _not_modified(etag)
+    return JSONResponse(
+        content=payload,
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
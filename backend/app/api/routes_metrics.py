@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends, Response
+
+from app.core.auth import require_metrics_token
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
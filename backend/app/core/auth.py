@@ -1,6 +1,6 @@
 from fastapi import Header, HTTPException, status
 
-from app.core.config import BOT_BACKEND_TOKEN
+from app.core.config import BOT_BACKEND_TOKEN, METRICS_TOKEN
 
 
 def require_bot_token(authorization: str | None = Header(default=None)) -> None:
@@ -14,3 +14,12 @@ def require_bot_token(authorization: str | None = Header(default=None)) -> None:
     token = authorization.removeprefix("Bearer ").strip()
     if token != BOT_BACKEND_TOKEN:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="unauthorized")
+
+
+def require_metrics_token(authorization: str | None = Header(default=None)) -> None:
+    # METRICS_TOKEN пуст — /v1/metrics открыт (закрывается сетью); иначе Prometheus шлёт bearer_token
+    if not METRICS_TOKEN:
+        return
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if token != METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="unauthorized")
@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger("uvicorn.error")
+
+# Маркер остановки: встаёт в очередь за последним элементом
+_STOP = object()
+
+
+class BatchQueue:
+    """
+    Ограниченная очередь с фоновым потоком: элементы уходят в handle_batch пачками
+    по batch_size штук или раз в interval_sec. submit не ждёт: очередь полна — False.
+    Поток стартует при первом submit; shutdown дописывает всё, что уже в очереди.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle_batch: Callable[[list], None],
+        max_queue: int,
+        batch_size: int,
+        interval_sec: float,
+    ):
+        self.name = name
+        self.batch_size = max(batch_size, 1)
+        self.interval_sec = interval_sec
+        self.stopping = threading.Event()
+        self._handle_batch = handle_batch
+        self._queue: queue.Queue = queue.Queue(maxsize=max(max_queue, 1))
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, item) -> bool:
+        if self.stopping.is_set():
+            return False
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.interval_sec
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                # Повторы и метрики — в handle_batch; здесь только не даём потоку умереть
+                try:
+                    self._handle_batch(batch)
+                except Exception as exc:
+                    logger.warning("BATCH_QUEUE_FAILED queue=%s items=%s err=%r", self.name, len(batch), exc)
+            if stop:
+                return
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self, timeout: float) -> bool:
+        """
+        False — не дописали за timeout (остаток в очереди теряется вместе с процессом).
+        """
+        self.stopping.set()
+        if self._thread is None:
+            return True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
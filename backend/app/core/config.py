@@ -1,9 +1,44 @@
 import os
+from pathlib import Path
 
 APP_VERSION = os.getenv("APP_VERSION", "0.1.0")
 BOT_BACKEND_TOKEN = os.getenv("BOT_BACKEND_TOKEN", "")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 SESSION_TTL_MIN = int(os.getenv("SESSION_TTL_MIN", "60"))
 PRO_SESSION_TTL_MIN = int(os.getenv("PRO_SESSION_TTL_MIN", "43200"))
 SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
 PRO_VISION_IMAGE_LIMIT_MONTH = int(os.getenv("PRO_VISION_IMAGE_LIMIT_MONTH", "30"))
+FREE_DAILY_LIMIT = int(os.getenv("FREE_DAILY_LIMIT", "3"))
+COOLDOWN_SEC = int(os.getenv("COOLDOWN_SEC", "25"))
+CHAT_TIMING_SAMPLE_RATE = float(os.getenv("CHAT_TIMING_SAMPLE_RATE", "1.0"))
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0").strip().lower() in ("1", "true", "yes")
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "").strip().lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "hvostosovet-backend")
+LLM_POLICIES_TTL_SEC = int(os.getenv("LLM_POLICIES_TTL_SEC", "30"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_OPEN_SEC = float(os.getenv("LLM_BREAKER_OPEN_SEC", "30"))
+HEALTH_DB_PROBE_INTERVAL_SEC = float(os.getenv("HEALTH_DB_PROBE_INTERVAL_SEC", "10"))
+HEALTH_DB_PROBE_STALE_SEC = float(os.getenv("HEALTH_DB_PROBE_STALE_SEC", "35"))
+HEALTH_READY_MAX_WAITING = int(os.getenv("HEALTH_READY_MAX_WAITING", "20"))
+INTERACTIONS_LOG = os.getenv("INTERACTIONS_LOG", "1").strip().lower() in ("1", "true", "yes")
+INTERACTIONS_LOG_MAX_QUEUE = int(os.getenv("INTERACTIONS_LOG_MAX_QUEUE", "5000"))
+INTERACTIONS_LOG_BATCH_SIZE = int(os.getenv("INTERACTIONS_LOG_BATCH_SIZE", "200"))
+INTERACTIONS_LOG_FLUSH_SEC = float(os.getenv("INTERACTIONS_LOG_FLUSH_SEC", "2"))
+INTERACTIONS_LOG_SHUTDOWN_SEC = float(os.getenv("INTERACTIONS_LOG_SHUTDOWN_SEC", "10"))
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1280"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+VISION_IMAGE_WORKERS = int(os.getenv("VISION_IMAGE_WORKERS", "2"))
+VISION_DEDUP_TTL_SEC = int(os.getenv("VISION_DEDUP_TTL_SEC", "600"))
+VISION_DEDUP_MAX_ENTRIES = int(os.getenv("VISION_DEDUP_MAX_ENTRIES", "1000"))
+VISION_MAX_ATTACHMENTS = int(os.getenv("VISION_MAX_ATTACHMENTS", "4"))
+VISION_MAX_TOTAL_BYTES = int(os.getenv("VISION_MAX_TOTAL_BYTES", "8000000"))
+MEDIA_STORAGE_DIR = os.getenv(
+    "MEDIA_STORAGE_DIR", str(Path(__file__).resolve().parents[2] / "_media")
+)
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", "8000000"))
+MEDIA_TTL_MIN = int(os.getenv("MEDIA_TTL_MIN", "1440"))
+MEDIA_SWEEP_INTERVAL_SEC = int(os.getenv("MEDIA_SWEEP_INTERVAL_SEC", "300"))
@@ -1,12 +1,90 @@
-import psycopg
+import threading
+import time
+from typing import TYPE_CHECKING
+
 from app.core.config import DATABASE_URL
+from app.core.metrics import (
+    DB_CONNECT_SECONDS,
+    DB_CONNECTION_ERRORS,
+    DB_CONNECTION_HOLD_SECONDS,
+    DB_CONNECTIONS_IN_USE,
+)
+
+if TYPE_CHECKING:
+    import psycopg
+
+# Счётчик открытых соединений этого процесса — для /v1/health/ready (гейдж в multiprocess-режиме не прочитать)
+_in_use = 0
+_in_use_lock = threading.Lock()
+
+
+def _track_in_use(delta: int) -> None:
+    global _in_use
+    with _in_use_lock:
+        _in_use += delta
+
+
+def connections_in_use() -> int:
+    return _in_use
+
+
+# psycopg (~40–120 мс импорта) грузится при первом соединении, а не при старте процесса
+_connection_class = None
+
+
+def _tracked_connection_class():
+    global _connection_class
+    if _connection_class is not None:
+        return _connection_class
 
+    import psycopg
 
-def get_connection() -> psycopg.Connection:
+    class _TrackedConnection(psycopg.Connection):
+        """
+        Обычное соединение psycopg, которое считает себя в метриках: сколько открыто сейчас
+        и сколько запрос его держит (with get_connection() as conn: ... — commit/rollback как раньше).
+        """
+
+        _opened_at: float = 0.0
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            try:
+                return super().__exit__(exc_type, exc_val, exc_tb)
+            finally:
+                if self._opened_at:
+                    DB_CONNECTION_HOLD_SECONDS.observe(time.perf_counter() - self._opened_at)
+                    DB_CONNECTIONS_IN_USE.dec()
+                    _track_in_use(-1)
+                    self._opened_at = 0.0
+
+    _connection_class = _TrackedConnection
+    return _connection_class
+
+
+def get_connection() -> "psycopg.Connection":
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL is not set")
-    # connect_timeout помогает не зависать
-    return psycopg.connect(DATABASE_URL, connect_timeout=5)
+    started = time.perf_counter()
+    try:
+        # connect_timeout помогает не зависать
+        conn = _tracked_connection_class().connect(DATABASE_URL, connect_timeout=5)
+    except Exception:
+        DB_CONNECTION_ERRORS.inc()
+        raise
+    conn._opened_at = time.perf_counter()
+    DB_CONNECT_SECONDS.observe(conn._opened_at - started)
+    DB_CONNECTIONS_IN_USE.inc()
+    _track_in_use(1)
+    return conn
+
+
+def json_param(value):
+    """
+    Параметр jsonb для запроса (psycopg Json) — без импорта psycopg в модулях сервисов.
+    """
+    from psycopg.types.json import Json
+
+    return Json(value)
 
 
 def db_ping() -> tuple[bool, str]:
@@ -0,0 +1,160 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Несколько воркеров uvicorn: PROMETHEUS_MULTIPROC_DIR задаётся до старта (и очищается),
+# каждый процесс пишет значения в mmap-файлы, /v1/metrics собирает их со всех процессов.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+
+# Границы бакетов в секундах (как у Prometheus client по умолчанию, плюс хвост для LLM)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"],
+    buckets=DEFAULT_BUCKETS,
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Duration of /v1/chat/ask stages",
+    ["stage"],
+    buckets=DEFAULT_BUCKETS,
+)
+CHAT_REJECTIONS = Counter(
+    "chat_rejections_total",
+    "402/429 answers by route and error code",
+    ["route", "status", "error"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "LLM HTTP call latency",
+    ["provider", "model", "policy", "outcome"],
+    buckets=DEFAULT_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM tokens from usage",
+    ["provider", "model", "policy", "kind"],
+)
+DEDUP_EVENTS = Counter(
+    "dedup_events_total",
+    "request_dedup outcomes for repeated X-Request-Id",
+    ["event"],
+)
+DB_CONNECT_SECONDS = Histogram(
+    "db_connect_duration_seconds",
+    "Time to open a Postgres connection",
+    buckets=DEFAULT_BUCKETS,
+)
+DB_CONNECTION_HOLD_SECONDS = Histogram(
+    "db_connection_hold_seconds",
+    "How long a request holds its Postgres connection",
+    buckets=DEFAULT_BUCKETS,
+)
+DB_CONNECTION_ERRORS = Counter(
+    "db_connection_errors_total",
+    "Failed Postgres connection attempts",
+)
+DB_CONNECTIONS_IN_USE = Gauge(
+    "db_connections_in_use",
+    "Postgres connections currently open by the app",
+    multiprocess_mode="livesum",
+)
+LLM_CIRCUIT_OPEN = Gauge(
+    "llm_circuit_open",
+    "1 while the LLM provider circuit breaker rejects calls",
+    ["provider"],
+    multiprocess_mode="max",
+)
+DB_PROBE_OK = Gauge(
+    "db_probe_ok",
+    "Result of the last background Postgres probe (1 = ok)",
+    multiprocess_mode="min",
+)
+
+INTERACTIONS_QUEUE_DEPTH = Gauge(
+    "interactions_queue_depth",
+    "Interaction records waiting for the background writer",
+    multiprocess_mode="livesum",
+)
+INTERACTIONS_WRITTEN = Counter(
+    "interactions_written_total",
+    "Interaction records written to Postgres",
+)
+INTERACTIONS_DROPPED = Counter(
+    "interactions_dropped_total",
+    "Interaction records lost by the background writer",
+    ["reason"],
+)
+INTERACTIONS_FLUSH_SECONDS = Histogram(
+    "interactions_flush_seconds",
+    "Time to write one batch of interaction records",
+    ["outcome"],
+    buckets=DEFAULT_BUCKETS,
+)
+INTERACTIONS_BATCH_ROWS = Histogram(
+    "interactions_batch_rows",
+    "Rows per interactions batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    # livesum-гейджи завершённого воркера не должны оставаться в сумме
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class HttpMetricsMiddleware:
+    """
+    ASGI middleware: счётчик и латентность по шаблону маршрута (/v1/me, а не /v1/me?telegram_user_id=…).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.labels(method, route_path, str(status_holder[0])).inc()
+            HTTP_REQUEST_SECONDS.labels(method, route_path).observe(time.perf_counter() - started)
@@ -0,0 +1,85 @@
+import random
+import time
+from contextlib import nullcontext
+
+from app.core import config as cfg
+from app.core.metrics import CHAT_STAGE_SECONDS
+from app.core.tracing import Span, reset_current_span, set_current_span
+
+# Общий «пустой» контекст: без сэмплинга stage() ничего не измеряет и не аллоцирует
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started", "span", "token")
+
+    def __init__(self, timer: "RequestTimer", name: str):
+        self.timer = timer
+        self.name = name
+        self.started = 0.0
+        self.span = None
+        self.token = None
+
+    def __enter__(self):
+        if self.timer.span is not None:
+            # Стадия — дочерний span; вложенные вызовы (HTTP к LLM) видят его как текущий
+            self.span = self.timer.span.child(self.name)
+            self.token = set_current_span(self.span)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        if self.span is not None:
+            reset_current_span(self.token)
+            self.span.end(error=exc_type is not None)
+        return False
+
+
+class RequestTimer:
+    """
+    Тайминги стадий одного запроса: with timer.stage("llm"): ...
+    Повторная стадия с тем же именем суммируется. Порядок стадий — порядок первого входа.
+    """
+
+    __slots__ = ("enabled", "stages", "started", "span")
+
+    def __init__(self, enabled: bool = True, span: Span | None = None):
+        self.enabled = enabled
+        self.stages: dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.span = span
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def log_fields(self, total: float) -> str:
+        parts = [f"{name}_ms={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total_ms={total * 1000:.1f}")
+        return " ".join(parts)
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def observe(self, histogram=CHAT_STAGE_SECONDS, total: float | None = None) -> None:
+        for name, seconds in self.stages.items():
+            histogram.labels(name).observe(seconds)
+        if total is not None:
+            histogram.labels("total").observe(total)
+
+
+def start_request_timer(span: Span | None = None) -> RequestTimer:
+    # Запрос в трейсе меряется всегда, иначе у span не будет стадий
+    rate = cfg.CHAT_TIMING_SAMPLE_RATE
+    enabled = span is not None or rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+    return RequestTimer(enabled=enabled, span=span)
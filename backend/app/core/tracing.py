@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from urllib import request
+
+from app.core import config as cfg
+from app.core.batch_queue import BatchQueue
+
+logger = logging.getLogger("uvicorn.error")
+
+# W3C Trace Context: traceparent = 00-<trace_id 32 hex>-<parent span_id 16 hex>-<flags>
+TRACEPARENT_VERSION = "00"
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str, bool] | None:
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] != TRACEPARENT_VERSION:
+        return None
+    trace_id, parent_id, flags = parts[1], parts[2], parts[3]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: str | None = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: dict | None = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error = False
+
+    def child(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind, attributes)
+
+    def traceparent(self) -> str:
+        return f"{TRACEPARENT_VERSION}-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error: bool = False, **attributes) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        self.error = self.error or error
+        self.attributes.update(attributes)
+        _exporter.submit(self)
+
+
+def start_server_span(name: str, traceparent: str | None, **attributes) -> Span | None:
+    """
+    Корневой span запроса. Входящий traceparent с флагом sampled продолжает трейс бота;
+    без заголовка трейс начинается здесь с вероятностью TRACE_SAMPLE_RATE. None — не пишем.
+    """
+    if not cfg.TRACE_EXPORT:
+        return None
+    parsed = parse_traceparent(traceparent)
+    if parsed:
+        trace_id, parent_id, sampled = parsed
+        if not sampled:
+            return None
+    else:
+        if random.random() >= cfg.TRACE_SAMPLE_RATE:
+            return None
+        trace_id, parent_id = _new_id(16), None
+    return Span(name, trace_id, parent_id, SPAN_KIND_SERVER, attributes)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_current_span(span: Span | None):
+    return _current_span.set(span)
+
+
+def reset_current_span(token) -> None:
+    _current_span.reset(token)
+
+
+def start_child_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Span | None:
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return parent.child(name, kind, **attributes)
+
+
+def _attr_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def span_to_json(span: Span) -> dict:
+    return {
+        "service": cfg.TRACE_SERVICE_NAME,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "kind": span.kind,
+        "start_ns": span.start_ns,
+        "end_ns": span.end_ns,
+        "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+        "error": span.error,
+        "attributes": span.attributes,
+    }
+
+
+def spans_to_otlp(spans: list[Span]) -> dict:
+    """
+    OTLP/HTTP JSON (POST /v1/traces) — принимают OpenTelemetry Collector, Jaeger, Tempo.
+    """
+    otlp_spans = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _attr_value(value)}
+                for key, value in span.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 2 if span.error else 1},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        otlp_spans.append(item)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": cfg.TRACE_SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "hvostosovet"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+class SpanExporter:
+    """
+    Экспорт в фоне: span кладётся в ограниченную очередь (запрос не ждёт диск/сеть),
+    поток пишет пачками в JSONL-файл или отправляет в OTLP-коллектор. Переполнение — span теряется.
+    """
+
+    def __init__(self, kind: str, max_queue: int = 10000, batch_size: int = 256, interval_sec: float = 2.0):
+        self.kind = kind
+        self.dropped = 0
+        self._batches = BatchQueue("span-exporter", self._handle_batch, max_queue, batch_size, interval_sec)
+
+    def submit(self, span: Span) -> None:
+        if not self._batches.submit(span):
+            self.dropped += 1
+
+    def _handle_batch(self, batch: list[Span]) -> None:
+        try:
+            self._flush(batch)
+        except Exception as exc:
+            logger.warning("TRACE_EXPORT_FAILED kind=%s spans=%s err=%r", self.kind, len(batch), exc)
+
+    def _flush(self, batch: list[Span]) -> None:
+        if self.kind == "otlp":
+            data = json.dumps(spans_to_otlp(batch)).encode("utf-8")
+            req = request.Request(
+                cfg.TRACE_OTLP_ENDPOINT,
+                data=data,
+                method="POST",
+                headers={"Content-Type": "application/json"},
+            )
+            with request.urlopen(req, timeout=5) as resp:
+                resp.read()
+            return
+        with open(cfg.TRACE_FILE, "a", encoding="utf-8") as fh:
+            for span in batch:
+                fh.write(json.dumps(span_to_json(span), ensure_ascii=False, default=str) + "\n")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._batches.shutdown(timeout)
+        if self.dropped:
+            logger.warning("TRACE_EXPORT_DROPPED spans=%s", self.dropped)
+
+
+# Поток экспорта стартует при первом span
+_exporter = SpanExporter(cfg.TRACE_EXPORT)
+
+
+def shutdown_tracing() -> None:
+    _exporter.shutdown()
@@ -1,21 +1,52 @@
 import os
 from pathlib import Path
 
-from dotenv import load_dotenv
-
 if os.getenv("ENV", "dev") == "dev":
+    # python-dotenv нужен только в dev: в проде env приходит из env_file, импорт не тратим
+    from dotenv import load_dotenv
+
     load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env", override=False)
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
 
 from app.api.routes_health import router as health_router
 from app.api.routes_me import router as me_router
+from app.api.routes_metrics import router as metrics_router
 from app.api.routes_chat import router as chat_router
+from app.core.metrics import HttpMetricsMiddleware, mark_process_dead
+from app.core.tracing import shutdown_tracing
+from app.services.health_service import run_db_probe
+from app.services.interactions_log import shutdown_interactions_log
+from app.services.llm_policies import start_llm_policies_reload
+from app.services.media_service import run_media_sweeper
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # llm_policies и проверка БД — в фоне: воркер принимает запросы сразу, /v1/health/ready ждёт обоих
+    start_llm_policies_reload()
+    media_sweeper = asyncio.create_task(run_media_sweeper())
+    db_probe = asyncio.create_task(run_db_probe())
+    try:
+        yield
+    finally:
+        media_sweeper.cancel()
+        db_probe.cancel()
+        # До mark_process_dead: дописывая очередь, поток ещё обновляет метрики
+        await run_in_threadpool(shutdown_interactions_log)
+        mark_process_dead()
+        await run_in_threadpool(shutdown_tracing)
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="hvostosovet-backend")
+    app = FastAPI(title="hvostosovet-backend", lifespan=lifespan)
+    app.add_middleware(HttpMetricsMiddleware)
     app.include_router(health_router, prefix="/v1")
+    app.include_router(metrics_router, prefix="/v1")
     app.include_router(me_router, prefix="/v1")
     app.include_router(chat_router, prefix="/v1")
     return app
@@ -1,4 +1,5 @@
+from app.services.circuit_breaker import CircuitOpenError
 from app.services.llm import ask_llm
 from app.services.openai_client import LlmTimeoutError, call_chat_completions
 
-__all__ = ["LlmTimeoutError", "ask_llm", "call_chat_completions"]
+__all__ = ["CircuitOpenError", "LlmTimeoutError", "ask_llm", "call_chat_completions"]
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from app.core.config import LLM_BREAKER_FAILURES, LLM_BREAKER_OPEN_SEC
+from app.core.metrics import LLM_CIRCUIT_OPEN
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Предохранитель на провайдера LLM: после LLM_BREAKER_FAILURES ошибок подряд (5xx, 429, таймаут, сеть)
+    вызовы на LLM_BREAKER_OPEN_SEC сразу отклоняются, потом проходит один пробный запрос (half_open).
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_sec: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.last_error: str | None = None
+        self._lock = threading.Lock()
+
+    def _state(self, now: float) -> str:
+        if self.opened_at is None:
+            return STATE_CLOSED
+        if now - self.opened_at < self.open_sec:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.opened_at is not None:
+                self.opened_at = None
+                LLM_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def record_failure(self, error: str) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # Неудачный пробный запрос снова открывает предохранитель на open_sec
+                self.opened_at = time.monotonic()
+                LLM_CIRCUIT_OPEN.labels(self.name).set(1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            return {
+                "state": state,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "retry_in_sec": round(self.open_sec - (now - self.opened_at), 1)
+                if state == STATE_OPEN
+                else 0,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(
+                provider,
+                CircuitBreaker(provider, LLM_BREAKER_FAILURES, LLM_BREAKER_OPEN_SEC),
+            )
+    return breaker
+
+
+def breakers_snapshot() -> dict[str, dict]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+import time
+
+from anyio import to_thread
+
+from app.core.config import (
+    APP_VERSION,
+    HEALTH_DB_PROBE_INTERVAL_SEC,
+    HEALTH_DB_PROBE_STALE_SEC,
+    HEALTH_READY_MAX_WAITING,
+)
+from app.core.db import connections_in_use, db_ping
+from app.core.metrics import DB_PROBE_OK
+from app.services.circuit_breaker import STATE_CLOSED, breakers_snapshot
+from app.services.llm_policies import llm_policies_loaded
+
+logger = logging.getLogger("uvicorn.error")
+
+# Последний результат фоновой проверки БД; health-эндпоинты читают только его
+_db_state: dict = {"ok": None, "error": None, "checked_at": None, "latency_ms": None}
+_db_state_lock = threading.Lock()
+
+
+def probe_db_once() -> bool:
+    started = time.perf_counter()
+    ok, err = db_ping()
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    with _db_state_lock:
+        was_ok = _db_state["ok"]
+        _db_state.update(ok=ok, error=err or None, checked_at=time.monotonic(), latency_ms=latency_ms)
+    DB_PROBE_OK.set(1 if ok else 0)
+    if ok != was_ok:
+        logger.info("DB_PROBE ok=%s latency_ms=%s err=%s", ok, latency_ms, err or None)
+    return ok
+
+
+async def run_db_probe() -> None:
+    while True:
+        try:
+            # Отдельный executor: проверка не стоит в очереди за занятыми потоками запросов
+            await asyncio.to_thread(probe_db_once)
+        except Exception as exc:
+            logger.warning("DB_PROBE_FAILED err=%s", type(exc).__name__)
+        await asyncio.sleep(HEALTH_DB_PROBE_INTERVAL_SEC)
+
+
+def db_status() -> dict:
+    with _db_state_lock:
+        state = dict(_db_state)
+    checked_at = state.pop("checked_at")
+    if checked_at is None:
+        return {"status": "unknown", "error": None, "age_sec": None, "latency_ms": None}
+    age = time.monotonic() - checked_at
+    if age > HEALTH_DB_PROBE_STALE_SEC:
+        status = "stale"
+    else:
+        status = "ok" if state["ok"] else "fail"
+    return {
+        "status": status,
+        "error": state["error"],
+        "age_sec": round(age, 1),
+        "latency_ms": state["latency_ms"],
+    }
+
+
+def pool_status() -> dict:
+    """
+    Пула соединений нет: синхронные роуты держат поток threadpool и своё соединение.
+    Насыщение — все потоки заняты и запросы ждут в очереди. Вызывать из event loop.
+    """
+    stats = to_thread.current_default_thread_limiter().statistics()
+    return {
+        "threads_busy": stats.borrowed_tokens,
+        "threads_total": stats.total_tokens,
+        "waiting": stats.tasks_waiting,
+        "db_connections": connections_in_use(),
+        "saturated": stats.tasks_waiting > HEALTH_READY_MAX_WAITING,
+    }
+
+
+def liveness() -> dict:
+    return {"ok": True, "version": APP_VERSION}
+
+
+def readiness() -> tuple[bool, dict]:
+    """
+    Готов, если последняя проверка БД свежая и успешная, llm_policies прочитаны (при старте — в фоне)
+    и threadpool не переполнен.
+    Открытый предохранитель LLM только показывается (degraded): провайдер общий для всех
+    реплик, снимать их из балансировки бессмысленно — чат сам отвечает llm_unavailable.
+    """
+    db = db_status()
+    pool = pool_status()
+    llm = breakers_snapshot()
+    reasons = []
+    if db["status"] != "ok":
+        reasons.append(f"db_{db['status']}")
+    if pool["saturated"]:
+        reasons.append("pool_saturated")
+    if not llm_policies_loaded():
+        reasons.append("llm_policies_loading")
+    ready = not reasons
+    degraded = any(item["state"] != STATE_CLOSED for item in llm.values())
+    return ready, {
+        "ok": ready,
+        "version": APP_VERSION,
+        "status": ("degraded" if degraded else "ready") if ready else "not_ready",
+        "reasons": reasons,
+        "db": db,
+        "llm": llm,
+        "pool": pool,
+    }
@@ -0,0 +1,170 @@
+import logging
+import time
+from datetime import datetime, timezone
+
+from app.core import config as cfg
+from app.core.batch_queue import BatchQueue
+from app.core.db import get_connection
+from app.core.metrics import (
+    INTERACTIONS_BATCH_ROWS,
+    INTERACTIONS_DROPPED,
+    INTERACTIONS_FLUSH_SECONDS,
+    INTERACTIONS_QUEUE_DEPTH,
+    INTERACTIONS_WRITTEN,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+INTERACTION_COLUMNS = (
+    "user_id",
+    "pet_id",
+    "scenario",
+    "mode",
+    "question_text",
+    "answer_text",
+    "summary",
+    "policy_name",
+    "latency_ms",
+    "created_at",
+)
+_COPY_SQL = f"copy interactions ({', '.join(INTERACTION_COLUMNS)}) from stdin"
+_INSERT_SQL = (
+    f"insert into interactions ({', '.join(INTERACTION_COLUMNS)}) "
+    f"values ({', '.join(['%s'] * len(INTERACTION_COLUMNS))})"
+)
+
+# Попытки записать пачку при недоступной БД; потом пачка теряется (interactions_dropped_total{reason="flush_failed"})
+FLUSH_ATTEMPTS = 3
+
+
+class InteractionWriter:
+    """
+    Write-behind журнал ответов: chat_ask кладёт строку в ограниченную очередь и не ждёт БД,
+    поток пишет пачками (COPY) по INTERACTIONS_LOG_BATCH_SIZE строк или раз в INTERACTIONS_LOG_FLUSH_SEC.
+    Очередь полна — строка теряется, запрос не блокируется.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, interval_sec: float):
+        self.interval_sec = interval_sec
+        self._batches = BatchQueue("interactions-writer", self._handle_batch, max_queue, batch_size, interval_sec)
+
+    def submit(self, row: tuple) -> bool:
+        if self._batches.stopping.is_set():
+            INTERACTIONS_DROPPED.labels("shutdown").inc()
+            return False
+        if not self._batches.submit(row):
+            INTERACTIONS_DROPPED.labels("queue_full").inc()
+            return False
+        INTERACTIONS_QUEUE_DEPTH.inc()
+        return True
+
+    def _handle_batch(self, batch: list[tuple]) -> None:
+        try:
+            self._write(batch)
+        finally:
+            # Строки считаются в очереди, пока пачка не записана или не потеряна
+            INTERACTIONS_QUEUE_DEPTH.dec(len(batch))
+
+    def _write(self, batch: list[tuple]) -> None:
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            started = time.perf_counter()
+            try:
+                written = self._flush(batch)
+            except Exception as exc:
+                INTERACTIONS_FLUSH_SECONDS.labels("error").observe(time.perf_counter() - started)
+                logger.warning(
+                    "INTERACTIONS_FLUSH_FAILED rows=%s attempt=%s err=%s",
+                    len(batch),
+                    attempt,
+                    type(exc).__name__,
+                )
+                # На остановке не ждём: одна попытка на пачку, чтобы уложиться в INTERACTIONS_LOG_SHUTDOWN_SEC
+                if attempt == FLUSH_ATTEMPTS or self._batches.stopping.is_set():
+                    break
+                self._batches.stopping.wait(self.interval_sec * attempt)
+                continue
+            INTERACTIONS_FLUSH_SECONDS.labels("ok").observe(time.perf_counter() - started)
+            INTERACTIONS_BATCH_ROWS.observe(len(batch))
+            INTERACTIONS_WRITTEN.inc(written)
+            if written < len(batch):
+                INTERACTIONS_DROPPED.labels("bad_row").inc(len(batch) - written)
+            return
+        INTERACTIONS_DROPPED.labels("flush_failed").inc(len(batch))
+
+    def _flush(self, batch: list[tuple]) -> int:
+        import psycopg
+
+        with get_connection() as conn:
+            try:
+                with conn.transaction():
+                    with conn.cursor() as cur:
+                        with cur.copy(_COPY_SQL) as copy:
+                            for row in batch:
+                                copy.write_row(row)
+                return len(batch)
+            except (psycopg.DataError, psycopg.IntegrityError) as exc:
+                # Одна плохая строка (питомец удалён, \x00 в тексте) не должна терять всю пачку
+                logger.warning("INTERACTIONS_COPY_REJECTED rows=%s err=%s", len(batch), type(exc).__name__)
+            written = 0
+            with conn.cursor() as cur:
+                for row in batch:
+                    try:
+                        with conn.transaction():
+                            cur.execute(_INSERT_SQL, row)
+                        written += 1
+                    except (psycopg.DataError, psycopg.IntegrityError):
+                        continue
+            return written
+
+    def pending(self) -> int:
+        return self._batches.pending()
+
+    def shutdown(self, timeout: float) -> None:
+        """
+        Дописывает всё, что уже в очереди: маркер остановки встаёт за последней строкой.
+        """
+        if not self._batches.shutdown(timeout):
+            logger.warning("INTERACTIONS_SHUTDOWN_TIMEOUT pending=%s", self.pending())
+
+
+# Поток записи стартует при первой строке
+_writer = InteractionWriter(
+    cfg.INTERACTIONS_LOG_MAX_QUEUE,
+    cfg.INTERACTIONS_LOG_BATCH_SIZE,
+    cfg.INTERACTIONS_LOG_FLUSH_SEC,
+)
+
+
+def log_interaction(
+    user_id,
+    pet_id,
+    scenario: str,
+    mode: str,
+    question_text: str,
+    answer_text: str,
+    summary: str | None,
+    policy_name: str | None,
+    latency_ms: int | None,
+) -> bool:
+    """
+    Ставит ответ в очередь на запись в interactions. Вызывать после commit запроса.
+    """
+    if not cfg.INTERACTIONS_LOG:
+        return False
+    row = (
+        user_id,
+        pet_id,
+        scenario,
+        mode,
+        question_text or "",
+        answer_text or "",
+        summary or "",
+        policy_name,
+        latency_ms,
+        datetime.now(timezone.utc),
+    )
+    return _writer.submit(row)
+
+
+def shutdown_interactions_log() -> None:
+    _writer.shutdown(cfg.INTERACTIONS_LOG_SHUTDOWN_SEC)
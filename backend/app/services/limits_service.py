@@ -3,6 +3,16 @@ from datetime import timedelta
 from fastapi import status
 from fastapi.responses import JSONResponse
 
+from app.core.config import FREE_DAILY_LIMIT
+
+
+def daily_limit_for_plan(user_plan: str | None) -> int | None:
+    """
+    Дневной лимит вопросов плана (None — без лимита). Одно правило для chat_ask и /v1/me.
+    Сейчас FREE_DAILY_LIMIT действует для всех планов, включая Pro.
+    """
+    return FREE_DAILY_LIMIT
+
 
 def apply_rate_limits_or_return(
     cur,
@@ -66,7 +76,7 @@ def apply_rate_limits_or_return(
             },
         )
 
-    if count >= daily_limit:
+    if daily_limit is not None and count >= daily_limit:
         cooldown_until = now + timedelta(seconds=cooldown_sec_default)
         plan_value = user_plan or "free"
         reset_at_out = (window_end_at or now).isoformat()
@@ -16,6 +16,7 @@ def build_messages(
         content = [{"type": "text", "text": prompt_text}]
         for attachment in attachments:
             mime = attachment.get("mime") or "image/jpeg"
+            # source=media: байты уже прочитаны в chat_ask (load_media_attachments)
             data = attachment.get("data") or ""
             data_url = f"data:{mime};base64,{data}"
             content.append({"type": "image_url", "image_url": {"url": data_url}})
@@ -34,6 +35,7 @@ def ask_llm(
     temperature: float | None = None,
     max_tokens: int | None = None,
     timeout_sec: int | None = None,
+    policy: str | None = None,
 ) -> str:
     provider = provider or "openai"
     if provider == "openrouter":
@@ -49,7 +51,11 @@ def ask_llm(
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("missing_openai_api_key")
-        base_url = "https://api.openai.com/v1/chat/completions"
+        # OPENAI_BASE_URL — любой OpenAI-совместимый endpoint (например, scripts/mock_llm_server.py)
+        base_url = os.getenv(
+            "OPENAI_BASE_URL",
+            "https://api.openai.com/v1/chat/completions",
+        )
         model = model or os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
 
     timeout_sec = timeout_sec or int(os.getenv("LLM_TIMEOUT_S", "60"))
@@ -90,4 +96,5 @@ def ask_llm(
         api_key=api_key,
         base_url=base_url,
         provider=provider,
+        policy=policy,
     )
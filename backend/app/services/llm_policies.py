@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from app.core.config import LLM_POLICIES_TTL_SEC
+from app.core.db import get_connection
+
+logger = logging.getLogger("uvicorn.error")
+
+KNOWN_PROVIDERS = ("openai", "openrouter")
+
+
+@dataclass(frozen=True)
+class LlmPolicy:
+    key: str
+    provider: str
+    model: str
+    temperature: float
+    max_tokens: int
+    timeout_sec: int
+    source: str = "env"
+
+
+def _build_env_policies() -> dict[str, LlmPolicy]:
+    """
+    Fallback-политики из ENV (как раньше в chat_ask).
+    Считаются один раз на процесс, а не на каждый запрос.
+    """
+    text_provider = (os.getenv("TEXT_PROVIDER") or "openai").strip().lower()
+    if text_provider not in KNOWN_PROVIDERS:
+        text_provider = "openai"
+
+    if text_provider == "openrouter":
+        free_text_model = (
+            os.getenv("OPENROUTER_TEXT_MODEL_FREE")
+            or os.getenv("OPENROUTER_TEXT_MODEL")
+            or "openai/gpt-4o-mini"
+        )
+        pro_text_model = (
+            os.getenv("OPENROUTER_TEXT_MODEL_PRO")
+            or os.getenv("OPENROUTER_TEXT_MODEL")
+            or "openai/gpt-4o-mini"
+        )
+    else:
+        free_text_model = (
+            os.getenv("OPENAI_TEXT_MODEL_FREE")
+            or os.getenv("OPENAI_MODEL")
+            or "gpt-4.1-mini"
+        )
+        pro_text_model = (
+            os.getenv("OPENAI_TEXT_MODEL_PRO")
+            or os.getenv("OPENAI_MODEL_PRO")
+            or os.getenv("OPENAI_MODEL")
+            or "gpt-4.1-mini"
+        )
+
+    return {
+        # Text (Free/Pro) — provider is switchable via TEXT_PROVIDER
+        "free_default": LlmPolicy(
+            key="free_default",
+            provider=text_provider,
+            model=free_text_model,
+            temperature=0.2,
+            max_tokens=400,
+            timeout_sec=60,
+        ),
+        "pro_default": LlmPolicy(
+            key="pro_default",
+            provider=text_provider,
+            model=pro_text_model,
+            temperature=0.2,
+            max_tokens=600,
+            timeout_sec=60,
+        ),
+        # Vision (Pro only) — ALWAYS OpenRouter
+        "pro_vision": LlmPolicy(
+            key="pro_vision",
+            provider="openrouter",
+            model=os.getenv("OPENROUTER_VISION_MODEL", "openai/gpt-4o-mini"),
+            temperature=0.2,
+            max_tokens=600,
+            timeout_sec=90,
+        ),
+        # Research — оставляем как было (OpenAI)
+        "pro_research": LlmPolicy(
+            key="pro_research",
+            provider="openai",
+            model=os.getenv("OPENAI_MODEL_RESEARCH", "gpt-4o-mini"),
+            temperature=0.1,
+            max_tokens=800,
+            timeout_sec=90,
+        ),
+    }
+
+
+_env_policies: Mapping[str, LlmPolicy] | None = None
+_policies: Mapping[str, LlmPolicy] = MappingProxyType({})
+_loaded_at: float | None = None
+_reload_lock = threading.Lock()
+
+
+def _get_env_policies() -> Mapping[str, LlmPolicy]:
+    global _env_policies
+    if _env_policies is None:
+        _env_policies = MappingProxyType(_build_env_policies())
+    return _env_policies
+
+
+def _policy_from_row(row, fallback: LlmPolicy | None) -> LlmPolicy | None:
+    key, provider, model, temperature, max_tokens, timeout_sec = row
+    provider = (provider or "").strip().lower()
+    model = (model or "").strip()
+    if provider not in KNOWN_PROVIDERS or not model:
+        logger.warning(
+            "LLM_POLICY_SKIP key=%s reason=invalid_provider_or_model provider=%s",
+            key,
+            provider,
+        )
+        return None
+    # Vision идёт только через OpenRouter (multimodal data URL)
+    if key == "pro_vision" and provider != "openrouter":
+        logger.warning("LLM_POLICY_SKIP key=%s reason=vision_requires_openrouter", key)
+        return None
+    if not max_tokens or int(max_tokens) <= 0:
+        logger.warning("LLM_POLICY_SKIP key=%s reason=invalid_max_tokens", key)
+        return None
+    if timeout_sec is None or int(timeout_sec) <= 0:
+        timeout_sec = fallback.timeout_sec if fallback else 60
+    return LlmPolicy(
+        key=key,
+        provider=provider,
+        model=model,
+        temperature=float(temperature),
+        max_tokens=int(max_tokens),
+        timeout_sec=int(timeout_sec),
+        source="db",
+    )
+
+
+def load_llm_policies() -> Mapping[str, LlmPolicy]:
+    """
+    Читает llm_policies (enabled) и накрывает ими ENV-политики.
+    При ошибке БД оставляет текущий кэш (или ENV, если кэша ещё нет).
+    """
+    global _policies, _loaded_at
+    env_policies = _get_env_policies()
+    merged = dict(env_policies)
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "select key, provider, model, temperature, max_tokens, timeout_sec "
+                    "from llm_policies where enabled"
+                )
+                rows = cur.fetchall()
+    except Exception as exc:
+        logger.warning("LLM_POLICIES_LOAD_FAILED err=%s", type(exc).__name__)
+        if not _policies:
+            _policies = env_policies
+        _loaded_at = time.monotonic()
+        return _policies
+
+    db_keys = []
+    for row in rows:
+        policy = _policy_from_row(row, env_policies.get(row[0]))
+        if policy is not None:
+            merged[policy.key] = policy
+            db_keys.append(policy.key)
+
+    _policies = MappingProxyType(merged)
+    _loaded_at = time.monotonic()
+    logger.info("LLM_POLICIES_LOADED db_keys=%s", sorted(db_keys))
+    return _policies
+
+
+def _reload_in_background() -> None:
+    try:
+        load_llm_policies()
+    finally:
+        _reload_lock.release()
+
+
+def start_llm_policies_reload() -> None:
+    """
+    Перечитывает llm_policies в фоновом потоке; если чтение уже идёт — ничего не делает.
+    При старте процесса вызывается из lifespan: старт не ждёт БД, ready — ждёт (llm_policies_loaded).
+    """
+    if _reload_lock.acquire(blocking=False):
+        threading.Thread(
+            target=_reload_in_background,
+            name="llm-policies-reload",
+            daemon=True,
+        ).start()
+
+
+def llm_policies_loaded() -> bool:
+    # Первая попытка чтения завершилась (успешно или с откатом на ENV)
+    return _loaded_at is not None
+
+
+def get_llm_policy(key: str) -> LlmPolicy | None:
+    """
+    Возвращает неизменяемую политику из кэша.
+    Кэш читается и обновляется в фоне — запрос не ждёт БД. До первого чтения действуют ENV-политики.
+    """
+    if _loaded_at is None or time.monotonic() - _loaded_at >= LLM_POLICIES_TTL_SEC:
+        start_llm_policies_reload()
+    policies = _policies or _get_env_policies()
+    return policies.get(key)
@@ -0,0 +1,119 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import PRO_VISION_IMAGE_LIMIT_MONTH
+from app.services.limits_service import daily_limit_for_plan
+
+# Один запрос вместо users → rate_limits → pets: строка есть всегда (left join от параметра),
+# даже если пользователя ещё нет.
+ME_QUERY = (
+    "select u.id, u.plan, u.vision_images_used, u.vision_images_reset_at, "
+    "u.research_used, u.research_limit, u.research_reset_at, "
+    "rl.window_end_at, rl.count, rl.cooldown_until, "
+    "p.id, p.type, p.name "
+    "from (select %s::bigint as telegram_user_id) q "
+    "left join users u on u.telegram_user_id = q.telegram_user_id "
+    "left join rate_limits rl on rl.user_id = u.id "
+    "left join lateral ("
+    "select id, type, name from pets "
+    "where user_id = u.id and archived_at is null "
+    "order by created_at desc limit 1"
+    ") p on true"
+)
+
+
+def _iso_z(value) -> str | None:
+    return value.isoformat().replace("+00:00", "Z") if value else None
+
+
+def build_me_payload(row, now: datetime) -> dict:
+    """
+    Собирает ответ /v1/me из строки ME_QUERY.
+    """
+    (
+        user_id,
+        user_plan,
+        vision_used,
+        vision_reset_at,
+        research_used,
+        research_limit,
+        research_reset_at,
+        window_end_at,
+        count,
+        cooldown_until,
+        pet_id,
+        pet_type,
+        pet_name,
+    ) = row
+    user_plan = user_plan or "free"
+    window_start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    # Окно, которое уже закончилось, считается сброшенным — как в apply_rate_limits_or_return
+    if window_end_at is None or window_end_at <= now:
+        window_end_at = window_start + timedelta(days=1)
+        count = 0
+        cooldown_until = None
+    cooldown_sec = 0
+    if cooldown_until and cooldown_until > now:
+        cooldown_sec = int((cooldown_until - now).total_seconds())
+    else:
+        cooldown_until = None
+
+    # Тот же лимит, что проверяет chat_ask; None — у плана нет дневного лимита
+    daily_limit = daily_limit_for_plan(user_plan)
+    limits = {
+        "plan": user_plan,
+        "remaining_today": None if daily_limit is None else max(daily_limit - int(count or 0), 0),
+        "reset_at": window_end_at.isoformat(),
+        "cooldown_sec": max(cooldown_sec, 0),
+    }
+    if vision_reset_at and vision_reset_at <= now:
+        # Месяц квоты закончился — сама запись обнулится при следующем фото-запросе
+        vision_used = 0
+        vision_reset_at = None
+    if user_plan == "pro":
+        vision_limit_month = int(PRO_VISION_IMAGE_LIMIT_MONTH)
+        vision_used = int(vision_used or 0)
+        limits.update(
+            {
+                "vision_images_limit_month": vision_limit_month,
+                "vision_images_used": vision_used,
+                "vision_images_remaining": max(0, vision_limit_month - vision_used),
+                "vision_images_reset_at": _iso_z(vision_reset_at),
+            }
+        )
+
+    research = {"available": False, "used_this_period": 0, "limit": 0, "reset_at": None}
+    if user_id is not None:
+        research = {
+            "available": int(research_limit or 0) > int(research_used or 0),
+            "used_this_period": int(research_used or 0),
+            "limit": int(research_limit or 0),
+            "reset_at": _iso_z(research_reset_at),
+        }
+
+    pets = []
+    if pet_id is not None:
+        pets.append({"id": str(pet_id), "type": pet_type, "name": pet_name, "active": True})
+
+    payload = {
+        "ok": True,
+        "plan": user_plan,
+        "limits": limits,
+        "pets": pets,
+        "has_active_pet": bool(pets),
+        "consents": {"terms_accepted": False, "data_policy_accepted": False},
+        "research": research,
+    }
+    return payload
+
+
+def load_me(cur, telegram_user_id: int, now: datetime) -> dict:
+    cur.execute(ME_QUERY, (telegram_user_id,))
+    return build_me_payload(cur.fetchone(), now)
+
+
+def compute_etag(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return f'"{hashlib.sha1(raw).hexdigest()[:20]}"'
+
@@ -0,0 +1,393 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import (
+    MEDIA_STORAGE_DIR,
+    MEDIA_SWEEP_INTERVAL_SEC,
+    MEDIA_TTL_MIN,
+    VISION_DEDUP_MAX_ENTRIES,
+    VISION_DEDUP_TTL_SEC,
+    VISION_IMAGE_WORKERS,
+    VISION_JPEG_QUALITY,
+    VISION_MAX_SIDE,
+)
+from app.core.db import get_connection
+
+logger = logging.getLogger("uvicorn.error")
+
+MAX_IMAGE_PIXELS = 20_000_000
+ALLOWED_IMAGE_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "BMP"}
+
+# Не больше VISION_IMAGE_WORKERS тяжёлых decode/encode Pillow одновременно, независимо от числа запросов.
+# Работа идёт в потоке вызывающего (он и так вне event loop), без второго пула и ожидания его future
+_image_slots = threading.BoundedSemaphore(max(VISION_IMAGE_WORKERS, 1))
+
+
+def decode_inline_image(data: str, max_bytes: int) -> bytes:
+    payload = data
+    if payload.startswith("data:") and "," in payload:
+        payload = payload.split(",", 1)[1]
+    try:
+        decoded = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("invalid_attachment_base64")
+    if len(decoded) > max_bytes:
+        raise ValueError("attachment_too_large")
+    return decoded
+
+
+def _pil_image():
+    # Pillow нужен только для фото: грузится при первом фото, а не при старте процесса
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image
+
+
+def normalize_image_bytes(raw: bytes) -> dict:
+    """
+    Проверяет, что байты — картинка, уменьшает до VISION_MAX_SIDE и
+    перекодирует в JPEG. Маленький JPEG отдаётся как есть (без перекодирования).
+    sha256 считается по исходным байтам: повторная отправка того же фото даёт тот же хэш.
+    """
+    sha256 = hashlib.sha256(raw).hexdigest()
+    Image = _pil_image()
+    try:
+        with Image.open(io.BytesIO(raw)) as image:
+            image_format = image.format
+            if image_format not in ALLOWED_IMAGE_FORMATS:
+                raise ValueError("unsupported_image_format")
+            width, height = image.size
+            if image_format == "JPEG" and max(width, height) <= VISION_MAX_SIDE:
+                image.load()
+                return {
+                    "mime": "image/jpeg",
+                    "bytes": raw,
+                    "sha256": sha256,
+                    "width": width,
+                    "height": height,
+                }
+            if image_format == "JPEG":
+                image.draft("RGB", (VISION_MAX_SIDE, VISION_MAX_SIDE))
+            image = image.convert("RGB")
+            image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE))
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=VISION_JPEG_QUALITY)
+            width, height = image.size
+    except (Image.DecompressionBombError, Image.UnidentifiedImageError, OSError):
+        raise ValueError("invalid_image")
+    return {
+        "mime": "image/jpeg",
+        "bytes": out.getvalue(),
+        "sha256": sha256,
+        "width": width,
+        "height": height,
+    }
+
+
+def _normalize_limited(raw: bytes) -> dict:
+    with _image_slots:
+        return normalize_image_bytes(raw)
+
+
+def decode_inline_attachment(data: str, max_bytes: int) -> dict:
+    """
+    Дешёвая часть inline-фото: base64 и лимит размера, sha256 исходных байт (ключ vision dedup).
+    Pillow не вызывается — это делает normalize_inline_attachments после проверок плана и квоты.
+    """
+    decoded = decode_inline_image(data, max_bytes)
+    return {
+        "type": "image",
+        "source": "inline",
+        "raw": decoded,
+        "sha256": hashlib.sha256(decoded).hexdigest(),
+    }
+
+
+def normalize_inline_attachments(attachments: list[dict]) -> list[dict]:
+    normalized = []
+    for item in attachments:
+        if item.get("source") != "inline" or "raw" not in item:
+            normalized.append(item)
+            continue
+        image = _normalize_limited(item["raw"])
+        normalized.append(
+            {
+                "type": "image",
+                "source": "inline",
+                "mime": image["mime"],
+                "data": base64.b64encode(image["bytes"]).decode("ascii"),
+                "sha256": image["sha256"],
+                "size_bytes": len(image["bytes"]),
+            }
+        )
+    return normalized
+
+
+# --- Загрузка фото вне JSON: /v1/media/init → media_assets → attachments[{source: "media"}] ---
+
+
+def _media_dir() -> Path:
+    path = Path(MEDIA_STORAGE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# Чанки тела копятся в памяти до такого размера и пишутся на диск одним вызовом в потоке
+UPLOAD_WRITE_BUFFER_BYTES = 256 * 1024
+
+
+async def stream_upload_to_disk(stream, max_bytes: int) -> tuple[Path, int]:
+    """
+    Пишет тело запроса на диск по чанкам, не держа весь файл в памяти.
+    Файловые операции — в threadpool: event loop не ждёт диск. Превышение max_bytes
+    обрывает загрузку (ValueError("media_too_large")).
+    """
+    media_dir = await run_in_threadpool(_media_dir)
+    tmp_path = media_dir / f"upload-{uuid.uuid4().hex}.part"
+    size = 0
+    buffer = bytearray()
+    fh = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError("media_too_large")
+                buffer += chunk
+                if len(buffer) >= UPLOAD_WRITE_BUFFER_BYTES:
+                    await run_in_threadpool(fh.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(fh.write, bytes(buffer))
+        finally:
+            await run_in_threadpool(fh.close)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if size == 0:
+        tmp_path.unlink(missing_ok=True)
+        raise ValueError("empty_media")
+    return tmp_path, size
+
+
+def _store_normalized_image(tmp_path: Path, media_id: uuid.UUID) -> dict:
+    try:
+        normalized = _normalize_limited(tmp_path.read_bytes())
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    final_path = _media_dir() / f"{media_id}.jpg"
+    final_path.write_bytes(normalized["bytes"])
+    return {
+        "storage_url": final_path.resolve().as_uri(),
+        "mime": normalized["mime"],
+        "size_bytes": len(normalized["bytes"]),
+        "sha256": normalized["sha256"],
+    }
+
+
+async def store_uploaded_image(tmp_path: Path, media_id: uuid.UUID) -> dict:
+    return await run_in_threadpool(_store_normalized_image, tmp_path, media_id)
+
+
+def insert_media_asset(cur, media_id: uuid.UUID, user_id, stored: dict):
+    cur.execute(
+        "insert into media_assets "
+        "(id, user_id, pet_id, type, storage_url, mime, size_bytes, created_at, expires_at, sha256) "
+        "values (%s, %s, null, 'image', %s, %s, %s, now(), now() + make_interval(mins => %s), %s) "
+        "returning expires_at",
+        (
+            media_id,
+            user_id,
+            stored["storage_url"],
+            stored["mime"],
+            stored["size_bytes"],
+            MEDIA_TTL_MIN,
+            stored["sha256"],
+        ),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def resolve_media_attachments(cur, user_id, attachments: list[dict]) -> list[dict]:
+    """
+    Подставляет storage_url/mime/sha256 для attachments с source=media.
+    Байты не читаются: их читает load_media_attachments.
+    """
+    media_ids = [item["media_id"] for item in attachments if item.get("source") == "media"]
+    if not media_ids:
+        return attachments
+    cur.execute(
+        "select id, storage_url, mime, sha256, size_bytes from media_assets "
+        "where id = any(%s::uuid[]) and user_id = %s and deleted_at is null "
+        "and (expires_at is null or expires_at > now())",
+        (media_ids, user_id),
+    )
+    rows = {str(row[0]): row for row in cur.fetchall()}
+    resolved = []
+    for item in attachments:
+        if item.get("source") != "media":
+            resolved.append(item)
+            continue
+        row = rows.get(item["media_id"])
+        if not row:
+            raise ValueError("media_not_found")
+        resolved.append(
+            {
+                "type": "image",
+                "source": "media",
+                "media_id": item["media_id"],
+                "mime": row[2] or "image/jpeg",
+                "storage_url": row[1],
+                "sha256": row[3],
+                "size_bytes": int(row[4] or 0),
+            }
+        )
+    return resolved
+
+
+def check_attachments_budget(attachments: list[dict], max_total_bytes: int) -> None:
+    """
+    Общий бюджет байт на запрос: несколько фото уходят в LLM одним multimodal-сообщением.
+    """
+    total = sum(int(item.get("size_bytes") or 0) for item in attachments)
+    if total > max_total_bytes:
+        raise ValueError("attachments_too_large")
+
+
+def _media_path(storage_url: str) -> Path:
+    parsed = urlparse(storage_url or "")
+    if parsed.scheme != "file":
+        raise RuntimeError("unsupported_storage_url")
+    return Path(url2pathname(parsed.path))
+
+
+def read_media_bytes(storage_url: str) -> bytes:
+    return _media_path(storage_url).read_bytes()
+
+
+def load_media_attachments(attachments: list[dict]) -> list[dict]:
+    """
+    Читает с диска байты attachments с source=media (после resolve_media_attachments) — до стадии LLM.
+    Файла нет (sweeper уже удалил, диск почистили) — ValueError("media_expired").
+    """
+    loaded = []
+    for item in attachments:
+        if item.get("source") != "media" or item.get("data"):
+            loaded.append(item)
+            continue
+        try:
+            raw = read_media_bytes(item["storage_url"])
+        except FileNotFoundError:
+            logger.warning("MEDIA_FILE_MISSING media_id=%s", item.get("media_id"))
+            raise ValueError("media_expired") from None
+        loaded.append({**item, "data": base64.b64encode(raw).decode("ascii")})
+    return loaded
+
+
+def discard_media_file(storage_url: str) -> None:
+    try:
+        _media_path(storage_url).unlink(missing_ok=True)
+    except Exception:
+        logger.warning("MEDIA_UNLINK_FAILED url=%s", storage_url)
+
+
+def sweep_expired_media(batch_size: int = 200) -> int:
+    """
+    Ставит deleted_at просроченным media_assets и удаляет их файлы.
+    Файлы удаляются после commit: если update не прошёл, строки по-прежнему указывают на целые файлы.
+    Выборка идёт по media_assets_expires_at_idx; skip locked — чтобы
+    несколько воркеров не чистили одни и те же строки.
+    """
+    removed = 0
+    while True:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "update media_assets set deleted_at = now() "
+                    "where id in ("
+                    "  select id from media_assets "
+                    "  where expires_at <= now() and deleted_at is null "
+                    "  order by expires_at "
+                    "  limit %s "
+                    "  for update skip locked"
+                    ") "
+                    "returning storage_url",
+                    (batch_size,),
+                )
+                rows = cur.fetchall()
+        # Файл, который не удалось удалить, остаётся сиротой на диске — но ни одна строка на него не ссылается
+        for (storage_url,) in rows:
+            discard_media_file(storage_url)
+        removed += len(rows)
+        if len(rows) < batch_size:
+            return removed
+
+
+async def run_media_sweeper() -> None:
+    while True:
+        await asyncio.sleep(MEDIA_SWEEP_INTERVAL_SEC)
+        try:
+            removed = await run_in_threadpool(sweep_expired_media)
+            if removed:
+                logger.info("MEDIA_SWEEP removed=%s", removed)
+        except Exception as exc:
+            logger.warning("MEDIA_SWEEP_FAILED err=%s", type(exc).__name__)
+
+
+# --- Vision dedup: тот же пользователь + те же фото + тот же вопрос в коротком окне ---
+
+_vision_answers: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+_vision_answers_lock = threading.Lock()
+
+
+def build_vision_cache_key(
+    user_id, attachments: list[dict], text: str | None, mode: str | None
+) -> tuple | None:
+    hashes = tuple(item.get("sha256") for item in attachments)
+    if not hashes or not all(hashes):
+        return None
+    question = " ".join((text or "").lower().split())
+    return (str(user_id), hashes, question, (mode or "").strip().lower())
+
+
+def vision_answer_cache_get(key: tuple | None) -> str | None:
+    if key is None or VISION_DEDUP_TTL_SEC <= 0:
+        return None
+    now = time.monotonic()
+    with _vision_answers_lock:
+        entry = _vision_answers.get(key)
+        if entry is None:
+            return None
+        expires_at, answer_text = entry
+        if expires_at <= now:
+            _vision_answers.pop(key, None)
+            return None
+        return answer_text
+
+
+def vision_answer_cache_put(key: tuple | None, answer_text: str) -> None:
+    if key is None or VISION_DEDUP_TTL_SEC <= 0 or not answer_text:
+        return
+    expires_at = time.monotonic() + VISION_DEDUP_TTL_SEC
+    with _vision_answers_lock:
+        _vision_answers[key] = (expires_at, answer_text)
+        _vision_answers.move_to_end(key)
+        while len(_vision_answers) > VISION_DEDUP_MAX_ENTRIES:
+            _vision_answers.popitem(last=False)
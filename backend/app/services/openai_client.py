@@ -6,6 +6,10 @@ import time
 from urllib import request
 from urllib.error import HTTPError, URLError
 
+from app.core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS
+from app.core.tracing import SPAN_KIND_CLIENT, start_child_span
+from app.services.circuit_breaker import CircuitOpenError, get_breaker
+
 logger = logging.getLogger("uvicorn.error")
 
 
@@ -23,6 +27,7 @@ def call_chat_completions_messages(
     base_url: str,
     provider: str = "openai",
     extra_headers: dict | None = None,
+    policy: str | None = None,
 ) -> str:
     if not api_key:
         raise RuntimeError(f"missing_{provider}_api_key")
@@ -65,6 +70,10 @@ def call_chat_completions_messages(
     }
     if extra_headers:
         headers.update(extra_headers)
+    # Внутри трейса запроса: span HTTP-вызова и traceparent провайдеру (или локальному прокси/коллектору)
+    span = start_child_span("llm.http", SPAN_KIND_CLIENT, provider=provider, model=model, policy=policy)
+    if span is not None:
+        headers["traceparent"] = span.traceparent()
     req = request.Request(
         url,
         data=data,
@@ -72,11 +81,22 @@ def call_chat_completions_messages(
         headers=headers,
     )
 
+    # Провайдер лежит — не держим поток и соединение с БД до таймаута, отвечаем сразу.
+    # allow() — вплотную к try: пропущенный пробный запрос half_open всегда получает record_*
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        if span is not None:
+            span.end(error=True, outcome="circuit_open")
+        raise CircuitOpenError(f"{provider}_circuit_open")
+
     t0 = time.perf_counter()
+    outcome = "error"
     try:
         with request.urlopen(req, timeout=timeout_sec) as resp:
             body = resp.read().decode("utf-8")
+        outcome = "ok"
     except HTTPError as exc:
+        outcome = f"http_{exc.code}"
         try:
             err_body = exc.read().decode("utf-8", errors="replace")[:2000]
         except Exception:
@@ -84,12 +104,24 @@ def call_chat_completions_messages(
         raise RuntimeError(f"{provider}_http_{exc.code}: {err_body}") from exc
     except URLError as exc:
         if isinstance(exc.reason, socket.timeout):
+            outcome = "timeout"
             raise LlmTimeoutError(f"{provider}_timeout") from exc
         raise RuntimeError(f"{provider}_url_error") from exc
     except socket.timeout as exc:
+        outcome = "timeout"
         raise LlmTimeoutError(f"{provider}_timeout") from exc
     finally:
         dt = time.perf_counter() - t0
+        if outcome == "ok":
+            breaker.record_success()
+        elif outcome in ("timeout", "error", "http_429") or outcome.startswith("http_5"):
+            breaker.record_failure(outcome)
+        else:
+            # 4xx — ошибка запроса, а не провайдера; пробный запрос half_open завершён
+            breaker.record_success()
+        LLM_REQUEST_SECONDS.labels(provider, model, policy or "none", outcome).observe(dt)
+        if span is not None:
+            span.end(error=outcome != "ok", outcome=outcome, request_bytes=len(data))
         logger.info(
             "LLM_DONE provider=%s model=%s seconds=%.2f timeout=%s",
             provider,
@@ -99,6 +131,12 @@ def call_chat_completions_messages(
         )
     
     response_json = json.loads(body)
+    usage = response_json.get("usage")
+    if isinstance(usage, dict):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            tokens = usage.get(kind)
+            if isinstance(tokens, int) and tokens > 0:
+                LLM_TOKENS.labels(provider, model, policy or "none", kind.split("_")[0]).inc(tokens)
     choices = response_json.get("choices") or []
     if not choices:
         raise RuntimeError(f"{provider}_empty_choices")
@@ -161,6 +199,6 @@ def call_chat_completions(
         max_tokens=max_tokens,
         timeout_sec=timeout_sec,
         api_key=api_key,
-        base_url="https://api.openai.com/v1/chat/completions",
+        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions"),
         provider="openai",
     )
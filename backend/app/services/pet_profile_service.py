@@ -1,7 +1,7 @@
 import json
 from datetime import datetime
 
-from psycopg.types.json import Json
+from app.core.db import json_param
 
 
 def deep_merge_dict(base: dict | None, patch: dict | None) -> dict:
@@ -196,7 +196,7 @@ def upsert_active_pet(cur, user_id, pet_dict):
     birth_date = _parse_birth_date(pet_dict.get("birth_date"))
     age_text = pet_dict.get("age_text")
     breed = pet_dict.get("breed")
-    profile = Json(pet_dict)
+    profile = json_param(pet_dict)
 
     if active_pet:
         pet_id = active_pet[0]
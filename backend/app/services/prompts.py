@@ -1,3 +1,5 @@
+from app.services.text_markers import PHOTO_REQUEST_MARKERS
+
 CARE_SYSTEM_PROMPT_VISION = """Вы помогаете владельцу питомца разобраться в вопросах ухода, питания и повседневного содержания. В этом запросе есть изображение. Используйте его как источник информации о питомце или связанных вещах (часть тела/кожа/шерсть/рана, стул/рвота, корм/этикетка, предметы ухода, лекарства на фото и т.п.).
 
 ВЫ НЕ ЯВЛЯЕТЕСЬ МОДЕЛЬЮ GOOGLE, OPENAI ИЛИ ИСКУССТВЕННЫМ ИНТЕЛЛЕКТОМ.
@@ -464,16 +466,19 @@ def _already_asked_for_photo(session_context: dict) -> bool:
     turns = session_context.get("turns", [])
     if not isinstance(turns, list) or not turns:
         return False
-    markers = ("фото", "фотк", "снимок", "изображен", "прикреп")
     recent_turns = turns[-8:]
     for turn in recent_turns:
         if not isinstance(turn, dict):
             continue
+        photo_ask = turn.get("photo_ask")
+        if isinstance(photo_ask, bool):
+            if photo_ask:
+                return True
+            continue
         answer_text = turn.get("a", "")
         if not isinstance(answer_text, str) or not answer_text:
             continue
-        answer_lower = answer_text.lower()
-        if any(marker in answer_lower for marker in markers):
+        if PHOTO_REQUEST_MARKERS.search(answer_text):
             return True
     return False
 
@@ -3,7 +3,9 @@ import uuid
 
 from fastapi import Response, status
 from fastapi.responses import JSONResponse
-from psycopg.types.json import Json
+
+from app.core.db import json_param
+from app.core.metrics import DEDUP_EVENTS
 
 
 def validate_x_request_id(x_request_id: str | None) -> JSONResponse | None:
@@ -34,9 +36,11 @@ def dedup_begin_or_return(
         status_value, response_json = row
         if status_value == "done":
             response.headers["X-Dedup-Hit"] = "1"
+            DEDUP_EVENTS.labels("hit").inc()
             if isinstance(response_json, str):
                 return json.loads(response_json)
             return response_json or {}
+        DEDUP_EVENTS.labels("conflict").inc()
         return JSONResponse(
             status_code=status.HTTP_409_CONFLICT,
             content={"error": "request_in_progress"},
@@ -56,10 +60,12 @@ def dedup_begin_or_return(
         status_value, response_json = row
         if status_value == "done":
             response.headers["X-Dedup-Hit"] = "1"
+            DEDUP_EVENTS.labels("hit").inc()
             if isinstance(response_json, str):
                 return json.loads(response_json)
             return response_json or {}
         if status_value != "started":
+            DEDUP_EVENTS.labels("conflict").inc()
             return JSONResponse(
                 status_code=status.HTTP_409_CONFLICT,
                 content={"error": "request_in_progress"},
@@ -82,7 +88,7 @@ def dedup_mark_done(cur, x_request_id: str, result: dict) -> None:
         "update request_dedup "
         "set status = 'done', response_json = %s, finished_at = now() "
         "where request_id = %s",
-        (Json(result), x_request_id),
+        (json_param(result), x_request_id),
     )
 
 
@@ -3,17 +3,12 @@ import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from psycopg.types.json import Json
-
 from app.core.config import SESSION_MAX_TURNS, SESSION_TTL_MIN, PRO_SESSION_TTL_MIN
+from app.core.db import json_param
+from app.services.text_markers import classify_turn_answer, is_history_refusal
 
 logger = logging.getLogger("hvostosovet")
 DEFAULT_MODE = "emergency"
-VISION_REFUSAL_HISTORY_MARKERS = [
-    "не могу сказать, кто изображ",
-    "не вижу фото",
-    "не могу просматривать изображ",
-]
 
 
 def get_session_ttl_min(user_plan: str | None) -> int:
@@ -61,14 +56,24 @@ def normalize_session_context(session_context, now: datetime) -> dict:
         t = turn.get("t")
         if not isinstance(t, str) or not t:
             t = now_iso
-        normalized_turns.append(
-            {
-                "t": t,
-                "mode": mode,
-                "q": turn.get("q"),
-                "a": turn.get("a"),
-            }
-        )
+        normalized_turn = {
+            "t": t,
+            "mode": mode,
+            "q": turn.get("q"),
+            "a": turn.get("a"),
+        }
+        refusal = turn.get("refusal")
+        photo_ask = turn.get("photo_ask")
+        if isinstance(refusal, bool) and isinstance(photo_ask, bool):
+            normalized_turn["refusal"] = refusal
+            normalized_turn["photo_ask"] = photo_ask
+        else:
+            # старые turn'ы без флагов: классифицируем один раз, дальше флаги едут в БД
+            a = turn.get("a")
+            normalized_turn.update(
+                classify_turn_answer(a.strip() if isinstance(a, str) else None)
+            )
+        normalized_turns.append(normalized_turn)
 
     summary = session_context.get("summary")
     if not isinstance(summary, str):
@@ -123,12 +128,11 @@ def build_context_prefix(session_context, active_mode: str | None = None) -> str
             continue
         q = (turn.get("q") or "").strip()
         a = (turn.get("a") or "").strip()
-        if a == "[vision_refusal_ignored]":
+        refusal = turn.get("refusal")
+        if not isinstance(refusal, bool):
+            refusal = is_history_refusal(a)
+        if refusal:
             continue
-        if a:
-            a_lower = a.lower()
-            if any(marker in a_lower for marker in VISION_REFUSAL_HISTORY_MARKERS):
-                continue
         if not q and not a:
             continue
         lines = []
@@ -167,6 +171,7 @@ def upsert_session_turn(
     q = "" if question is None else str(question)
     a = "" if answer is None else str(answer)
     new_turn = {"t": _iso_now(now), "mode": None, "q": q, "a": a}
+    new_turn.update(classify_turn_answer(a.strip()))
 
     active_session = None
     if active_session_id is None:
@@ -198,12 +203,12 @@ def upsert_session_turn(
             "update sessions "
             "set session_context = %s, expires_at = %s, updated_at = %s "
             "where id = %s",
-            (Json(normalized_context), expires_at, now, active_session_id),
+            (json_param(normalized_context), expires_at, now, active_session_id),
         )
         return
 
     db.execute(
         "insert into sessions (id, user_id, session_context, expires_at, updated_at) "
         "values (%s, %s, %s, %s, %s)",
-        (uuid.uuid4(), user_id, Json(normalized_context), expires_at, now),
+        (uuid.uuid4(), user_id, json_param(normalized_context), expires_at, now),
     )
@@ -0,0 +1,105 @@
+import re
+from typing import Iterable
+
+VISION_REFUSAL_IGNORED = "[vision_refusal_ignored]"
+
+
+class MarkerSet:
+    """
+    Набор маркеров-подстрок, скомпилированный в одну regex-альтернативу.
+    Один проход по тексту вместо any(marker in text for marker in markers).
+    Текст приводится к lower() один раз: re.IGNORECASE на кириллице заметно медленнее.
+    """
+
+    __slots__ = ("markers", "_pattern")
+
+    def __init__(self, markers: Iterable[str]):
+        self.markers = tuple(markers)
+        alternatives = sorted(
+            {re.escape(marker.lower()) for marker in self.markers if marker},
+            key=len,
+            reverse=True,
+        )
+        self._pattern = re.compile("|".join(alternatives))
+
+    def search(self, text: str | None) -> bool:
+        if not text:
+            return False
+        return self._pattern.search(text.lower()) is not None
+
+
+# Ответ vision-модели, которая "не видит" картинку
+VISION_REFUSAL_MARKERS = MarkerSet(
+    [
+        "не могу видеть изображ",
+        "не вижу изображ",
+        "не могу просматривать изображ",
+        "я не вижу изображение",
+        "i can't see the image",
+        "i cannot see the image",
+        "cannot view images",
+        "can't view images",
+        "i can't access images",
+        "as a text-based model",
+        "i'm unable to view images",
+    ]
+)
+
+# Такие ответы не сохраняем/не подмешиваем в историю диалога
+VISION_HISTORY_REFUSAL_MARKERS = MarkerSet(
+    [
+        "не могу сказать, кто изображ",
+        "не вижу фото",
+        "не могу просматривать изображ",
+    ]
+)
+
+# Free: пользователь спрашивает про отправку фото
+PHOTO_INTENT_MARKERS = MarkerSet(
+    [
+        "можно фото",
+        "могу фото",
+        "прислать фото",
+        "отправить фото",
+        "скинуть фото",
+        "прикрепить фото",
+        "фото прикрепить",
+        "фото прислать",
+        "фото скинуть",
+        "фото отправить",
+        "фото можно",
+        "фото могу",
+        "фото принимаешь",
+        "принимаешь фото",
+        "оценить по фото",
+        "посмотри фото",
+        "что на фото",
+        "что на снимке",
+        "нужно фото",
+        "лучше фото",
+        "скинуть снимок",
+        "прислать снимок",
+    ]
+)
+
+# Ассистент уже просил фото в одном из прошлых ответов
+PHOTO_REQUEST_MARKERS = MarkerSet(["фото", "фотк", "снимок", "изображен", "прикреп"])
+
+
+def is_history_refusal(answer_text: str | None) -> bool:
+    if not answer_text:
+        return False
+    if answer_text == VISION_REFUSAL_IGNORED:
+        return True
+    return VISION_HISTORY_REFUSAL_MARKERS.search(answer_text)
+
+
+def classify_turn_answer(answer_text: str | None) -> dict:
+    """
+    Флаги turn'а считаются один раз при записи и хранятся в session_context,
+    чтобы не сканировать историю на каждом запросе.
+    """
+    return {
+        "refusal": is_history_refusal(answer_text),
+        "photo_ask": PHOTO_REQUEST_MARKERS.search(answer_text),
+    }
@@ -0,0 +1,13 @@
+-- 006_patch_llm_policies.sql
+-- llm_policies как источник правды для моделей (backend перечитывает таблицу по TTL)
+
+alter table llm_policies
+  add column if not exists timeout_sec int null;
+
+-- Пример: переключить free_default на другую модель без рестарта
+-- insert into llm_policies (key, provider, model, temperature, max_tokens, timeout_sec)
+-- values ('free_default', 'openrouter', 'google/gemini-2.0-flash-001', 0.2, 400, 60)
+-- on conflict (key) do update
+--   set provider = excluded.provider, model = excluded.model,
+--       temperature = excluded.temperature, max_tokens = excluded.max_tokens,
+--       timeout_sec = excluded.timeout_sec, enabled = true, updated_at = now();
@@ -0,0 +1,5 @@
+-- 007_patch_media_assets_sha256.sql
+-- Загрузка фото через /v1/media/init: хэш исходных байт (dedup vision-ответов)
+
+alter table media_assets
+  add column if not exists sha256 text null;
@@ -0,0 +1,6 @@
+-- 008_patch_interactions_policy_latency.sql
+-- Журнал ответов /v1/chat/ask (пишется пачками в фоне): политика LLM и время ответа
+
+alter table interactions
+  add column if not exists policy_name text null,
+  add column if not exists latency_ms int null;
@@ -0,0 +1,311 @@
+"""
+Micro-benchmarks чистых функций, которые выполняются на каждом /v1/chat/ask (pyperf).
+
+Фикстуры — худший реалистичный случай: сессия на SESSION_MAX_TURNS ходов с длинными ответами
+(со старыми turn'ами без флагов и с флагами), анкета Pro с длинными заметками о здоровье,
+фото ~3 МБ (JPEG 4032x3024, как с телефона) в base64.
+
+pyperf запускает каждый benchmark в отдельных процессах и сохраняет результаты в JSON —
+его и храним как baseline. Нужен pyperf: pip install pyperf
+
+Запуск из папки backend/:
+    python scripts/bench_hot_paths.py -o _bench/base.json                  # на main
+    python scripts/bench_hot_paths.py -o _bench/new.json --baseline _bench/base.json --tolerance 0.15
+    python -m pyperf compare_to _bench/base.json _bench/new.json --table
+    python scripts/bench_hot_paths.py --fast                               # быстрый прогон без сохранения
+"""
+import base64
+import io
+import json
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import pyperf
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.api.routes_chat import (  # noqa: E402
+    MAX_ATTACHMENT_BYTES,
+    format_lifestyle_block,
+    normalize_attachments,
+)
+from app.core.config import SESSION_MAX_TURNS  # noqa: E402
+from app.services.media_service import decode_inline_image, normalize_inline_attachments  # noqa: E402
+from app.services.pet_profile_service import (  # noqa: E402
+    build_pet_dict_from_row,
+    deep_merge_dict,
+    normalize_health_block,
+)
+from app.services.prompts import get_system_prompt  # noqa: E402
+from app.services.sessions import build_context_prefix, normalize_session_context  # noqa: E402
+
+NOW = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+TURNS = max(SESSION_MAX_TURNS, 1)
+
+QUESTION = "У кота третий день слезится левый глаз, он его трёт лапой и стал меньше есть. Что делать?"
+ANSWER = (
+    "Слезотечение и то, что кот трёт глаз лапой, чаще всего говорят о раздражении: это может быть "
+    "попавшая соринка, начинающийся конъюнктивит или, реже, травма роговицы. Снижение аппетита "
+    "при этом бывает из-за общего дискомфорта.\n\n"
+    "Пока можно аккуратно протирать глаз ватным диском, смоченным тёплой кипячёной водой, "
+    "от наружного уголка к внутреннему, отдельным диском для каждого глаза. Не используйте чай, "
+    "капли для людей и мази без назначения врача. Если кот продолжает тереть глаз, "
+    "на время можно надеть защитный воротник.\n\n"
+    "Понаблюдайте за выделениями: прозрачные — обычно менее тревожны, а гнойные, жёлтые или "
+    "зеленоватые указывают на инфекцию. Важно также, не прищуривает ли кот глаз постоянно "
+    "и нет ли помутнения.\n\n"
+    "Если за 1–2 дня не станет лучше, появятся гнойные выделения, помутнение, отёк века "
+    "или кот совсем перестанет есть — покажите его ветеринару в ближайшее время.\n\n"
+    "Подскажите, выделения прозрачные или мутные? Глаз открыт полностью или кот его прищуривает?"
+)
+HEALTH_NOTE = (
+    "Хронический гастрит с 2023 года, обострения весной и осенью; лечебный корм для ЖКТ, "
+    "без курицы и говядины — на них зуд и мягкий стул. В 2024 году была аллергия на "
+    "блошиные капли (покраснение на холке), сейчас ошейник. Периодически хромает на заднюю "
+    "левую после долгих прогулок, рентген без изменений. "
+) * 4
+
+
+def make_session_context(with_flags: bool) -> dict:
+    turns = []
+    for index in range(TURNS):
+        turn = {
+            "t": (NOW - timedelta(minutes=10 * (TURNS - index))).isoformat(),
+            "mode": "care",
+            "q": f"{QUESTION} (уточнение {index})",
+            "a": ANSWER,
+        }
+        if with_flags:
+            turn.update({"refusal": False, "photo_ask": False})
+        turns.append(turn)
+    return {
+        "v": 1,
+        "active": {"mode": "care", "updated_at": NOW.isoformat()},
+        "turns": turns,
+        "summary": "Кот 7 лет, хронический гастрит; обсуждаем слезотечение левого глаза.",
+    }
+
+
+def make_pet_profile() -> dict:
+    return {
+        "type": "cat",
+        "name": "Барсик",
+        "sex": "male",
+        "birth_date": "2019-04-12",
+        "age_text": "7 лет",
+        "breed": "британская короткошёрстная",
+        "neutered": True,
+        "weight_kg": 6.4,
+        "health": {
+            "notes_by_tag": {
+                "allergy": HEALTH_NOTE,
+                "gi": HEALTH_NOTE,
+                "skin_coat": HEALTH_NOTE,
+                "mobility": HEALTH_NOTE,
+                "other": HEALTH_NOTE,
+                "vet_clinic": "Клиника на Ленина, доктор Иванова",
+                "medications": "Пробиотик курсами, омега-3 ежедневно",
+            },
+            "tags": ["allergy", "gi", "skin_coat", "mobility"],
+        },
+        "lifestyle": {
+            "housing": "apartment",
+            "outdoor": "sometimes",
+            "diet_type": "mixed",
+            "activity_level": "medium",
+            "walks_per_day": 2,
+        },
+        "vaccinations": [
+            {"name": "Нобивак Tricat Trio", "date": f"20{year}-05-10"} for year in range(20, 26)
+        ],
+    }
+
+
+def make_pet_patch() -> dict:
+    return {
+        "name": "Барсик",
+        "weight_kg": 6.6,
+        "health": {"notes_by_tag": {"gi": HEALTH_NOTE + " Обновлено: новый корм с сентября."}},
+        "lifestyle": {"walks_per_day": 3, "activity_level": "high"},
+    }
+
+
+def make_pet_row() -> tuple:
+    profile = make_pet_profile()
+    return (
+        1,
+        1,
+        profile["type"],
+        profile["name"],
+        profile["sex"],
+        date(2019, 4, 12),
+        profile["age_text"],
+        profile["breed"],
+        profile,
+        NOW,
+        None,
+        NOW,
+    )
+
+
+@lru_cache(maxsize=None)
+def make_photo_base64() -> str:
+    from PIL import Image
+
+    width, height = 4032, 3024
+    rng = random.Random(7)
+    noise = Image.frombytes("L", (width // 4, height // 4), rng.randbytes(width * height // 16))
+    image = Image.merge(
+        "RGB",
+        (
+            Image.linear_gradient("L").resize((width, height)),
+            noise.resize((width, height), Image.BILINEAR),
+            Image.radial_gradient("L").resize((width, height)),
+        ),
+    )
+    # Самое крупное качество, которое ещё проходит лимит MAX_ATTACHMENT_BYTES
+    for quality in (90, 85, 80, 75, 70, 60, 50):
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=quality)
+        if out.tell() <= MAX_ATTACHMENT_BYTES * 0.95:
+            break
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def _case_normalize_session(with_flags: bool):
+    context = make_session_context(with_flags)
+    return lambda: normalize_session_context(context, NOW)
+
+
+def _case_build_prefix():
+    context = normalize_session_context(make_session_context(True), NOW)
+    return lambda: build_context_prefix(context, "care")
+
+
+def _case_deep_merge():
+    base, patch = make_pet_profile(), make_pet_patch()
+    return lambda: deep_merge_dict(base, patch)
+
+
+def _case_pet_from_row():
+    row = make_pet_row()
+    return lambda: build_pet_dict_from_row(row)
+
+
+def _case_pet_from_row_text():
+    # jsonb, пришедший строкой (старые строки/другие драйверы) — ветка json.loads
+    row = list(make_pet_row())
+    row[8] = json.dumps(row[8], ensure_ascii=False)
+    row = tuple(row)
+    return lambda: build_pet_dict_from_row(row)
+
+
+def _case_health_block():
+    health = make_pet_profile()["health"]
+    # normalize_health_block меняет pet_dict на месте — каждый вызов на свежем словаре
+    return lambda: normalize_health_block({"type": "cat", "health": health})
+
+
+def _case_lifestyle():
+    lifestyle = make_pet_profile()["lifestyle"]
+    return lambda: format_lifestyle_block(lifestyle)
+
+
+def _case_decode_photo():
+    data = make_photo_base64()
+    return lambda: decode_inline_image(data, MAX_ATTACHMENT_BYTES)
+
+
+def _case_normalize_attachments():
+    attachments = [{"type": "image", "source": "inline", "data": make_photo_base64()}]
+    # Вся работа над фото в chat_ask: base64 до проверок плана, Pillow — после
+    return lambda: normalize_inline_attachments(normalize_attachments(attachments))
+
+
+def _case_system_prompt(has_image: bool, policy: str, with_flags: bool):
+    context = normalize_session_context(make_session_context(with_flags), NOW)
+    if not with_flags:
+        # как контекст до нормализации: флагов нет, get_system_prompt ищет маркеры в ответах
+        for turn in context["turns"]:
+            turn.pop("photo_ask", None)
+    return lambda: get_system_prompt("care", has_image, policy, context)
+
+
+CASES = (
+    ("normalize_session_context[legacy_turns]", lambda: _case_normalize_session(False)),
+    ("normalize_session_context[flagged_turns]", lambda: _case_normalize_session(True)),
+    ("build_context_prefix[max_turns]", _case_build_prefix),
+    ("deep_merge_dict[pet_profile]", _case_deep_merge),
+    ("build_pet_dict_from_row[jsonb_dict]", _case_pet_from_row),
+    ("build_pet_dict_from_row[jsonb_text]", _case_pet_from_row_text),
+    ("normalize_health_block[large_notes]", _case_health_block),
+    ("format_lifestyle_block[full]", _case_lifestyle),
+    ("decode_inline_image[3mb]", _case_decode_photo),
+    ("normalize_attachments[3mb_jpeg]", _case_normalize_attachments),
+    ("get_system_prompt[pro_vision]", lambda: _case_system_prompt(True, "pro_default", True)),
+    ("get_system_prompt[free_text_flagged]", lambda: _case_system_prompt(False, "free_default", True)),
+    ("get_system_prompt[free_text_legacy]", lambda: _case_system_prompt(False, "free_default", False)),
+)
+
+
+def _time_func(factory):
+    # Фикстуры строятся только в процессе-воркере, который меряет этот case
+    get_fn = lru_cache(maxsize=None)(factory)
+
+    def time_func(loops: int) -> float:
+        fn = get_fn()
+        range_it = range(loops)
+        started = time.perf_counter()
+        for _ in range_it:
+            fn()
+        return time.perf_counter() - started
+
+    return time_func
+
+
+def check_baseline(benchmarks: list, baseline_path: str, tolerance: float) -> list[str]:
+    baseline = {bench.get_name(): bench for bench in pyperf.BenchmarkSuite.load(baseline_path)}
+    failures = []
+    for bench in benchmarks:
+        old = baseline.get(bench.get_name())
+        if old is None:
+            continue
+        ratio = bench.mean() / old.mean()
+        print(f"{bench.get_name():<44} x{ratio:.2f} vs baseline")
+        if ratio > 1 + tolerance:
+            failures.append(f"{bench.get_name()}: {old.mean() * 1e6:.1f} -> {bench.mean() * 1e6:.1f} us")
+    return failures
+
+
+def main() -> int:
+    runner = pyperf.Runner()
+    runner.argparser.add_argument("--baseline", default=None, help="JSON pyperf прошлого прогона")
+    runner.argparser.add_argument("--tolerance", type=float, default=0.15, help="допустимое замедление")
+    runner.metadata["description"] = "backend hot-path pure functions"
+    args = runner.parse_args()
+
+    benchmarks = []
+    for name, factory in CASES:
+        bench = runner.bench_time_func(name, _time_func(factory))
+        if bench is not None:
+            benchmarks.append(bench)
+
+    # В воркерах bench_time_func возвращает None; сравнение — только в главном процессе
+    if args.worker or not args.baseline or not benchmarks:
+        return 0
+    failures = check_baseline(benchmarks, args.baseline, args.tolerance)
+    if failures:
+        print(f"REGRESSION (> +{args.tolerance:.0%}):")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 3
+    print("NO REGRESSIONS")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
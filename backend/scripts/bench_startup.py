@@ -0,0 +1,226 @@
+"""
+Холодный старт backend: от запуска процесса uvicorn до первого 200 на /v1/health/ready
+(воркер прошёл lifespan, проверка БД успешна, llm_policies прочитаны) — или на /v1/health/live
+(воркер принимает запросы), если БД нет. Плюс профиль импорта app.main (python -X importtime)
+и проверка, что тяжёлые модули не грузятся при импорте.
+
+Для --until ready нужен DATABASE_URL (как у обычного запуска backend); без него меряется live.
+
+Падает (exit code 3), если:
+- при импорте загрузился модуль из LAZY_MODULES (Pillow, python-dotenv в проде);
+- сервер не дошёл до нужного health за --timeout-sec;
+- медиана выше --budget-ms;
+- медиана выше сохранённого --baseline больше чем на --tolerance.
+
+Запуск из папки backend/:
+    python scripts/bench_startup.py --runs 9 --save-baseline startup_baseline.json
+    python scripts/bench_startup.py --runs 9 --baseline startup_baseline.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib import request
+from urllib.error import HTTPError, URLError
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Грузятся при первом использовании (первое фото, dev-.env), а не при старте.
+# psycopg здесь нет: фоновая проверка БД и чтение llm_policies грузят его сразу после старта
+LAZY_MODULES = ("PIL", "dotenv")
+
+HEALTH_PATHS = {"live": "/v1/health/live", "ready": "/v1/health/ready"}
+POLL_INTERVAL_SEC = 0.005
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+import_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"import_ms": import_ms, "modules": sorted(sys.modules)}))
+"""
+
+
+def _env() -> dict:
+    return dict(os.environ, ENV="prod")
+
+
+def run_import_probe(importtime: bool = False) -> tuple[dict, str]:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", PROBE]
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _status(url: str) -> int:
+    try:
+        with request.urlopen(url, timeout=1) as resp:
+            return resp.status
+    except HTTPError as exc:
+        return exc.code
+    except (URLError, ConnectionError, socket.timeout):
+        return 0
+
+
+def run_server_once(until: str, timeout_sec: float) -> dict:
+    """
+    Запускает uvicorn как в проде (один воркер) и ждёт первого 200 на live, затем (для ready) на ready.
+    Время — от запуска процесса: интерпретатор, импорт, lifespan, фоновые проверки.
+    """
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    result = {}
+    try:
+        targets = ["live"] if until == "live" else ["live", "ready"]
+        for target in targets:
+            url = base + HEALTH_PATHS[target]
+            while _status(url) != 200:
+                if proc.poll() is not None:
+                    stderr = proc.stderr.read().decode("utf-8", errors="replace")[-2000:]
+                    raise RuntimeError(f"uvicorn exited with {proc.returncode}:\n{stderr}")
+                if time.perf_counter() - started > timeout_sec:
+                    raise TimeoutError(f"no 200 from {HEALTH_PATHS[target]} in {timeout_sec} s")
+                time.sleep(POLL_INTERVAL_SEC)
+            result[f"{target}_ms"] = (time.perf_counter() - started) * 1000
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    return result
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        rows.append((name, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def print_profile(rows: list[tuple[str, int, int]], top: int) -> None:
+    # Пакеты верхнего уровня (кроме стандартных модулей интерпретатора) и свои модули app.*
+    app_rows = [row for row in rows if row[0].startswith("app.") or row[0] == "app"]
+    third_party = [
+        row for row in rows
+        if "." not in row[0] and row[0] != "app" and row[0] not in sys.stdlib_module_names
+    ]
+    print(f"top {top} third-party packages (cumulative ms):")
+    for name, _, cumulative in sorted(third_party, key=lambda row: row[2], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+    print(f"top {top} app modules (self ms / cumulative ms):")
+    for name, self_us, cumulative in sorted(app_rows, key=lambda row: row[1], reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f} / {cumulative / 1000:8.1f}  {name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backend cold start benchmark")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument(
+        "--until",
+        choices=("ready", "live"),
+        default=None,
+        help="до какого health мерить (по умолчанию ready, без DATABASE_URL — live)",
+    )
+    parser.add_argument("--timeout-sec", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=12, help="строк в профиле импорта")
+    parser.add_argument("--budget-ms", type=float, default=None, help="абсолютный предел медианы")
+    parser.add_argument("--baseline", default=None, help="JSON из --save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="допустимый рост относительно baseline")
+    parser.add_argument("--save-baseline", default=None)
+    args = parser.parse_args()
+
+    until = args.until or ("ready" if os.getenv("DATABASE_URL") else "live")
+    if until == "ready" and not os.getenv("DATABASE_URL"):
+        print("--until ready needs DATABASE_URL")
+        return 2
+    metric = f"{until}_ms"
+
+    # Первый запуск прогревает .pyc и файловый кэш — в статистику не входит
+    first, _ = run_import_probe()
+    _, importtime_stderr = run_import_probe(importtime=True)
+    failures = []
+    try:
+        run_server_once(until, args.timeout_sec)
+        runs = [run_server_once(until, args.timeout_sec) for _ in range(args.runs)]
+    except (RuntimeError, TimeoutError) as exc:
+        print(f"STARTUP CHECK FAILED:\n  - {exc}")
+        return 3
+
+    timings = [run[metric] for run in runs]
+    median_ms = statistics.median(timings)
+    report = {
+        "until": until,
+        "runs": args.runs,
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "import_ms": round(first["import_ms"], 1),
+        "python": sys.version.split()[0],
+    }
+    if until == "ready":
+        report["live_median_ms"] = round(statistics.median(run["live_ms"] for run in runs), 1)
+    print(
+        f"start -> 200 {HEALTH_PATHS[until]}: median={report['median_ms']} ms min={report['min_ms']} ms "
+        f"max={report['max_ms']} ms runs={args.runs}"
+    )
+    if until == "ready":
+        print(f"start -> 200 {HEALTH_PATHS['live']}: median={report['live_median_ms']} ms")
+    print(f"import app.main (part of the above): {report['import_ms']} ms")
+    print_profile(parse_importtime(importtime_stderr), args.top)
+
+    loaded_lazy = [name for name in LAZY_MODULES if name in first["modules"]]
+    if loaded_lazy:
+        failures.append(f"lazy modules imported at startup: {', '.join(loaded_lazy)}")
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        failures.append(f"median {median_ms:.1f} ms > budget {args.budget_ms} ms")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("until") != until:
+            failures.append(f"baseline measured until={baseline.get('until')}, this run until={until}")
+        else:
+            limit = baseline["median_ms"] * (1 + args.tolerance)
+            print(f"baseline median={baseline['median_ms']} ms, limit={limit:.1f} ms")
+            if median_ms > limit:
+                failures.append(
+                    f"median {median_ms:.1f} ms > baseline {baseline['median_ms']} ms +{args.tolerance:.0%}"
+                )
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"baseline saved: {args.save_baseline}")
+
+    if failures:
+        print("STARTUP CHECK FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 3
+    print("STARTUP CHECK PASSED")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
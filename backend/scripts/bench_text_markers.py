@@ -0,0 +1,139 @@
+"""
+Micro-benchmark: any(marker in text) vs скомпилированный MarkerSet.
+
+Запуск из папки backend/:
+    python scripts/bench_text_markers.py
+"""
+import argparse
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.config import SESSION_MAX_TURNS  # noqa: E402
+from app.services.sessions import build_context_prefix, normalize_session_context  # noqa: E402
+from app.services.text_markers import (  # noqa: E402
+    PHOTO_INTENT_MARKERS,
+    PHOTO_REQUEST_MARKERS,
+    VISION_HISTORY_REFUSAL_MARKERS,
+    VISION_REFUSAL_MARKERS,
+)
+
+ANSWER = (
+    "Похоже, у собаки раздражение кожи на животе. Такое бывает при контакте с травой, "
+    "аллергии на корм или после купания с неподходящим шампунем. "
+    "Пока можно аккуратно промыть участок тёплой водой и не давать вылизывать. "
+    "Следите, не появятся ли мокнутие, корочки или выпадение шерсти. "
+    "Если за 2–3 дня не станет лучше или появится зуд — покажите питомца ветеринару.\n\n"
+) * 3
+QUESTION = "У кота третий день слезится глаз и он его трёт лапой, что делать?"
+
+
+def _legacy_any(markers: tuple[str, ...], text: str) -> bool:
+    lower = text.lower()
+    return any(marker in lower for marker in markers)
+
+
+# Маркеры и build_context_prefix до text_markers (baseline-коммит) — без изменений, для честного сравнения
+_BASELINE_HISTORY_MARKERS = [
+    "не могу сказать, кто изображ",
+    "не вижу фото",
+    "не могу просматривать изображ",
+]
+
+
+def _baseline_build_context_prefix(session_context, active_mode: str | None = None) -> str:
+    if not session_context or not isinstance(session_context, dict):
+        return ""
+    turns = session_context.get("turns") if isinstance(session_context, dict) else None
+    if not isinstance(turns, list):
+        turns = []
+    summary = session_context.get("summary") or ""
+
+    blocks = []
+    for turn in turns:
+        if not isinstance(turn, dict):
+            continue
+        q = (turn.get("q") or "").strip()
+        a = (turn.get("a") or "").strip()
+        if a == "[vision_refusal_ignored]":
+            continue
+        if a:
+            a_lower = a.lower()
+            if any(marker in a_lower for marker in _BASELINE_HISTORY_MARKERS):
+                continue
+        if not q and not a:
+            continue
+        lines = []
+        if q:
+            lines.append(f"Q: {q}")
+        if a:
+            lines.append(f"A: {a}")
+        if lines:
+            blocks.append("\n".join(lines))
+    if SESSION_MAX_TURNS > 0 and blocks:
+        blocks = blocks[-SESSION_MAX_TURNS:]
+
+    if not blocks and not summary:
+        return ""
+
+    parts = []
+    if summary:
+        parts.append(f"Краткое резюме:\n{summary}")
+    if blocks:
+        parts.append("Контекст диалога:\n{content}".format(content="\n\n".join(blocks)))
+    return "\n\n".join(parts)
+
+
+def _bench(label: str, fn, number: int) -> float:
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    per_call_us = seconds / number * 1_000_000
+    print(f"{label:<44} {per_call_us:9.2f} us/call")
+    return per_call_us
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Text markers micro-benchmark")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    n = args.number
+
+    print(f"answer_len={len(ANSWER)} question_len={len(QUESTION)} number={n}")
+    for name, marker_set, text in (
+        ("vision_refusal", VISION_REFUSAL_MARKERS, ANSWER),
+        ("vision_history_refusal", VISION_HISTORY_REFUSAL_MARKERS, ANSWER),
+        ("photo_intent", PHOTO_INTENT_MARKERS, QUESTION),
+        ("photo_request", PHOTO_REQUEST_MARKERS, ANSWER),
+    ):
+        legacy = _bench(f"{name} any()", lambda: _legacy_any(marker_set.markers, text), n)
+        compiled = _bench(f"{name} MarkerSet", lambda: marker_set.search(text), n)
+        print(f"{'':<44} x{legacy / compiled:.1f}")
+
+    now = datetime.now(timezone.utc)
+    raw_context = {
+        "turns": [{"q": QUESTION, "a": ANSWER} for _ in range(6)],
+        "summary": "Кот 7 лет, обсуждаем слезотечение.",
+    }
+    context = normalize_session_context(raw_context, now)
+    baseline_prefix = _baseline_build_context_prefix(context, "care")
+    if baseline_prefix != build_context_prefix(context, "care"):
+        print("build_context_prefix output differs from baseline")
+        return 1
+    legacy = _bench(
+        "build_context_prefix baseline",
+        lambda: _baseline_build_context_prefix(context, "care"),
+        n // 10,
+    )
+    cached = _bench(
+        "build_context_prefix cached flags",
+        lambda: build_context_prefix(context, "care"),
+        n // 10,
+    )
+    print(f"{'':<44} x{legacy / cached:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,547 @@
+"""
+Нагрузочный тест backend: смесь запросов как в проде, много синтетических пользователей,
+отчёт (RPS, гистограммы задержки, коды ошибок, соединения Postgres, стадии из Server-Timing)
+и pre-release gate (--gate, exit code 3 при провале).
+
+Операции смеси (--mix имя=вес,...):
+- free_text   — POST /v1/chat/ask от Free-пользователя
+- pro_text    — POST /v1/chat/ask от Pro-пользователя (сессия копится от запроса к запросу)
+- pro_vision  — POST /v1/chat/ask от Pro с inline-фото
+- pet_save    — POST /v1/pets/active/save
+- pet_read    — GET /v1/pets/active
+- dup_retry   — POST /v1/chat/ask и повтор с тем же X-Request-Id (меряется повтор)
+- me          — GET /v1/me
+
+Стенд: Postgres из backend/docker-compose.yml + scripts/mock_llm_server.py вместо LLM.
+Backend для нагрузки лучше запускать с большим FREE_DAILY_LIMIT, иначе почти всё упрётся в 429
+(429 считаются отдельно как ожидаемые и в error_rate не входят).
+
+Запуск из папки backend/:
+    docker compose up -d db
+    python scripts/mock_llm_server.py --port 8090 --latency lognormal:800,0.4 &
+    # backend: OPENAI_BASE_URL=http://127.0.0.1:8090/v1/chat/completions OPENAI_API_KEY=mock FREE_DAILY_LIMIT=1000000
+    python scripts/load_test.py --seed-db --duration 60 --concurrency 32 \\
+        --gate "p99_ms<=3000,error_rate<=0.01,rps>=10"
+"""
+import argparse
+import base64
+import http.client
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_MIX = "free_text=40,pro_text=25,pro_vision=5,pet_save=5,pet_read=10,dup_retry=5,me=10"
+HISTOGRAM_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+EXPECTED_4XX = {"rate_limited", "daily_limit_exceeded", "vision_limit_exceeded"}
+
+QUESTIONS = (
+    "У собаки второй день понос, что делать?",
+    "Кот почти не ест и много спит, стоит ли волноваться?",
+    "Как часто нужно стричь когти щенку?",
+    "Какие прививки нужны котёнку в 3 месяца?",
+    "Собака чешет ухо и трясёт головой",
+    "Чем кормить пожилую кошку с чувствительным ЖКТ?",
+)
+FOLLOWUPS = ("А если температура 39.5?", "Сколько дней наблюдать?", "Можно ли дать активированный уголь?")
+
+
+def make_inline_image() -> str:
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize((640, 480)).convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=80)
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def parse_mix(spec: str) -> list[tuple[str, float]]:
+    mix = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def parse_server_timing(header: str | None) -> dict[str, float]:
+    # Server-Timing: db;dur=12.3, llm;dur=850.1
+    stages = {}
+    for part in (header or "").split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        if not name:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "dur":
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+        self.stages: dict[str, list[float]] = defaultdict(list)
+        self.dedup_hits = 0
+        self.requests = 0
+
+    def record(self, op: str, status: int, latency_ms: float, error: str | None, headers: dict) -> None:
+        with self.lock:
+            self.requests += 1
+            self.latencies[op].append(latency_ms)
+            self.statuses[op][status] += 1
+            if error:
+                self.errors[f"{status}:{error}"] += 1
+            for stage, duration in parse_server_timing(headers.get("server-timing")).items():
+                self.stages[stage].append(duration)
+            if headers.get("x-dedup-hit") == "1":
+                self.dedup_hits += 1
+
+
+class Client:
+    """HTTP keep-alive соединение на поток (как у бота — общий пул, а не connect на запрос)."""
+
+    def __init__(self, base_url: str, token: str, timeout_sec: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.prefix = parts.path.rstrip("/")
+        self.token = token
+        self.timeout_sec = timeout_sec
+        self.conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout_sec)
+
+    def request(self, method: str, path: str, body: dict | None = None, request_id: str | None = None):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if request_id:
+            headers["X-Request-Id"] = request_id
+        started = time.perf_counter()
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = self._connect()
+            try:
+                self.conn.request(method, self.prefix + path, body=data, headers=headers)
+                resp = self.conn.getresponse()
+                raw = resp.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # keep-alive соединение закрыто сервером — одна попытка переподключиться
+                self.conn.close()
+                self.conn = None
+                if attempt == 1:
+                    return 0, "connection_closed", {}, (time.perf_counter() - started) * 1000
+            except (OSError, http.client.HTTPException) as exc:
+                self.conn.close()
+                self.conn = None
+                return 0, type(exc).__name__, {}, (time.perf_counter() - started) * 1000
+        latency_ms = (time.perf_counter() - started) * 1000
+        resp_headers = {key.lower(): value for key, value in resp.getheaders()}
+        error = None
+        if resp.status >= 400:
+            try:
+                payload = json.loads(raw.decode("utf-8"))
+                error = payload.get("error") if isinstance(payload, dict) else None
+                if isinstance(error, dict):
+                    error = error.get("message")
+            except (ValueError, UnicodeDecodeError):
+                error = None
+            error = str(error or f"http_{resp.status}")
+        return resp.status, error, resp_headers, latency_ms
+
+
+class Scenario:
+    def __init__(self, args, image_b64: str):
+        self.args = args
+        self.image_b64 = image_b64
+        self.free_ids = [args.user_base + index for index in range(args.free_users)]
+        self.pro_ids = [args.user_base + args.free_users + index for index in range(args.pro_users)]
+
+    def ask_payload(self, telegram_user_id: int, rng: random.Random, followup: bool = False) -> dict:
+        text = rng.choice(FOLLOWUPS if followup else QUESTIONS)
+        return {
+            "user": {"telegram_user_id": telegram_user_id},
+            "text": text,
+            "mode": rng.choice(("emergency", "care", "vaccines")),
+        }
+
+    def run(self, op: str, client: Client, stats: Stats, rng: random.Random) -> None:
+        if op == "free_text":
+            payload = self.ask_payload(rng.choice(self.free_ids), rng)
+            self._record(stats, op, client.request("POST", "/v1/chat/ask", payload, str(uuid.uuid4())))
+        elif op == "pro_text":
+            user_id = rng.choice(self.pro_ids)
+            payload = self.ask_payload(user_id, rng, followup=rng.random() < 0.6)
+            self._record(stats, op, client.request("POST", "/v1/chat/ask", payload, str(uuid.uuid4())))
+        elif op == "pro_vision":
+            user_id = rng.choice(self.pro_ids)
+            payload = self.ask_payload(user_id, rng)
+            payload["text"] = "Что с кожей на фото?"
+            payload["attachments"] = [{"type": "image", "source": "inline", "data": self.image_b64}]
+            self._record(stats, op, client.request("POST", "/v1/chat/ask", payload, str(uuid.uuid4())))
+        elif op == "pet_save":
+            user_id = rng.choice(self.pro_ids)
+            payload = {
+                "user": {"telegram_user_id": user_id},
+                "pet_profile": {
+                    "type": rng.choice(("dog", "cat")),
+                    "name": f"Load{user_id % 1000}",
+                    "age_text": f"{rng.randint(1, 15)} лет",
+                    "weight_kg": round(rng.uniform(2, 40), 1),
+                },
+            }
+            result = client.request("POST", "/v1/pets/active/save", payload, str(uuid.uuid4()))
+            self._record(stats, op, result)
+        elif op == "pet_read":
+            user_id = rng.choice(self.pro_ids)
+            query = urlencode({"telegram_user_id": user_id})
+            self._record(stats, op, client.request("GET", f"/v1/pets/active?{query}"))
+        elif op == "me":
+            user_id = rng.choice(self.free_ids + self.pro_ids)
+            query = urlencode({"telegram_user_id": user_id})
+            self._record(stats, op, client.request("GET", f"/v1/me?{query}"))
+        elif op == "dup_retry":
+            user_id = rng.choice(self.free_ids)
+            request_id = str(uuid.uuid4())
+            payload = self.ask_payload(user_id, rng)
+            client.request("POST", "/v1/chat/ask", payload, request_id)
+            self._record(stats, op, client.request("POST", "/v1/chat/ask", payload, request_id))
+
+    @staticmethod
+    def _record(stats: Stats, op: str, result) -> None:
+        status, error, headers, latency_ms = result
+        stats.record(op, status, latency_ms, error, headers)
+
+
+OPERATIONS = ("free_text", "pro_text", "pro_vision", "pet_save", "pet_read", "dup_retry", "me")
+
+
+def seed_db(database_url: str, scenario: Scenario, reset_limits: bool) -> None:
+    """
+    Создаёт синтетических пользователей (Free и Pro) и, по желанию, обнуляет их лимиты,
+    чтобы прогон начинался с одинакового состояния.
+    """
+    import psycopg
+
+    with psycopg.connect(database_url, connect_timeout=5) as conn:
+        with conn.cursor() as cur:
+            for ids, plan in ((scenario.free_ids, "free"), (scenario.pro_ids, "pro")):
+                cur.executemany(
+                    "insert into users "
+                    "(telegram_user_id, created_at, plan, locale, last_seen_at, "
+                    "research_used, research_limit, research_reset_at) "
+                    "values (%s, now(), %s, null, null, 0, 2, date_trunc('month', now()) + interval '1 month') "
+                    "on conflict (telegram_user_id) do update set plan = excluded.plan",
+                    [(telegram_user_id, plan) for telegram_user_id in ids],
+                )
+            if reset_limits:
+                all_ids = scenario.free_ids + scenario.pro_ids
+                cur.execute(
+                    "delete from rate_limits where user_id in "
+                    "(select id from users where telegram_user_id = any(%s))",
+                    (all_ids,),
+                )
+                cur.execute(
+                    "update users set vision_images_used = 0 where telegram_user_id = any(%s)",
+                    (all_ids,),
+                )
+    print(f"seeded free={len(scenario.free_ids)} pro={len(scenario.pro_ids)} reset_limits={reset_limits}")
+
+
+def sample_db_connections(database_url: str, stop: threading.Event, samples: list[dict], interval_sec: float) -> None:
+    import psycopg
+
+    try:
+        conn = psycopg.connect(database_url, connect_timeout=5, autocommit=True)
+    except Exception as exc:
+        print(f"pg_stat_activity sampling disabled: {type(exc).__name__}")
+        return
+    with conn:
+        while not stop.is_set():
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "select coalesce(state, 'unknown'), count(*) from pg_stat_activity "
+                        "where datname = current_database() and pid <> pg_backend_pid() "
+                        "group by 1"
+                    )
+                    counts = {state: count for state, count in cur.fetchall()}
+                counts["total"] = sum(counts.values())
+                samples.append(counts)
+            except Exception as exc:
+                print(f"pg_stat_activity sample failed: {type(exc).__name__}")
+            stop.wait(interval_sec)
+
+
+def histogram(values: list[float]) -> dict[str, int]:
+    buckets = Counter()
+    for value in values:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if value <= bound:
+                buckets[f"<={bound}"] += 1
+                break
+        else:
+            buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}"] += 1
+    labels = [f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}"]
+    return {label: buckets[label] for label in labels if buckets[label]}
+
+
+def latency_summary(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 1),
+        "p90_ms": round(percentile(values, 90), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "max_ms": round(max(values), 1) if values else 0.0,
+    }
+
+
+def build_report(stats: Stats, wall_sec: float, db_samples: list[dict]) -> dict:
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    statuses = Counter()
+    for counter in stats.statuses.values():
+        statuses.update(counter)
+    failed = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    unexpected_4xx = sum(
+        count
+        for key, count in stats.errors.items()
+        if key.split(":", 1)[0].startswith("4") and key.split(":", 1)[1] not in EXPECTED_4XX
+    )
+    total = stats.requests
+    report = {
+        "requests": total,
+        "wall_sec": round(wall_sec, 2),
+        "rps": round(total / wall_sec, 2) if wall_sec > 0 else 0.0,
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "unexpected_4xx_rate": round(unexpected_4xx / total, 4) if total else 0.0,
+        "dedup_hits": stats.dedup_hits,
+        **latency_summary(all_latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": dict(stats.errors.most_common()),
+        "operations": {},
+        "stages": {name: latency_summary(values) for name, values in sorted(stats.stages.items())},
+    }
+    for op, values in sorted(stats.latencies.items()):
+        report["operations"][op] = {
+            **latency_summary(values),
+            "statuses": {str(status): count for status, count in sorted(stats.statuses[op].items())},
+            "histogram_ms": histogram(values),
+        }
+    if db_samples:
+        report["db_connections"] = {
+            "samples": len(db_samples),
+            "max_total": max(sample["total"] for sample in db_samples),
+            "avg_total": round(sum(sample["total"] for sample in db_samples) / len(db_samples), 1),
+            "max_active": max(sample.get("active", 0) for sample in db_samples),
+            "max_idle_in_transaction": max(sample.get("idle in transaction", 0) for sample in db_samples),
+        }
+    return report
+
+
+def check_gate(report: dict, spec: str) -> list[str]:
+    """
+    --gate "p99_ms<=3000,error_rate<=0.01,rps>=10,free_text.p99_ms<=2500"
+    Метрика без точки — из общего отчёта, с точкой — из operations[op].
+    """
+    failures = []
+    for rule in [item.strip() for item in spec.split(",") if item.strip()]:
+        for op_text in ("<=", ">=", "<", ">"):
+            if op_text in rule:
+                name, _, limit_text = rule.partition(op_text)
+                break
+        else:
+            failures.append(f"bad rule: {rule}")
+            continue
+        source = report
+        metric = name.strip()
+        if "." in metric:
+            op, metric = metric.split(".", 1)
+            source = report["operations"].get(op) or {}
+        value = source.get(metric)
+        if value is None:
+            failures.append(f"{rule}: metric missing")
+            continue
+        limit = float(limit_text)
+        ok = {
+            "<=": value <= limit,
+            ">=": value >= limit,
+            "<": value < limit,
+            ">": value > limit,
+        }[op_text]
+        if not ok:
+            failures.append(f"{rule}: actual={value}")
+    return failures
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"requests={report['requests']} wall={report['wall_sec']}s rps={report['rps']} "
+        f"error_rate={report['error_rate']} unexpected_4xx_rate={report['unexpected_4xx_rate']} "
+        f"dedup_hits={report['dedup_hits']}"
+    )
+    print(f"latency p50={report['p50_ms']} p90={report['p90_ms']} p99={report['p99_ms']} max={report['max_ms']} ms")
+    print(f"statuses: {report['statuses']}")
+    if report["errors"]:
+        print(f"errors: {report['errors']}")
+    for op, item in report["operations"].items():
+        print(
+            f"  {op:<11} n={item['count']:<6} p50={item['p50_ms']:<8} p90={item['p90_ms']:<8} "
+            f"p99={item['p99_ms']:<8} statuses={item['statuses']}"
+        )
+        print(f"  {'':<11} hist={item['histogram_ms']}")
+    if report["stages"]:
+        print("stages (Server-Timing):")
+        for name, item in report["stages"].items():
+            print(f"  {name:<12} n={item['count']:<6} p50={item['p50_ms']:<8} p99={item['p99_ms']}")
+    if report.get("db_connections"):
+        print(f"db_connections: {report['db_connections']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backend load test")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--duration", type=float, default=30.0, help="секунд нагрузки")
+    parser.add_argument("--warmup", type=float, default=3.0, help="секунд прогрева (в отчёт не входят)")
+    parser.add_argument("--concurrency", type=int, default=16, help="одновременных виртуальных клиентов")
+    parser.add_argument("--rps", type=float, default=0.0, help="целевой общий RPS (0 = сколько выдержит)")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--free-users", type=int, default=2000)
+    parser.add_argument("--pro-users", type=int, default=200)
+    parser.add_argument("--user-base", type=int, default=880_000_000)
+    parser.add_argument("--timeout-sec", type=float, default=90.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-db", action="store_true", help="создать синтетических пользователей (DATABASE_URL)")
+    parser.add_argument("--reset-limits", action="store_true", help="обнулить их rate_limits и vision-квоту")
+    parser.add_argument("--db-sample-sec", type=float, default=1.0)
+    parser.add_argument("--gate", default=None)
+    parser.add_argument("--out", default=None, help="куда сохранить JSON-отчёт")
+    args = parser.parse_args()
+
+    token = args.token or os.getenv("BOT_BACKEND_TOKEN")
+    if not token:
+        print("Missing token. Provide --token or set BOT_BACKEND_TOKEN.")
+        return 1
+
+    mix = parse_mix(args.mix)
+    scenario = Scenario(args, make_inline_image())
+    database_url = os.getenv("DATABASE_URL", "")
+    if args.seed_db or args.reset_limits:
+        if not database_url:
+            print("DATABASE_URL is required for --seed-db/--reset-limits")
+            return 1
+        seed_db(database_url, scenario, args.reset_limits)
+
+    stats = Stats()
+    warmup_stats = Stats()
+    stop = threading.Event()
+    measuring = threading.Event()
+    interval = args.concurrency / args.rps if args.rps > 0 else 0.0
+
+    def worker(index: int) -> None:
+        rng = random.Random(args.seed * 100_003 + index)
+        client = Client(args.base_url, token, args.timeout_sec)
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        next_at = time.monotonic() + rng.uniform(0, interval) if interval else 0.0
+        while not stop.is_set():
+            if interval:
+                # открытая модель: каждый клиент держит свою долю RPS, не ускоряясь после медленных ответов
+                delay = next_at - time.monotonic()
+                if delay > 0 and stop.wait(delay):
+                    break
+                next_at += interval
+            op = rng.choices(names, weights=weights)[0]
+            scenario.run(op, client, stats if measuring.is_set() else warmup_stats, rng)
+
+    db_samples: list[dict] = []
+    db_stop = threading.Event()
+    sampler = None
+    if database_url:
+        sampler = threading.Thread(
+            target=sample_db_connections,
+            args=(database_url, db_stop, db_samples, args.db_sample_sec),
+            daemon=True,
+        )
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(args.concurrency)]
+    print(f"load: concurrency={args.concurrency} rps={args.rps or 'max'} duration={args.duration}s mix={args.mix}")
+    for thread in threads:
+        thread.start()
+    time.sleep(max(0.0, args.warmup))
+    measuring.set()
+    if sampler is not None:
+        sampler.start()
+    started = time.monotonic()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.timeout_sec)
+    wall_sec = time.monotonic() - started
+    db_stop.set()
+    if sampler is not None:
+        sampler.join(timeout=5)
+
+    report = build_report(stats, wall_sec, db_samples)
+    report["config"] = {
+        "concurrency": args.concurrency,
+        "target_rps": args.rps,
+        "duration_sec": args.duration,
+        "mix": args.mix,
+        "free_users": args.free_users,
+        "pro_users": args.pro_users,
+    }
+    print_report(report)
+
+    exit_code = 0
+    if args.gate:
+        failures = check_gate(report, args.gate)
+        report["gate"] = {"spec": args.gate, "passed": not failures, "failures": failures}
+        if failures:
+            print("GATE FAILED:")
+            for failure in failures:
+                print(f"  - {failure}")
+            exit_code = 3
+        else:
+            print("GATE PASSED")
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Локальная заглушка LLM-провайдера (контракт OpenAI POST /chat/completions) —
+прогон chat_ask целиком без ключей и сети: нагрузочные тесты, prompt eval, таймауты и ошибки.
+
+Что умеет:
+- задержка из распределения: fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN_MS,SIGMA;
+- инъекция ошибок (--error-rate, --error-codes) и зависаний (--timeout-rate, --hang-sec);
+- stream=true — ответ кусками SSE (`data: {...}` … `data: [DONE]`);
+- usage (prompt/completion/total_tokens, приблизительно: 1 токен ≈ 4 символа);
+- заготовленные ответы по sha256 последнего user-сообщения (--answers JSONL:
+  {"prompt_sha256": "...", "answer": "..."} или {"contains": "подстрока", "answer": "..."});
+- маркеры в тексте вопроса для точечных проверок через /v1/chat/ask:
+  [[mock:error=503]], [[mock:timeout]], [[mock:latency=3000]], [[mock:empty]].
+
+GET /stats — счётчики запросов, GET /health — ok.
+
+Запуск из папки backend/:
+    python scripts/mock_llm_server.py --port 8090 --latency lognormal:900,0.5 --error-rate 0.02
+и в .env backend:
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1/chat/completions
+    OPENAI_API_KEY=mock
+    TEXT_PROVIDER=openai
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+MARKER_RE = re.compile(r"\[\[mock:(\w+)(?:=([^\]]*))?\]\]")
+
+# Ответ по умолчанию: абзацы, наблюдение, ветеринар, срок и уточняющий вопрос —
+# проходит основные флаги prompt eval (has_paragraphs, structure, when_to_vet, followup_*).
+DEFAULT_ANSWER = (
+    "Понимаю ваше беспокойство. По описанию это похоже на лёгкое расстройство, "
+    "которое часто проходит само.\n\n"
+    "Что можно сделать сейчас: обеспечьте доступ к воде и покой, не давайте новый корм.\n\n"
+    "Наблюдайте за аппетитом, активностью и стулом. Если за 24 часа не станет лучше "
+    "или появится рвота, вялость, кровь — обратитесь в ветклинику.\n\n"
+    "Уточните, пожалуйста: как давно это началось и сколько лет питомцу?"
+)
+
+
+class LatencyModel:
+    def __init__(self, spec: str, rng: random.Random):
+        self.rng = rng
+        kind, _, params = spec.partition(":")
+        values = [float(item) for item in params.split(",") if item.strip()]
+        self.kind = kind.strip().lower()
+        if self.kind == "fixed" and len(values) == 1:
+            self.values = values
+        elif self.kind == "uniform" and len(values) == 2:
+            self.values = values
+        elif self.kind == "lognormal" and len(values) == 2:
+            self.values = values
+        else:
+            raise ValueError(f"bad latency spec: {spec}")
+
+    def sample_ms(self) -> float:
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.values[0], self.values[1])
+        median_ms, sigma = self.values
+        return self.rng.lognormvariate(math.log(max(median_ms, 1.0)), sigma)
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.error_codes = [int(item) for item in args.error_codes.split(",") if item.strip()]
+        self.by_hash: dict[str, str] = {}
+        self.by_substring: list[tuple[str, str]] = []
+        self.stats: Counter[str] = Counter()
+        self.stats_lock = threading.Lock()
+        if args.answers:
+            self._load_answers(Path(args.answers))
+
+    def _load_answers(self, path: Path) -> None:
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            answer = item.get("answer") or ""
+            if item.get("prompt_sha256"):
+                self.by_hash[item["prompt_sha256"]] = answer
+            elif item.get("contains"):
+                self.by_substring.append((item["contains"].lower(), answer))
+
+    def count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def draw(self) -> tuple[float, float, float]:
+        # один lock на все случайные величины — поведение воспроизводимо при --seed
+        with self.rng_lock:
+            return self.latency.sample_ms(), self.rng.random(), self.rng.random()
+
+    def pick_error_code(self) -> int:
+        with self.rng_lock:
+            return self.rng.choice(self.error_codes or [500])
+
+    def answer_for(self, prompt: str, prompt_hash: str) -> str:
+        if prompt_hash in self.by_hash:
+            return self.by_hash[prompt_hash]
+        lower = prompt.lower()
+        for needle, answer in self.by_substring:
+            if needle in lower:
+                return answer
+        return self.args.default_answer or DEFAULT_ANSWER
+
+
+def _message_text(message: dict) -> tuple[str, int]:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content, 0
+    texts = []
+    images = 0
+    for part in content or []:
+        if not isinstance(part, dict):
+            continue
+        if part.get("type") == "text":
+            texts.append(part.get("text") or "")
+        elif part.get("type") == "image_url":
+            images += 1
+    return "\n".join(texts), images
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            if state.args.verbose:
+                super().log_message(fmt, *args)
+
+        def _send_json(self, code: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("/health", "/v1/health"):
+                self._send_json(200, {"ok": True})
+            elif self.path.rstrip("/") in ("/stats", "/v1/stats"):
+                with state.stats_lock:
+                    self._send_json(200, dict(state.stats))
+            else:
+                self._send_json(404, {"error": {"message": "not_found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not_found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "invalid_json"}})
+                return
+            if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+                self._send_json(401, {"error": {"message": "missing_api_key"}})
+                return
+            state.count("requests")
+
+            messages = payload.get("messages") or []
+            prompt_chars = 0
+            images = 0
+            last_user = ""
+            for message in messages:
+                text, message_images = _message_text(message)
+                prompt_chars += len(text)
+                images += message_images
+                if message.get("role") == "user":
+                    last_user = text
+            markers = {name: value for name, value in MARKER_RE.findall(last_user)}
+            clean_prompt = MARKER_RE.sub("", last_user).strip()
+            prompt_hash = hashlib.sha256(clean_prompt.encode("utf-8")).hexdigest()
+
+            latency_ms, error_roll, timeout_roll = state.draw()
+            if "latency" in markers:
+                latency_ms = float(markers["latency"] or 0)
+
+            if "timeout" in markers or timeout_roll < state.args.timeout_rate:
+                state.count("timeouts")
+                # клиент должен отвалиться по своему timeout раньше
+                time.sleep(state.args.hang_sec)
+                self.close_connection = True
+                return
+
+            time.sleep(max(latency_ms, 0.0) / 1000)
+
+            if "error" in markers or error_roll < state.args.error_rate:
+                code = int(markers.get("error") or state.pick_error_code())
+                state.count(f"errors_{code}")
+                self._send_json(code, {"error": {"message": "mock_injected_error", "code": code}})
+                return
+
+            answer = "" if "empty" in markers else state.answer_for(clean_prompt, prompt_hash)
+            usage = {
+                "prompt_tokens": _tokens("x" * prompt_chars) + images * 85,
+                "completion_tokens": _tokens(answer),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+            model = payload.get("model") or "mock"
+            created = int(time.time())
+            state.count("ok")
+
+            if payload.get("stream"):
+                self._stream(completion_id, model, created, answer, usage)
+                return
+
+            self._send_json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": answer},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                    "system_fingerprint": f"mock-{prompt_hash[:12]}",
+                },
+            )
+
+        def _stream(self, completion_id: str, model: str, created: int, answer: str, usage: dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def event(delta: dict, finish_reason: str | None = None, with_usage: bool = False) -> None:
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                if with_usage:
+                    chunk["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            event({"role": "assistant", "content": ""})
+            size = max(1, state.args.stream_chunk_chars)
+            for start in range(0, len(answer), size):
+                event({"content": answer[start : start + size]})
+                time.sleep(state.args.stream_interval_ms / 1000)
+            event({}, finish_reason="stop", with_usage=True)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible /chat/completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--latency",
+        default="lognormal:900,0.5",
+        help="fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN_MS,SIGMA",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="500,502,503,429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-sec", type=float, default=120.0)
+    parser.add_argument("--answers", default=None, help="JSONL с заготовленными ответами")
+    parser.add_argument("--default-answer", default=None)
+    parser.add_argument("--stream-chunk-chars", type=int, default=24)
+    parser.add_argument("--stream-interval-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(
+        f"mock LLM on http://{args.host}:{args.port}/v1/chat/completions "
+        f"latency={args.latency} error_rate={args.error_rate} timeout_rate={args.timeout_rate}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
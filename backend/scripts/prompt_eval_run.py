@@ -1,10 +1,13 @@
 import argparse
 import json
+import math
 import os
 import sys
+import threading
 import time
 import uuid
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Any
@@ -182,6 +185,157 @@ def _safe_int(value: str) -> int | str:
     return value
 
 
+def _percentile(values: list[int], pct: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    # nearest-rank: p99 на 100 кейсах — это 99-й, а не максимум
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _latency_stats(items: list[dict[str, Any]]) -> dict[str, int]:
+    values = [item["latency_ms"] for item in items if item.get("latency_ms") is not None]
+    return {
+        "count": len(values),
+        "avg": int(sum(values) / len(values)) if values else 0,
+        "p50": _percentile(values, 50),
+        "p90": _percentile(values, 90),
+        "p99": _percentile(values, 99),
+        "max": max(values) if values else 0,
+    }
+
+
+def _group_latency(results: list[dict[str, Any]], key: str) -> dict[str, dict[str, int]]:
+    groups: dict[str, list[dict[str, Any]]] = {}
+    for item in results:
+        groups.setdefault(str(item.get(key) or "none"), []).append(item)
+    return {name: _latency_stats(items) for name, items in sorted(groups.items())}
+
+
+def _assign_users(
+    cases: list[dict[str, Any]],
+    free_user_id: str,
+    pro_user_ids: list[str],
+    free_per_user: int,
+) -> list[int | str]:
+    """
+    Free-лимит — FREE_DAILY_LIMIT вопросов в день на пользователя, поэтому free-кейсы
+    раскладываются по синтетическим пользователям EVAL_FREE_USER_ID, +1, +2, …
+    (по free_per_user на каждого). Pro-кейсы — по кругу на EVAL_PRO_USER_ID (через запятую).
+    """
+    assigned: list[int | str] = []
+    pro_ids = [_safe_int(item) for item in pro_user_ids]
+    base = _safe_int(free_user_id)
+    free_ids: list[int | str] = []
+    free_index = 0
+    pro_index = 0
+    for case in cases:
+        plan = (case.get("plan") or "free").lower()
+        if plan == "pro":
+            assigned.append(pro_ids[pro_index % len(pro_ids)])
+            pro_index += 1
+            continue
+        if not isinstance(base, int) or free_per_user <= 0:
+            assigned.append(base)
+            continue
+        slot = free_index // free_per_user
+        while len(free_ids) <= slot:
+            candidate = free_ids[-1] + 1 if free_ids else base
+            # синтетический free-id не должен совпасть с Pro-пользователем (999001 + 1 == 999002)
+            while candidate in pro_ids:
+                candidate += 1
+            free_ids.append(candidate)
+        assigned.append(free_ids[slot])
+        free_index += 1
+    return assigned
+
+
+def _run_case(
+    case: dict[str, Any],
+    telegram_user_id: int | str,
+    base_url: str,
+    token: str,
+    timeout_sec: int,
+) -> dict[str, Any]:
+    plan = (case.get("plan") or "free").lower()
+    payload = {
+        "user": {"telegram_user_id": telegram_user_id},
+        "text": case.get("text"),
+        "mode": case.get("mode"),
+        "pet_profile": case.get("pet_profile"),
+    }
+
+    request_id = str(uuid.uuid4())
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "X-Request-Id": request_id,
+        "Content-Type": "application/json",
+    }
+
+    url = f"{base_url.rstrip('/')}/v1/chat/ask"
+    data = json.dumps(payload).encode("utf-8")
+
+    response_json: dict[str, Any] | None = None
+    response_text: str | None = None
+    status_code: int | None = None
+    error_text: str | None = None
+
+    start = time.monotonic()
+    try:
+        request = Request(url, data=data, headers=headers, method="POST")
+        with urlopen(request, timeout=timeout_sec) as response:
+            status_code = response.status
+            response_text = response.read().decode("utf-8", errors="replace")
+            response_json = json.loads(response_text)
+    except HTTPError as exc:
+        status_code = exc.code
+        response_text = exc.read().decode("utf-8", errors="replace") if exc.fp else None
+        error_text = f"http_error: {exc.code}"
+        try:
+            if response_text:
+                response_json = json.loads(response_text)
+        except json.JSONDecodeError:
+            response_json = None
+    except URLError as exc:
+        error_text = f"url_error: {exc.reason}"
+    except Exception as exc:  # noqa: BLE001
+        error_text = f"exception: {exc}"
+    finally:
+        latency_ms = int((time.monotonic() - start) * 1000)
+
+    answer_text = ""
+    if response_json and isinstance(response_json, dict):
+        answer_text = response_json.get("answer_text") or response_json.get("answer") or ""
+
+    flags = detect_flags(answer_text, response_json or {})
+    passed, missing, forbidden = evaluate_case(case, flags)
+
+    if error_text or (status_code is not None and status_code != 200):
+        if not error_text and status_code is not None:
+            error_text = f"http_status: {status_code}"
+        passed = False
+        missing = []
+        forbidden = []
+
+    return {
+        "id": case.get("id"),
+        "mode": case.get("mode"),
+        "plan": plan,
+        "telegram_user_id": telegram_user_id,
+        "request_id": request_id,
+        "passed": passed,
+        "missing_flags": missing,
+        "forbidden_flags": forbidden,
+        "flags": sorted(flags),
+        "latency_ms": latency_ms,
+        "http_status": status_code,
+        "error": error_text,
+        "response_text": response_text,
+        "response_json": response_json,
+    }
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Prompt eval runner")
     parser.add_argument("--base-url", default="http://127.0.0.1:8000")
@@ -194,6 +348,18 @@ def main() -> int:
     parser.add_argument("--fail-fast", action="store_true")
     parser.add_argument("--timeout-sec", type=int, default=60)
     parser.add_argument("--sleep-ms", type=int, default=0)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="сколько пользователей опрашивать параллельно (кейсы одного пользователя — по очереди)",
+    )
+    parser.add_argument(
+        "--free-per-user",
+        type=int,
+        default=int(os.getenv("FREE_DAILY_LIMIT", "3")),
+        help="free-кейсов на одного синтетического пользователя (дневной лимит backend)",
+    )
     args = parser.parse_args()
 
     token = args.token or os.getenv("BOT_BACKEND_TOKEN")
@@ -218,99 +384,41 @@ def main() -> int:
     out_dir.mkdir(parents=True, exist_ok=True)
 
     free_user_id = os.getenv("EVAL_FREE_USER_ID", "999001")
-    pro_user_id = os.getenv("EVAL_PRO_USER_ID", "999002")
-
-    results: list[dict[str, Any]] = []
-
-    for case in cases:
-        plan = (case.get("plan") or "free").lower()
-        user_id = pro_user_id if plan == "pro" else free_user_id
-        telegram_user_id: int | str = _safe_int(user_id)
-
-        payload = {
-            "user": {"telegram_user_id": telegram_user_id},
-            "text": case.get("text"),
-            "mode": case.get("mode"),
-            "pet_profile": case.get("pet_profile"),
-        }
-
-        request_id = str(uuid.uuid4())
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "X-Request-Id": request_id,
-            "Content-Type": "application/json",
-        }
-
-        url = f"{args.base_url.rstrip('/')}/v1/chat/ask"
-        data = json.dumps(payload).encode("utf-8")
-
-        response_json: dict[str, Any] | None = None
-        response_text: str | None = None
-        status_code: int | None = None
-        error_text: str | None = None
-
-        start = time.monotonic()
-        try:
-            request = Request(url, data=data, headers=headers, method="POST")
-            with urlopen(request, timeout=args.timeout_sec) as response:
-                status_code = response.status
-                response_text = response.read().decode("utf-8", errors="replace")
-                response_json = json.loads(response_text)
-        except HTTPError as exc:
-            status_code = exc.code
-            response_text = exc.read().decode("utf-8", errors="replace") if exc.fp else None
-            error_text = f"http_error: {exc.code}"
-            try:
-                if response_text:
-                    response_json = json.loads(response_text)
-            except json.JSONDecodeError:
-                response_json = None
-        except URLError as exc:
-            error_text = f"url_error: {exc.reason}"
-        except Exception as exc:  # noqa: BLE001
-            error_text = f"exception: {exc}"
-        finally:
-            latency_ms = int((time.monotonic() - start) * 1000)
-
-        answer_text = ""
-        if response_json and isinstance(response_json, dict):
-            answer_text = response_json.get("answer_text") or response_json.get("answer") or ""
-
-        flags = detect_flags(answer_text, response_json or {})
-        passed, missing, forbidden = evaluate_case(case, flags)
-
-        transport_error = False
-        if error_text or (status_code is not None and status_code != 200):
-            transport_error = True
-            if not error_text and status_code is not None:
-                error_text = f"http_status: {status_code}"
-            passed = False
-            missing = []
-            forbidden = []
-
-        result = {
-            "id": case.get("id"),
-            "mode": case.get("mode"),
-            "plan": plan,
-            "telegram_user_id": telegram_user_id,
-            "request_id": request_id,
-            "passed": passed,
-            "missing_flags": missing,
-            "forbidden_flags": forbidden,
-            "flags": sorted(flags),
-            "latency_ms": latency_ms,
-            "http_status": status_code,
-            "error": error_text,
-            "response_text": response_text,
-            "response_json": response_json,
-        }
-        results.append(result)
-
-        if args.fail_fast and not passed:
-            break
-
-        if args.sleep_ms and args.sleep_ms > 0:
-            time.sleep(args.sleep_ms / 1000)
+    pro_user_ids = [
+        item.strip() for item in os.getenv("EVAL_PRO_USER_ID", "999002").split(",") if item.strip()
+    ] or ["999002"]
+    user_ids = _assign_users(cases, free_user_id, pro_user_ids, args.free_per_user)
+
+    # Кейсы одного пользователя идут последовательно (общие сессия и счётчик лимитов),
+    # разные пользователи — параллельно, не больше --concurrency одновременно.
+    lanes: dict[int | str, list[int]] = {}
+    for index, user_id in enumerate(user_ids):
+        lanes.setdefault(user_id, []).append(index)
+
+    results_by_index: dict[int, dict[str, Any]] = {}
+    stop = threading.Event()
+
+    def run_lane(indexes: list[int]) -> None:
+        for position, index in enumerate(indexes):
+            if stop.is_set():
+                return
+            result = _run_case(
+                cases[index], user_ids[index], args.base_url, token, args.timeout_sec
+            )
+            results_by_index[index] = result
+            if args.fail_fast and not result["passed"]:
+                stop.set()
+                return
+            if args.sleep_ms and args.sleep_ms > 0 and position < len(indexes) - 1:
+                time.sleep(args.sleep_ms / 1000)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        for future in [executor.submit(run_lane, indexes) for indexes in lanes.values()]:
+            future.result()
+    wall_sec = time.monotonic() - started
+
+    results = [results_by_index[index] for index in sorted(results_by_index)]
 
     total = len(results)
     passed_count = sum(1 for item in results if item.get("passed"))
@@ -318,14 +426,15 @@ def main() -> int:
 
     missing_counter: Counter[str] = Counter()
     forbidden_counter: Counter[str] = Counter()
-    latency_values = [item.get("latency_ms") for item in results if item.get("latency_ms") is not None]
 
     for item in results:
         if not item.get("passed") and not item.get("error"):
             missing_counter.update(item.get("missing_flags") or [])
             forbidden_counter.update(item.get("forbidden_flags") or [])
 
-    avg_latency = int(sum(latency_values) / len(latency_values)) if latency_values else 0
+    latency = _latency_stats(results)
+    avg_latency = latency["avg"]
+    throughput = round(total / wall_sec, 3) if wall_sec > 0 else 0.0
 
     summary = {
         "run_id": run_id,
@@ -334,6 +443,13 @@ def main() -> int:
         "passed": passed_count,
         "failed": failed_count,
         "avg_latency_ms": avg_latency,
+        "latency_ms": latency,
+        "latency_by_mode": _group_latency(results, "mode"),
+        "latency_by_plan": _group_latency(results, "plan"),
+        "concurrency": max(1, args.concurrency),
+        "users": len(lanes),
+        "wall_sec": round(wall_sec, 2),
+        "throughput_rps": throughput,
         "missing_counts": dict(missing_counter),
         "forbidden_counts": dict(forbidden_counter),
         "results_path": str(out_dir / "results.json"),
@@ -349,7 +465,15 @@ def main() -> int:
         f"Cases: {total} | Passed: {passed_count} | Failed: {failed_count}",
         f"Errors: {len(error_cases)}",
         f"Avg latency (ms): {avg_latency}",
+        f"Latency p50/p90/p99 (ms): {latency['p50']}/{latency['p90']}/{latency['p99']} | max: {latency['max']}",
+        f"Concurrency: {max(1, args.concurrency)} | Users: {len(lanes)} | "
+        f"Wall: {wall_sec:.1f}s | Throughput: {throughput} req/s",
     ]
+    for key in ("plan", "mode"):
+        for name, stats in summary[f"latency_by_{key}"].items():
+            report_lines.append(
+                f"  {key}={name}: n={stats['count']} p50={stats['p50']} p90={stats['p90']} p99={stats['p99']}"
+            )
 
     if missing_counter:
         missing_items = ", ".join(f"{key}={count}" for key, count in missing_counter.most_common())
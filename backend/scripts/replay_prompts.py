@@ -0,0 +1,528 @@
+"""
+Офлайн-реплей истории /v1/chat/ask: восстанавливает final_user_text и system prompt прошлых запросов
+из request_dedup.response_json (policy, модель, ответ) и sessions.session_context (вопрос, история, режим),
+считает токены, перекрытие префиксов для prompt caching и распределение длины контекста по политикам.
+С --replay отправляет восстановленные запросы в LLM (mock или настоящий) в темпе исходного трафика.
+
+Строки читаются server-side курсором (--batch-size за раз, сортировка по времени) — память не растёт
+с размером таблиц; в памяти только последний промпт пользователей, активных в пределах --cache-ttl-sec.
+
+Что восстановить нельзя (считается в отчёте):
+- unmatched — ход уже вытеснен из session_context (хранятся последние SESSION_MAX_TURNS) или сессии нет;
+- history_inexact — сессия заполнена, часть более ранних ходов истории могла быть вытеснена;
+- pet_profile_current — анкета из pets берётся текущая, а не на момент запроса;
+  pet_profile_unknown — анкета пришла в запросе от бота и не хранится;
+- vision_text_only — фото не хранится, реплей и токены только по тексту.
+
+Токены: tiktoken (o200k_base), если установлен, иначе грубая оценка (ASCII ~4 символа, кириллица ~3 на токен).
+
+Запуск из папки backend/:
+    python scripts/replay_prompts.py --since 2026-10-01 --out _replay/report.json --dump _replay/prompts.jsonl
+    # реплей в mock LLM в 10 раз быстрее исходного темпа
+    python scripts/mock_llm_server.py --port 8090 &
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1/chat/completions OPENAI_API_KEY=mock \\
+        python scripts/replay_prompts.py --since 2026-10-01 --limit 5000 --replay --speed 10 --provider openai
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Реплей меряет сам провайдер: предохранитель backend не должен отсекать запросы
+os.environ.setdefault("LLM_BREAKER_FAILURES", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.api.routes_chat import build_final_user_text  # noqa: E402
+from app.core.config import SESSION_MAX_TURNS  # noqa: E402
+from app.services.pet_profile_service import build_pet_dict_from_row  # noqa: E402
+from app.services.prompts import get_system_prompt  # noqa: E402
+from app.services.sessions import (  # noqa: E402
+    DEFAULT_MODE,
+    build_context_prefix,
+    normalize_session_context,
+)
+
+CONTEXT_BUCKETS = (512, 1024, 2048, 4096, 8192, 16384)
+KNOWN_MODES = {"care", "vaccines", "emergency"}
+
+SQL = """
+select d.request_id, d.user_id, d.created_at, d.finished_at, d.response_json, s.session_context,
+       p.id, p.user_id, p.type, p.name, p.sex, p.birth_date, p.age_text, p.breed, p.profile
+from request_dedup d
+left join lateral (
+    -- сессия, которую этот запрос дописал: первая по updated_at после начала запроса
+    select session_context
+    from sessions
+    where sessions.user_id = d.user_id and sessions.updated_at >= d.created_at
+    order by sessions.updated_at
+    limit 1
+) s on true
+left join pets p on p.id = nullif(d.response_json #>> '{meta,pet_profile_pet_id}', '')::uuid
+where d.status = 'done' and d.response_json is not null and d.user_id is not null
+"""
+
+
+def make_token_counter(kind: str):
+    if kind in ("auto", "tiktoken"):
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding("o200k_base")
+            return "o200k_base", lambda text: len(encoding.encode(text, disallowed_special=()))
+        except ImportError:
+            if kind == "tiktoken":
+                raise
+    return "approx", approx_tokens
+
+
+def approx_tokens(text: str) -> int:
+    if not text:
+        return 0
+    # UTF-8: у кириллицы 2 байта на символ — лишние байты ≈ число не-ASCII символов
+    non_ascii = len(text.encode("utf-8")) - len(text)
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 3)
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    # бинпоиск по срезам: сравнение строк идёт в C, а не посимвольно в Python
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _parse_time(value) -> datetime | None:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def find_turn(turns: list, answer_text: str | None, created_at: datetime, finished_at: datetime | None) -> int | None:
+    """
+    Ход этого запроса в session_context: по тексту ответа, иначе по времени записи хода
+    (отказ vision сохраняется в историю как VISION_REFUSAL_IGNORED, а не исходным текстом).
+    """
+    if answer_text:
+        for index in range(len(turns) - 1, -1, -1):
+            turn = turns[index]
+            if isinstance(turn, dict) and turn.get("a") == answer_text:
+                return index
+    upper = finished_at or created_at
+    for index, turn in enumerate(turns):
+        if not isinstance(turn, dict):
+            continue
+        turn_time = _parse_time(turn.get("t"))
+        if turn_time is not None and created_at <= turn_time <= upper:
+            return index
+    return None
+
+
+def rebuild_request(row) -> dict | None:
+    request_id, user_id, created_at, finished_at, response_json, session_context = row[:6]
+    pet_row = row[6:15]
+    if isinstance(response_json, str):
+        response_json = json.loads(response_json)
+    if not isinstance(session_context, dict):
+        return None
+    turns = session_context.get("turns")
+    if not isinstance(turns, list):
+        return None
+    index = find_turn(turns, response_json.get("answer_text"), created_at, finished_at)
+    if index is None:
+        return None
+
+    meta = response_json.get("meta") or {}
+    policy = meta.get("policy_name") or "unknown"
+    has_image = policy == "pro_vision"
+    turn = turns[index]
+    question = turn.get("q") or ""
+    mode = (turn.get("mode") or DEFAULT_MODE).strip().lower()
+
+    # Контекст на момент запроса: ходы до этого, режим хода, тот же summary
+    context = normalize_session_context(
+        dict(
+            session_context,
+            turns=turns[:index],
+            active={"mode": mode, "updated_at": created_at.isoformat()},
+        ),
+        created_at,
+    )
+    session_prefix = build_context_prefix(context, mode)
+
+    pet_source = meta.get("pet_profile_source") or "none"
+    effective_pet_profile = None
+    pet_profile = "none"
+    if pet_source == "db" and pet_row[0] is not None:
+        effective_pet_profile = build_pet_dict_from_row(pet_row)
+        pet_profile = "current"
+    elif pet_source != "none":
+        # анкета из запроса бота (или удалённый питомец) не хранится
+        pet_profile = "unknown"
+
+    selected_mode = mode if mode in KNOWN_MODES else DEFAULT_MODE
+    system_prompt = get_system_prompt(selected_mode, has_image, policy, session_context=context)
+    final_user_text = build_final_user_text(question, session_prefix, effective_pet_profile)
+    return {
+        "request_id": str(request_id),
+        "user_id": str(user_id),
+        "created_at": created_at,
+        "policy": policy,
+        "provider": meta.get("llm_provider"),
+        "model": meta.get("llm_model"),
+        "mode": selected_mode,
+        "has_image": has_image,
+        "system_prompt": system_prompt,
+        "final_user_text": final_user_text,
+        "session_prefix": session_prefix,
+        "history_turns": len(context["turns"]),
+        "history_exact": SESSION_MAX_TURNS <= 0 or len(turns) < SESSION_MAX_TURNS,
+        "pet_profile": pet_profile,
+    }
+
+
+class PrefixCacheModel:
+    """
+    Prompt caching как у OpenAI: кэшируется общий префикс от --cache-min-tokens, блоками по --cache-block,
+    пока с прошлого такого же префикса прошло меньше --cache-ttl-sec. Считаем два случая:
+    user — префикс прошлого запроса того же пользователя; shared — плюс system prompt, общий для всех.
+    """
+
+    def __init__(self, count_tokens, ttl_sec: float, min_tokens: int, block: int):
+        self.count_tokens = count_tokens
+        self.ttl_sec = ttl_sec
+        self.min_tokens = min_tokens
+        self.block = block
+        self._last_by_user: OrderedDict[str, tuple[float, str, str]] = OrderedDict()
+        self._system_seen: dict[tuple[str, str], float] = {}
+        self._system_tokens: dict[str, int] = {}
+
+    def _cached(self, tokens: int) -> int:
+        if tokens < self.min_tokens:
+            return 0
+        return tokens - tokens % self.block
+
+    def system_tokens(self, system_prompt: str) -> int:
+        tokens = self._system_tokens.get(system_prompt)
+        if tokens is None:
+            tokens = self._system_tokens[system_prompt] = self.count_tokens(system_prompt)
+        return tokens
+
+    def observe(self, item: dict) -> tuple[int, int]:
+        now = item["created_at"].timestamp()
+        while self._last_by_user:
+            _, (seen_at, _, _) = next(iter(self._last_by_user.items()))
+            if now - seen_at <= self.ttl_sec:
+                break
+            self._last_by_user.popitem(last=False)
+
+        model = item["model"] or ""
+        prompt = item["system_prompt"] + "\x00" + item["final_user_text"]
+        user_cached = 0
+        previous = self._last_by_user.pop(item["user_id"], None)
+        if previous is not None and previous[1] == model:
+            common = common_prefix_len(previous[2], prompt)
+            if common:
+                user_cached = self._cached(self.count_tokens(prompt[:common]))
+        self._last_by_user[item["user_id"]] = (now, model, prompt)
+
+        system_key = (model, item["system_prompt"])
+        shared_cached = user_cached
+        seen_at = self._system_seen.get(system_key)
+        if seen_at is not None and now - seen_at <= self.ttl_sec:
+            shared_cached = max(user_cached, self._cached(self.system_tokens(item["system_prompt"])))
+        self._system_seen[system_key] = now
+        return user_cached, shared_cached
+
+
+class PolicyStats:
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = array("I")
+        self.context_tokens = array("I")
+        self.system_tokens = array("I")
+        self.user_cached = 0
+        self.shared_cached = 0
+        self.flags = Counter()
+        self.modes = Counter()
+
+    def add(self, item: dict, prompt_tokens: int, system_tokens: int, context_tokens: int, cached: tuple[int, int]):
+        self.requests += 1
+        self.prompt_tokens.append(prompt_tokens)
+        self.system_tokens.append(system_tokens)
+        self.context_tokens.append(context_tokens)
+        self.user_cached += cached[0]
+        self.shared_cached += cached[1]
+        self.modes[item["mode"]] += 1
+        if not item["history_exact"]:
+            self.flags["history_inexact"] += 1
+        if item["pet_profile"] != "none":
+            self.flags[f"pet_profile_{item['pet_profile']}"] += 1
+        if item["has_image"]:
+            self.flags["vision_text_only"] += 1
+
+    def report(self) -> dict:
+        total = sum(self.prompt_tokens) or 1
+        histogram = Counter()
+        for tokens in self.prompt_tokens:
+            bucket = next((f"<={edge}" for edge in CONTEXT_BUCKETS if tokens <= edge), f">{CONTEXT_BUCKETS[-1]}")
+            histogram[bucket] += 1
+        return {
+            "requests": self.requests,
+            "prompt_tokens": _distribution(self.prompt_tokens),
+            "system_tokens": _distribution(self.system_tokens),
+            "context_tokens": _distribution(self.context_tokens),
+            "prompt_tokens_histogram": {
+                key: histogram[key]
+                for key in [f"<={edge}" for edge in CONTEXT_BUCKETS] + [f">{CONTEXT_BUCKETS[-1]}"]
+                if histogram[key]
+            },
+            "cacheable_share_user": round(self.user_cached / total, 4),
+            "cacheable_share_shared": round(self.shared_cached / total, 4),
+            "modes": dict(self.modes),
+            "flags": dict(self.flags),
+        }
+
+
+def _distribution(values) -> dict:
+    if not values:
+        return {}
+    return {
+        "mean": round(sum(values) / len(values), 1),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+class Replayer:
+    """
+    Отправляет восстановленные запросы через ask_llm (тот же клиент и политики, что у backend).
+    Темп — исходные интервалы между запросами, делённые на --speed (0 = без пауз).
+    """
+
+    def __init__(self, args):
+        from app.services import ask_llm
+        from app.services.llm_policies import get_llm_policy, load_llm_policies
+
+        # Как в backend после старта: политики из llm_policies (или ENV, если БД недоступна)
+        load_llm_policies()
+        self.ask_llm = ask_llm
+        self.get_llm_policy = get_llm_policy
+        self.args = args
+        self.executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="replay")
+        self.slots = threading.Semaphore(args.concurrency * 2)
+        self.lock = threading.Lock()
+        self.latency_ms: dict[str, array] = defaultdict(lambda: array("f"))
+        self.outcomes: dict[str, Counter] = defaultdict(Counter)
+        self.first_at: datetime | None = None
+        self.started = 0.0
+
+    def submit(self, item: dict) -> None:
+        if self.first_at is None:
+            self.first_at = item["created_at"]
+            self.started = time.monotonic()
+        if self.args.speed > 0:
+            offset = (item["created_at"] - self.first_at).total_seconds() / self.args.speed
+            delay = self.started + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.slots.acquire()
+        future = self.executor.submit(self._call, item)
+        future.add_done_callback(lambda _: self.slots.release())
+
+    def _call(self, item: dict) -> None:
+        policy = self.get_llm_policy(item["policy"])
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            self.ask_llm(
+                item["final_user_text"],
+                item["system_prompt"],
+                provider=self.args.provider or item["provider"] or (policy.provider if policy else None),
+                model=self.args.model or item["model"] or (policy.model if policy else None),
+                temperature=policy.temperature if policy else None,
+                max_tokens=policy.max_tokens if policy else None,
+                timeout_sec=policy.timeout_sec if policy else None,
+                policy=item["policy"],
+            )
+        except Exception as exc:
+            outcome = type(exc).__name__
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latency_ms[item["policy"]].append(elapsed_ms)
+            self.outcomes[item["policy"]][outcome] += 1
+
+    def finish(self) -> dict:
+        self.executor.shutdown(wait=True)
+        return {
+            policy: {
+                "requests": len(values),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p90_ms": round(percentile(values, 90), 1),
+                "p99_ms": round(percentile(values, 99), 1),
+                "outcomes": dict(self.outcomes[policy]),
+            }
+            for policy, values in self.latency_ms.items()
+        }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"rows={report['rows']} rebuilt={report['rebuilt']} unmatched={report['unmatched']} "
+        f"tokenizer={report['tokenizer']} cache_ttl={report['cache']['ttl_sec']}s"
+    )
+    for policy, item in report["policies"].items():
+        prompt = item["prompt_tokens"]
+        context = item["context_tokens"]
+        print(
+            f"  {policy:<13} n={item['requests']:<8} prompt p50={prompt.get('p50')} p90={prompt.get('p90')} "
+            f"p99={prompt.get('p99')} max={prompt.get('max')} | context p50={context.get('p50')} "
+            f"p99={context.get('p99')} | cacheable user={item['cacheable_share_user']:.1%} "
+            f"shared={item['cacheable_share_shared']:.1%}"
+        )
+        print(f"  {'':<13} hist={item['prompt_tokens_histogram']} flags={item['flags']}")
+    for policy, item in (report.get("replay") or {}).items():
+        print(
+            f"  replay {policy:<13} n={item['requests']:<6} p50={item['p50_ms']} p90={item['p90_ms']} "
+            f"p99={item['p99_ms']} outcomes={item['outcomes']}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild and replay historical chat_ask prompts")
+    parser.add_argument("--since", default=None, help="request_dedup.created_at >= (ISO дата/время)")
+    parser.add_argument("--until", default=None, help="request_dedup.created_at < (ISO дата/время)")
+    parser.add_argument("--policy", default=None, help="только эта политика (meta.policy_name)")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=500, help="строк за один fetch курсора")
+    parser.add_argument("--tokenizer", choices=("auto", "tiktoken", "approx"), default="auto")
+    parser.add_argument("--cache-ttl-sec", type=float, default=300.0)
+    parser.add_argument("--cache-min-tokens", type=int, default=1024)
+    parser.add_argument("--cache-block", type=int, default=128)
+    parser.add_argument("--dump", default=None, help="JSONL с восстановленными промптами")
+    parser.add_argument("--out", default=None, help="куда сохранить JSON-отчёт")
+    parser.add_argument("--replay", action="store_true", help="отправить запросы в LLM (OPENAI_BASE_URL и т.п.)")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение исходного темпа, 0 = без пауз")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--provider", default=None, help="переопределить провайдера (openai|openrouter)")
+    parser.add_argument("--model", default=None, help="переопределить модель")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "")
+    if not database_url:
+        print("DATABASE_URL is required")
+        return 1
+
+    import psycopg
+
+    tokenizer, count_tokens = make_token_counter(args.tokenizer)
+    cache = PrefixCacheModel(count_tokens, args.cache_ttl_sec, args.cache_min_tokens, args.cache_block)
+    stats: dict[str, PolicyStats] = defaultdict(PolicyStats)
+    replayer = Replayer(args) if args.replay else None
+
+    sql = SQL
+    params: list = []
+    if args.since:
+        sql += " and d.created_at >= %s"
+        params.append(args.since)
+    if args.until:
+        sql += " and d.created_at < %s"
+        params.append(args.until)
+    if args.policy:
+        sql += " and d.response_json #>> '{meta,policy_name}' = %s"
+        params.append(args.policy)
+    sql += " order by d.created_at"
+    if args.limit:
+        sql += " limit %s"
+        params.append(args.limit)
+
+    rows = rebuilt = unmatched = 0
+    dump = None
+    if args.dump:
+        Path(args.dump).parent.mkdir(parents=True, exist_ok=True)
+        dump = open(args.dump, "w", encoding="utf-8")
+    started = time.monotonic()
+    try:
+        with psycopg.connect(database_url, connect_timeout=5) as conn:
+            conn.read_only = True
+            # Именованный курсор = server-side: Postgres отдаёт строки пачками по itersize
+            with conn.cursor(name="replay_prompts") as cur:
+                cur.itersize = args.batch_size
+                cur.execute(sql, params)
+                for row in cur:
+                    rows += 1
+                    item = rebuild_request(row)
+                    if item is None:
+                        unmatched += 1
+                        continue
+                    rebuilt += 1
+                    system_tokens = cache.system_tokens(item["system_prompt"])
+                    prompt_tokens = system_tokens + count_tokens(item["final_user_text"])
+                    context_tokens = count_tokens(item["session_prefix"]) if item["session_prefix"] else 0
+                    cached = cache.observe(item)
+                    stats[item["policy"]].add(item, prompt_tokens, system_tokens, context_tokens, cached)
+                    if dump is not None:
+                        record = {key: value for key, value in item.items() if key != "session_prefix"}
+                        record["created_at"] = item["created_at"].isoformat()
+                        record["prompt_tokens"] = prompt_tokens
+                        record["cached_tokens_user"], record["cached_tokens_shared"] = cached
+                        dump.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    if replayer is not None:
+                        replayer.submit(item)
+                    if rows % 100_000 == 0:
+                        print(f"... rows={rows} rebuilt={rebuilt} {time.monotonic() - started:.0f}s")
+    finally:
+        if dump is not None:
+            dump.close()
+
+    report = {
+        "rows": rows,
+        "rebuilt": rebuilt,
+        "unmatched": unmatched,
+        "tokenizer": tokenizer,
+        "session_max_turns": SESSION_MAX_TURNS,
+        "cache": {
+            "ttl_sec": args.cache_ttl_sec,
+            "min_tokens": args.cache_min_tokens,
+            "block": args.cache_block,
+        },
+        "policies": {policy: item.report() for policy, item in sorted(stats.items())},
+        "wall_sec": round(time.monotonic() - started, 1),
+    }
+    if replayer is not None:
+        report["replay"] = replayer.finish()
+    print_report(report)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
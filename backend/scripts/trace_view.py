@@ -0,0 +1,98 @@
+"""
+Таймлайн одного трейса из JSONL-файлов бота и backend (BOT_TRACE_EXPORT=jsonl, TRACE_EXPORT=jsonl).
+
+Трейс ищется по trace_id, X-Request-Id (атрибут request_id) или telegram user_id; без фильтра —
+самые медленные трейсы. Печатается дерево span'ов со смещением от начала и длительностью.
+
+Запуск из папки backend/:
+    python scripts/trace_view.py traces.jsonl ../telegram-bot/bot_traces.jsonl --request-id <uuid>
+    python scripts/trace_view.py traces.jsonl ../telegram-bot/bot_traces.jsonl --slowest 5
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+
+def load_spans(paths: list[str]) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = defaultdict(list)
+    for path in paths:
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            traces[span["trace_id"]].append(span)
+    return traces
+
+
+def _matches(spans: list[dict], args) -> bool:
+    if args.trace_id:
+        return spans[0]["trace_id"] == args.trace_id
+    for span in spans:
+        attrs = span.get("attributes") or {}
+        if args.request_id and attrs.get("request_id") == args.request_id:
+            return True
+        if args.user_id and str(attrs.get("user_id") or attrs.get("telegram_user_id")) == args.user_id:
+            return True
+    return False
+
+
+def print_trace(spans: list[dict]) -> None:
+    by_parent: dict[str | None, list[dict]] = defaultdict(list)
+    ids = {span["span_id"] for span in spans}
+    for span in spans:
+        parent = span.get("parent_id") if span.get("parent_id") in ids else None
+        by_parent[parent].append(span)
+    start = min(span["start_ns"] for span in spans)
+    end = max(span["end_ns"] for span in spans)
+    print(f"trace {spans[0]['trace_id']} spans={len(spans)} total_ms={(end - start) / 1e6:.1f}")
+
+    def walk(parent: str | None, depth: int) -> None:
+        for span in sorted(by_parent.get(parent, []), key=lambda item: item["start_ns"]):
+            offset_ms = (span["start_ns"] - start) / 1e6
+            attrs = {key: value for key, value in (span.get("attributes") or {}).items() if value is not None}
+            flag = " ERROR" if span.get("error") else ""
+            print(
+                f"  {offset_ms:9.1f} ms {span['duration_ms']:9.1f} ms  "
+                f"{'  ' * depth}{span['name']} [{span.get('service', '?')}]{flag} {attrs if attrs else ''}"
+            )
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Print span timelines from JSONL trace files")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--trace-id")
+    parser.add_argument("--request-id")
+    parser.add_argument("--user-id")
+    parser.add_argument("--slowest", type=int, default=3)
+    args = parser.parse_args()
+
+    traces = load_spans(args.files)
+    if not traces:
+        print("no spans")
+        return 1
+    if args.trace_id or args.request_id or args.user_id:
+        selected = [spans for spans in traces.values() if _matches(spans, args)]
+    else:
+        selected = sorted(
+            traces.values(),
+            key=lambda spans: max(s["end_ns"] for s in spans) - min(s["start_ns"] for s in spans),
+            reverse=True,
+        )[: args.slowest]
+    if not selected:
+        print("trace not found")
+        return 1
+    for spans in selected:
+        print_trace(spans)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
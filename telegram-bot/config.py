@@ -29,3 +29,6 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini").strip()
 
 BOT_DEBUG = os.getenv("BOT_DEBUG", "0") == "1"
+
+# Число процессов-обработчиков: 1 = всё в одном процессе, >1 = receiver + N воркеров (workers.py)
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1") or 1))
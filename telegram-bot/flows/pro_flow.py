@@ -1,4 +1,3 @@
-import asyncio
 import os
 import re
 from pyrogram import Client
@@ -114,10 +113,15 @@ def build_pet_profile_loaded_keyboard() -> InlineKeyboardMarkup:
     )
 
 
+def force_pro() -> bool:
+    # DEV: FORCE_PRO=1 — Pro для всех, без тарифа от backend
+    return os.getenv("FORCE_PRO", "").strip() == "1"
+
+
 def is_user_pro(last_limits: dict | None) -> bool:
     if isinstance(last_limits, dict) and last_limits.get("plan") == "pro":
         return True
-    return os.getenv("FORCE_PRO", "").strip() == "1"
+    return force_pro()
 
 
 def is_pro_profile_complete(profile: dict) -> bool:
@@ -391,7 +395,7 @@ async def maybe_load_pet_profile(message: Message, user_id: int) -> bool:
     if get_pet_profile_loaded(user_id):
         return get_pet_profile(user_id) is not None
 
-    pet_profile = await asyncio.to_thread(get_active_pet, user_id)
+    pet_profile = await get_active_pet(user_id)
     if pet_profile is None:
         return False
 
@@ -457,7 +461,7 @@ def _format_my_pet_short(profile: dict) -> str:
 async def show_my_pet_short(message: Message, user_id: int) -> None:
     profile = get_pet_profile(user_id)
     if not isinstance(profile, dict):
-        active = await asyncio.to_thread(get_active_pet, user_id)
+        active = await get_active_pet(user_id)
         if isinstance(active, dict):
             normalized = {}
             base = active.get("profile")
@@ -541,7 +545,7 @@ async def save_profile_now(
     # 3) Если type всё ещё нет - пробуем подтянуть активного питомца из backend
     if not profile.get("type"):
         try:
-            active = await asyncio.to_thread(get_active_pet, user_id)
+            active = await get_active_pet(user_id)
             if isinstance(active, dict):
                 active_type = active.get("type")
                 if active_type:
@@ -565,8 +569,7 @@ async def save_profile_now(
         print(f"[HTTP] POST /v1/pets/active/save user_id={user_id}")
     try:
         await message.reply("⏳ Сохраняю изменения профиля: Пожалуйста, подождите.")
-        result = await asyncio.to_thread(
-            save_active_pet_profile,
+        result = await save_active_pet_profile(
             user_id,
             profile,
         )
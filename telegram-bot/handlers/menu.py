@@ -1,17 +1,17 @@
 # handlers/menu.py
 
-import asyncio
 from pyrogram import Client, filters
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from services.backend_client import get_active_pet
 from services.state import (
+    get_last_limits,
     get_pet_profile,
     get_pro_step,
     set_pet_profile,
     set_pet_profile_loaded,
     PRO_STEP_NONE,
 )
-from flows.pro_flow import guard_dirty_or_execute
+from flows.pro_flow import guard_dirty_or_execute, is_user_pro
 from ui.main_menu import show_main_menu
 from ui.labels import (
     BTN_DOG,
@@ -312,7 +312,12 @@ def setup_menu_handlers(app: Client):
         user_id = callback_query.from_user.id if callback_query.from_user else None
         pet_profile = None
         if user_id is not None:
-            pet_profile = await asyncio.to_thread(get_active_pet, user_id)
+            last_limits = get_last_limits(user_id, fresh_only=True)
+            if last_limits is not None and not is_user_pro(last_limits):
+                # Тариф уже известен (ответ /v1/chat/ask или /v1/me) — без запроса за 402
+                pet_profile = "pro_required"
+            else:
+                pet_profile = await get_active_pet(user_id)
 
         if pet_profile == "pro_required":
             await callback_query.message.edit_text(
@@ -364,7 +369,7 @@ def setup_menu_handlers(app: Client):
         user_id = callback_query.from_user.id if callback_query.from_user else None
         profile = get_pet_profile(user_id) if user_id is not None else None
         if not isinstance(profile, dict) and user_id is not None:
-            active = await asyncio.to_thread(get_active_pet, user_id)
+            active = await get_active_pet(user_id)
             if isinstance(active, dict):
                 profile = normalize_pet_profile(active)
                 set_pet_profile(user_id, profile)
@@ -385,7 +390,7 @@ def setup_menu_handlers(app: Client):
         user_id = callback_query.from_user.id if callback_query.from_user else None
         profile = get_pet_profile(user_id) if user_id is not None else None
         if not isinstance(profile, dict) and user_id is not None:
-            active = await asyncio.to_thread(get_active_pet, user_id)
+            active = await get_active_pet(user_id)
             if isinstance(active, dict):
                 profile = normalize_pet_profile(active)
                 set_pet_profile(user_id, profile)
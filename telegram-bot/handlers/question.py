@@ -2,13 +2,14 @@ from pyrogram import Client, filters
 from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.enums import ChatAction
 import asyncio
-import base64
-import io
 import os
+import tempfile
 import uuid
+from pathlib import Path
 from PIL import Image, UnidentifiedImageError
 import config
 from flows.pro_flow import (
+    force_pro,
     is_user_pro,
     is_pro_profile_complete,
     start_pro_flow,
@@ -17,20 +18,26 @@ from flows.pro_flow import (
     handle_save_profile as handle_save_profile_flow,
     handle_pro_text_step,
 )
-from services.backend_client import ask_backend, get_active_pet
+from services.backend_client import ask_backend, get_me, upload_media
+from services.ask_queue import MAX_ATTACHMENTS_PER_ASK, AskJob, UserAskQueue
+from services.image_pool import MAX_PHOTO_SIDE, PhotoQueueFull, compress_photo_path
+from services.media_group import MediaGroupBuffer
 from ui.labels import BTN_SKIP
 from ui.keyboards import kb_pet_selection
+from services.tracing import SPAN_KIND_CLIENT, start_trace
 from services.state import (
     get_profile,
     get_pro_profile,
     get_pro_step,
     get_last_limits,
+    get_me_etag,
     get_pet_profile,
     set_basic_info,
     set_last_limits,
     set_pending_question,
     set_profile_field,
     set_question,
+    set_step,
     set_waiting_question,
     start_profile,
     get_skip_basic_info,
@@ -43,9 +50,6 @@ from services.state import (
 
 VALID_MODES = {"emergency", "care", "vaccines"}
 MAX_PHOTO_BYTES = 8 * 1024 * 1024
-MAX_PHOTO_SIDE = 1280
-JPEG_QUALITY = 70
-Image.MAX_IMAGE_PIXELS = 20_000_000
 
 # --- pet_profile sanitize before sending to backend (/v1/chat/ask) ---
 
@@ -122,41 +126,34 @@ def build_upsell_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def compress_photo_bytes(raw_bytes: bytes) -> bytes:
-    try:
-        with Image.open(io.BytesIO(raw_bytes)) as image:
-            image = image.convert("RGB")
-            image.thumbnail((MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
-            out = io.BytesIO()
-            image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
-            return out.getvalue()
-    except (Image.DecompressionBombError, UnidentifiedImageError, OSError):
-        raise
-
-
-def build_image_attachment(image_bytes: bytes) -> dict:
-    encoded = base64.b64encode(image_bytes).decode("ascii")
+def build_media_attachment(media_id: str) -> dict:
     return {
         "type": "image",
-        "source": "inline",
-        "mime": "image/jpeg",
-        "data": encoded,
+        "source": "media",
+        "media_id": media_id,
     }
 
 
-async def is_pro_user(user_id: int, last_limits: dict | None) -> bool | None:
-    if is_user_pro(last_limits):
-        return True
-    result = await asyncio.to_thread(get_active_pet, user_id)
-    if result == "pro_required":
-        return False
-    if result is None:
-        return None
-    if isinstance(result, dict):
-        return True
-    return None
-
-
+async def is_pro_user(user_id: int) -> bool | None:
+    """
+    Тариф из кэша last_limits (обновляется каждым ответом /v1/chat/ask),
+    GET /v1/me — только если кэш пуст или старше BOT_LIMITS_TTL_SEC.
+    """
+    last_limits = get_last_limits(user_id, fresh_only=True)
+    # FORCE_PRO не ходит в backend за тарифом
+    if last_limits is not None or force_pro():
+        return is_user_pro(last_limits)
+    stale_limits = get_last_limits(user_id)
+    # ETag есть только у лимитов из /v1/me: данные не менялись — 304 без тела, кэш продлевается
+    me = await get_me(user_id, etag=get_me_etag(user_id))
+    if me is None:
+        # backend недоступен — лучше устаревший тариф, чем никакого
+        return is_user_pro(stale_limits) if stale_limits is not None else None
+    if me.get("not_modified"):
+        set_last_limits(user_id, stale_limits, me_etag=me["etag"])
+        return is_user_pro(stale_limits)
+    set_last_limits(user_id, me["limits"], me_etag=me.get("etag"))
+    return is_user_pro(me["limits"])
 
 
 def get_question_prompt_text(context: str | None) -> str:
@@ -184,12 +181,74 @@ async def send_question_prompt(message: Message, context: str | None, edit: bool
         await message.reply(text)
 
 
-async def send_backend_response(
+# Telegram гасит «печатает…» примерно через 5 с, а LLM отвечает до ~60 с
+TYPING_REFRESH_SEC = 4
+TEXT_ANSWER_PENDING = "⌛️ Ваш запрос обрабатывается нейросетью. Пожалуйста, подождите..."
+
+
+class PendingAnswer:
+    """
+    Плейсхолдер «⌛️ обрабатывается» и «печатает…» на время запроса к backend.
+    Оба запроса к Telegram идут фоном и не задерживают вызов backend;
+    ответ заменяет плейсхолдер через edit_text (если не вышло — обычный reply).
+    """
+
+    def __init__(self, client_tg: Client, message: Message):
+        self.message = message
+        self._delivered = False
+        self._ack = asyncio.create_task(message.reply(TEXT_ANSWER_PENDING))
+        self._typing = asyncio.create_task(self._keep_typing(client_tg, message.chat.id))
+
+    @staticmethod
+    async def _keep_typing(client_tg: Client, chat_id: int) -> None:
+        while True:
+            try:
+                await client_tg.send_chat_action(chat_id, ChatAction.TYPING)
+            except Exception as exc:
+                print(f"[TYPING] failed chat_id={chat_id} err={type(exc).__name__}")
+                return
+            await asyncio.sleep(TYPING_REFRESH_SEC)
+
+    async def _placeholder(self) -> Message | None:
+        try:
+            return await self._ack
+        except Exception as exc:
+            print(f"[ACK] placeholder failed chat_id={self.message.chat.id} err={type(exc).__name__}")
+            return None
+
+    async def answer(self, text: str, reply_markup=None) -> None:
+        if self._delivered:
+            return
+        self.stop_typing()
+        placeholder = await self._placeholder()
+        if placeholder is not None:
+            try:
+                await placeholder.edit_text(text, reply_markup=reply_markup)
+                self._delivered = True
+                return
+            except Exception as exc:
+                print(f"[ACK] edit failed chat_id={self.message.chat.id} err={type(exc).__name__}")
+        await self.message.reply(text, reply_markup=reply_markup)
+        self._delivered = True
+        if placeholder is not None:
+            try:
+                await placeholder.delete()
+            except Exception:
+                pass
+
+    def stop_typing(self) -> None:
+        if not self._typing.done():
+            self._typing.cancel()
+
+
+async def _send_backend_response_now(
     client_tg: Client,
     message: Message,
     user_id: int,
     question_text: str | None = None,
     attachments: list[dict] | None = None,
+    trace=None,
+    pending: PendingAnswer | None = None,
 ) -> None:
     profile = get_profile(user_id)
     pro_profile = get_pro_profile(user_id)
@@ -223,9 +282,12 @@ async def send_backend_response(
     else:
         summary = question
 
-    await message.reply("⌛️ Ваш запрос обрабатывается нейросетью. Пожалуйста, подождите...")
-
-    await client_tg.send_chat_action(message.chat.id, ChatAction.TYPING)
+    if pending is None:
+        pending = PendingAnswer(client_tg, message)
+    call_span = None
+    reply_span = None
+    ok = False
+    status = None
 
     try:
         if config.BOT_DEBUG:
@@ -245,8 +307,9 @@ async def send_backend_response(
             pet_profile_to_send, removed_keys = sanitize_pet_profile_for_ask(pet_profile_to_send)
             if config.BOT_DEBUG and removed_keys:
                 print(f"[PET_PROFILE_CLEAN] removed_keys={sorted(list(removed_keys))}")
-        result = await asyncio.to_thread(
-            ask_backend,
+        if trace is not None:
+            call_span = trace.child("backend.chat_ask", SPAN_KIND_CLIENT, request_id=request_id)
+        result = await ask_backend(
             base_url,
             token,
             user_id,
@@ -256,11 +319,19 @@ async def send_backend_response(
             pro_profile,
             pet_profile_to_send,
             attachments,
+            traceparent=call_span.traceparent() if call_span is not None else None,
         )
         print(f"[BACKEND] status={result.get('status')} ok={result.get('ok')}")
         ok = result.get("ok")
         status = result.get("status")
         error = result.get("error")
+        if call_span is not None:
+            call_span.end(
+                error=not ok,
+                http_status=200 if ok else status or 0,
+                error_code=None if ok else str(error)[:64],
+            )
+            reply_span = trace.child("tg.reply")
         body = result.get("data") if ok else result.get("body")
         if body is None:
             body = error
@@ -287,9 +358,9 @@ async def send_backend_response(
                 answer = (
                     f"{answer}\n\nℹ️ Для лучшего анализа: фото крупно и в фокусе, при хорошем освещении."
                 )
-            await message.reply(f"🧠 Ответ:\n\n{answer}")
+            await pending.answer(f"🧠 Ответ:\n\n{answer}")
         elif status == 0 or body == "backend_unreachable":
-            await message.reply("⚠️ Сервер сейчас недоступен. Попробуйте через пару минут.")
+            await pending.answer("⚠️ Сервер сейчас недоступен. Попробуйте через пару минут.")
         elif status == 429:
             reset_at = None
             limits = result.get("limits")
@@ -308,7 +379,7 @@ async def send_backend_response(
                 reply_markup = InlineKeyboardMarkup(
                     [[InlineKeyboardButton(cta, callback_data="upsell_pro")]]
                 )
-            await message.reply(message_text, reply_markup=reply_markup)
+            await pending.answer(message_text, reply_markup=reply_markup)
         elif status == 402 and (
             body == "vision_limit_exceeded"
             or (isinstance(body, dict) and body.get("error") == "vision_limit_exceeded")
@@ -323,39 +394,212 @@ async def send_backend_response(
             message_text = "📷 Лимит фото на месяц исчерпан."
             if reset_at:
                 message_text = f"{message_text}\nСброс: {reset_at}"
-            await message.reply(message_text)
+            await pending.answer(message_text)
         elif status == 402 and (
             body == "pro_required"
             or (isinstance(body, dict) and body.get("error") == "pro_required")
         ):
-            await message.reply(
+            await pending.answer(
                 "📷 Анализ фото доступен в Pro",
                 reply_markup=build_upsell_keyboard(),
             )
         elif status in (401, 403):
-            await message.reply("Ошибка авторизации между ботом и сервером (BOT_BACKEND_TOKEN).")
+            await pending.answer("Ошибка авторизации между ботом и сервером (BOT_BACKEND_TOKEN).")
         elif status == 502 and (
             error == "vision_not_processed"
             or (isinstance(body, dict) and body.get("error") == "vision_not_processed")
             or (result.get("error") == "vision_not_processed")
         ):
-            await message.reply(
+            await pending.answer(
                 "🖼️ Не удалось распознать фото.\n"
                 "Попробуйте отправить другое фото (крупнее, без размытия) или повторите запрос."
             )
         elif isinstance(status, int) and status >= 500:
-            await message.reply("Сервис временно недоступен. Попробуйте позже.")
+            await pending.answer("Сервис временно недоступен. Попробуйте позже.")
         else:
-            await message.reply("Не удалось обработать запрос. Попробуйте позже.")
+            await pending.answer("Не удалось обработать запрос. Попробуйте позже.")
 
     except Exception as e:
         if config.BOT_DEBUG:
             print(f"[HTTP] error user_id={user_id} err={e}")
         print(f"[question] Backend error for user_id={user_id}: {e}")
-        await message.reply("⚠️ Ошибка, попробуйте позже.")
+        await pending.answer("⚠️ Ошибка, попробуйте позже.")
 
     finally:
+        pending.stop_typing()
         set_waiting_question(user_id)
+        if trace is not None:
+            for span in (call_span, reply_span):
+                if span is not None:
+                    span.end()
+            trace.end(error=not ok, http_status=200 if ok else status or 0)
+
+
+async def _run_ask_job(user_id: int, job: AskJob) -> None:
+    if job.trace is not None:
+        wait_span = job.trace.child("ask_queue.wait", merged=job.merged)
+        wait_span.start_ns = job.trace.start_ns
+        wait_span.end()
+    await _send_backend_response_now(
+        job.client,
+        job.message,
+        user_id,
+        question_text=job.question_text,
+        attachments=job.attachments or None,
+        trace=job.trace,
+        pending=job.pending,
+    )
+
+
+# Один запрос к backend на пользователя за раз; сообщения, пришедшие во время запроса, склеиваются (BOT_COALESCE_WINDOW_MS)
+ask_queue = UserAskQueue(_run_ask_job)
+
+
+async def send_backend_response(
+    client_tg: Client,
+    message: Message,
+    user_id: int,
+    question_text: str | None = None,
+    attachments: list[dict] | None = None,
+) -> None:
+    if question_text is None:
+        profile = get_profile(user_id)
+        question_text = profile.get("question") if profile else None
+    # Трейс вопроса: очередь → /v1/chat/ask (traceparent) → стадии backend → LLM
+    trace = start_trace("tg.question", user_id=user_id, photos=len(attachments or []))
+    job = ask_queue.submit(client_tg, message, user_id, question_text, attachments, trace=trace)
+    if job is not None:
+        # «Обрабатывается» и «печатает…» — сразу, а не когда вопрос дойдёт до backend
+        job.pending = PendingAnswer(client_tg, message)
+
+
+def pick_photo_size(photo):
+    """
+    Размер фото, ближайший к MAX_PHOTO_SIDE сверху: обычно это готовая
+    копия Telegram (~1280px), и скачивать/сжимать оригинал не нужно.
+    """
+    # В разных версиях Pyrogram это может быть:
+    # - один объект Photo (+ thumbs с меньшими размерами)
+    # - список Photo (sizes)
+    if isinstance(photo, list):
+        sizes = list(photo)
+    else:
+        sizes = [photo] + list(getattr(photo, "thumbs", None) or [])
+    sizes = [item for item in sizes if item and getattr(item, "file_id", None)]
+    if not sizes:
+        return None
+    enough = [
+        item for item in sizes
+        if max(getattr(item, "width", 0) or 0, getattr(item, "height", 0) or 0) >= MAX_PHOTO_SIDE
+    ]
+    if enough:
+        return min(enough, key=lambda item: max(item.width, item.height))
+    return max(sizes, key=lambda item: max(getattr(item, "width", 0) or 0, getattr(item, "height", 0) or 0))
+
+
+class PhotoRejected(Exception):
+    """Фото не удалось подготовить; text — ответ пользователю."""
+
+    def __init__(self, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+        super().__init__(text)
+        self.text = text
+        self.reply_markup = reply_markup
+
+
+async def prepare_photo_attachment(client_tg: Client, message: Message, user_id: int) -> dict:
+    """
+    Скачивает фото, сжимает в пуле процессов и загружает в /v1/media/init.
+    Возвращает attachment (source=media) или бросает PhotoRejected.
+    """
+    if not message.photo:
+        raise PhotoRejected("Не удалось получить фото. Попробуйте ещё раз.")
+
+    size = pick_photo_size(message.photo)
+    if not size or not getattr(size, "file_id", None):
+        raise PhotoRejected("Не смог прочитать фото. Попробуйте отправить другое изображение.")
+    if size.file_size is None:
+        raise PhotoRejected(
+            "Не удалось определить размер фото. Пожалуйста, отправьте другое изображение."
+        )
+    if size.file_size > MAX_PHOTO_BYTES:
+        raise PhotoRejected("Слишком большое фото. Максимум 8 МБ.")
+
+    # Фото идёт через временные файлы: Telegram → диск → процесс пула → диск → backend (стримом)
+    with tempfile.TemporaryDirectory(prefix="hvost-photo-") as tmp_dir:
+        src_path = Path(tmp_dir) / "src.jpg"
+        try:
+            await client_tg.download_media(size.file_id, file_name=str(src_path))
+        except Exception:
+            raise PhotoRejected("Не удалось скачать фото. Попробуйте ещё раз.")
+        if not src_path.exists():
+            raise PhotoRejected("Не удалось обработать фото. Попробуйте ещё раз.")
+
+        try:
+            photo_path = Path(
+                await compress_photo_path(str(src_path), str(Path(tmp_dir) / "photo.jpg"))
+            )
+        except PhotoQueueFull:
+            print(f"[PHOTO] queue full user_id={user_id}")
+            raise PhotoRejected("⏳ Сейчас обрабатывается много фото. Отправьте снимок ещё раз через минуту.")
+        except (Image.DecompressionBombError, UnidentifiedImageError, OSError):
+            raise PhotoRejected(
+                "Фото слишком большое или повреждено. Попробуйте другое (крупнее, без размытия)."
+            )
+        except Exception:
+            raise PhotoRejected("Не удалось обработать фото. Попробуйте другое изображение.")
+
+        if photo_path.stat().st_size > MAX_PHOTO_BYTES:
+            raise PhotoRejected("Фото слишком большое даже после сжатия. Попробуйте другое.")
+
+        upload = await upload_media(user_id, photo_path)
+        if not upload.get("ok"):
+            print(
+                f"[BACKEND] upload_media status={upload.get('status')} "
+                f"user_id={user_id} err={upload.get('error')}"
+            )
+            if upload.get("status") == 402:
+                raise PhotoRejected("📷 Анализ фото доступен в Pro", build_upsell_keyboard())
+            if upload.get("status") == 0:
+                raise PhotoRejected("⚠️ Сервер сейчас недоступен. Попробуйте через пару минут.")
+            raise PhotoRejected("Не удалось загрузить фото. Попробуйте другое изображение.")
+
+    return build_media_attachment(upload["data"]["media_id"])
+
+
+async def send_album_response(client_tg: Client, user_id: int, parts: list[tuple[Message, object]]) -> None:
+    """
+    Все фото альбома — один вопрос и один vision-вызов (квота списывается один раз).
+    """
+    message = parts[0][0]
+    attachments = [result for _, result in parts if isinstance(result, dict)]
+    if not attachments:
+        rejected = next((result for _, result in parts if isinstance(result, PhotoRejected)), None)
+        if rejected:
+            await message.reply(rejected.text, reply_markup=rejected.reply_markup)
+        else:
+            await message.reply("Не удалось обработать фото. Попробуйте другое изображение.")
+        return
+    if len(attachments) < len(parts):
+        print(f"[MEDIA_GROUP] user_id={user_id} failed_parts={len(parts) - len(attachments)}")
+    if len(attachments) > MAX_ATTACHMENTS_PER_ASK:
+        attachments = attachments[:MAX_ATTACHMENTS_PER_ASK]
+        await message.reply(
+            f"📷 За один вопрос я смотрю до {MAX_ATTACHMENTS_PER_ASK} фото — разберу первые {MAX_ATTACHMENTS_PER_ASK}."
+        )
+    caption = next(
+        ((part.caption or "").strip() for part, _ in parts if (part.caption or "").strip()),
+        "",
+    ) or "Что на фото?"
+    await send_backend_response(
+        client_tg,
+        message,
+        user_id,
+        question_text=caption,
+        attachments=attachments,
+    )
+
+
+media_groups = MediaGroupBuffer(send_album_response)
 
 
 def setup_question_handlers(app: Client):
@@ -450,65 +694,29 @@ def setup_question_handlers(app: Client):
     @app.on_message(filters.private & filters.photo)
     async def handle_photo_question(client_tg: Client, message: Message):
         user_id = message.from_user.id
-        if not message.photo:
-            await message.reply("Не удалось получить фото. Попробуйте ещё раз.")
-            return
-
-        photo = message.photo
-        # В разных версиях Pyrogram это может быть:
-        # - один объект Photo
-        # - список Photo (sizes)
-        if isinstance(photo, list):
-            largest = max(photo, key=lambda item: item.file_size or 0)
-        else:
-            largest = photo
-
-        if not largest or not getattr(largest, "file_id", None):
-            await message.reply("Не смог прочитать фото. Попробуйте отправить другое изображение.")
-            return
-        if largest.file_size is None:
-            await message.reply(
-                "Не удалось определить размер фото. Пожалуйста, отправьте другое изображение."
+        if message.media_group_id:
+            # Альбом: части копятся в media_groups, в backend уходит один запрос
+            await media_groups.add(
+                client_tg,
+                message,
+                user_id,
+                prepare_photo_attachment(client_tg, message, user_id),
             )
             return
-        if largest.file_size > MAX_PHOTO_BYTES:
-            await message.reply("Слишком большое фото. Максимум 8 МБ.")
-            return
 
         try:
-            raw_file = await client_tg.download_media(largest, in_memory=True)
-        except Exception:
-            await message.reply("Не удалось скачать фото. Попробуйте ещё раз.")
-            return
-
-        raw_bytes = raw_file.getvalue() if hasattr(raw_file, "getvalue") else raw_file
-        if not isinstance(raw_bytes, (bytes, bytearray)):
-            await message.reply("Не удалось обработать фото. Попробуйте ещё раз.")
-            return
-
-        try:
-            compressed = compress_photo_bytes(bytes(raw_bytes))
-        except (Image.DecompressionBombError, UnidentifiedImageError, OSError):
-            await message.reply(
-                "Фото слишком большое или повреждено. Попробуйте другое (крупнее, без размытия)."
-            )
-            return
-        except Exception:
-            await message.reply("Не удалось обработать фото. Попробуйте другое изображение.")
-            return
-
-        if len(compressed) > MAX_PHOTO_BYTES:
-            await message.reply("Фото слишком большое даже после сжатия. Попробуйте другое.")
+            attachment = await prepare_photo_attachment(client_tg, message, user_id)
+        except PhotoRejected as exc:
+            await message.reply(exc.text, reply_markup=exc.reply_markup)
             return
 
         caption = (message.caption or "").strip() or "Что на фото?"
-        attachments = [build_image_attachment(compressed)]
         await send_backend_response(
             client_tg,
             message,
             user_id,
             question_text=caption,
-            attachments=attachments,
+            attachments=[attachment],
         )
 
     @app.on_message(filters.private & filters.text & ~filters.regex(r"^/"))
@@ -529,13 +737,13 @@ def setup_question_handlers(app: Client):
         profile = get_profile(user_id)
         pro_step = get_pro_step(user_id)
         pro_profile = get_pro_profile(user_id)
-        last_limits = get_last_limits(user_id)
 
         handled = await handle_pro_text_step(client_tg, message)
         if handled:
             return
 
-        pro_flag = await is_pro_user(user_id, last_limits)
+        pro_flag = await is_pro_user(user_id)
+        last_limits = get_last_limits(user_id)
         if not profile and pro_flag is True and not is_pro_profile_complete(pro_profile):
             if not get_pending_question(user_id):
                 set_pending_question(user_id, message.text)
@@ -550,9 +758,7 @@ def setup_question_handlers(app: Client):
         if not profile:
             start_profile(user_id)
             set_pending_question(user_id, message.text)
-            profile = get_profile(user_id)
-            if profile:
-                profile["step"] = "pending_details"
+            set_step(user_id, "pending_details")
             await message.reply(
                 "📥 Ваш вопрос принят.\n\n"
                 "Напоминаю, что на Free-тарифе я не запоминаю данные ваших питомцев. "
@@ -573,6 +779,9 @@ def setup_question_handlers(app: Client):
 
         step = profile.get("step")
         if step == "done":
+            # Вопрос ещё в окне склейки — дописываем к нему, а не отвечаем «подождите»
+            if ask_queue.try_coalesce(user_id, message, message.text):
+                return
             await message.reply("⌛ Я уже готовлю ответ. Пожалуйста, подождите…")
             return
         if not step:
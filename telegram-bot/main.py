@@ -1,15 +1,52 @@
-from pyrogram import Client, filters
+import asyncio
+import functools
+import inspect
+import time
+
+from pyrogram import Client, ContinuePropagation, StopPropagation, filters, idle
+from pyrogram.dispatcher import Dispatcher
+from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message
 import config
+from services.backend_client import open_client, close_client
+from services.image_pool import shutdown_image_pool
+from services.metrics import HANDLER_SECONDS, start_metrics_server
+from services.state import start_state_store, stop_state_store
+from services.tracing import shutdown_tracing
+
+
+def _timed_handler(callback):
+    name = getattr(callback, "__name__", "handler")
+
+    @functools.wraps(callback)
+    async def wrapper(client, *args):
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await callback(client, *args)
+        except (StopPropagation, ContinuePropagation):
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name, outcome).observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+class TimedDispatcher(Dispatcher):
+    """
+    Обычный dispatcher Pyrogram, который оборачивает async-хендлеры замером времени
+    (bot_handler_duration_seconds, метка — имя функции хендлера).
+    """
+
+    def add_handler(self, handler, group: int):
+        if inspect.iscoroutinefunction(handler.callback):
+            handler.callback = _timed_handler(handler.callback)
+        super().add_handler(handler, group)
 
-app = Client(
-    "hvostosovet_bot",
-    bot_token=config.BOT_TOKEN,
-    api_id=config.API_ID,
-    api_hash=config.API_HASH
-)
 
-@app.on_message(filters.private & filters.text, group=-1)
 async def log_incoming_private(client_tg: Client, message: Message):
     user_id = message.from_user.id if message.from_user else None
     text = message.text or ""
@@ -25,17 +62,56 @@ async def log_incoming_private(client_tg: Client, message: Message):
             f"has_audio={has_audio} has_document={has_document}"
         )
 
-# ▶️ Подключение всех хендлеров
-from handlers.start import setup_start_handlers
-from handlers.menu import setup_menu_handlers
-from handlers.help import setup_help_handlers
-from handlers.question import setup_question_handlers  #  добавляем анкету
 
-setup_start_handlers(app)
-setup_menu_handlers(app)
-setup_help_handlers(app)
-setup_question_handlers(app)  #  подключаем анкету
+def create_app(name: str = "hvostosovet_bot", **kwargs) -> Client:
+    app = Client(
+        name,
+        bot_token=config.BOT_TOKEN,
+        api_id=config.API_ID,
+        api_hash=config.API_HASH,
+        **kwargs,
+    )
+    app.dispatcher = TimedDispatcher(app)
+    app.add_handler(
+        MessageHandler(log_incoming_private, filters.private & filters.text),
+        group=-1,
+    )
+
+    # ▶️ Подключение всех хендлеров
+    from handlers.start import setup_start_handlers
+    from handlers.menu import setup_menu_handlers
+    from handlers.help import setup_help_handlers
+    from handlers.question import setup_question_handlers  #  добавляем анкету
+
+    setup_start_handlers(app)
+    setup_menu_handlers(app)
+    setup_help_handlers(app)
+    setup_question_handlers(app)  #  подключаем анкету
+    return app
+
+
+# ▶️ Запуск: общий HTTP-пул к backend и хранилище состояний живут столько же, сколько Pyrogram-клиент
+async def main(app: Client):
+    start_metrics_server()
+    await open_client()
+    await start_state_store()
+    try:
+        async with app:
+            print("Бот запущен! 🐾 Жду команд...")
+            await idle()
+    finally:
+        await stop_state_store()
+        await close_client()
+        shutdown_image_pool()
+        await shutdown_tracing()
+
+
+if __name__ == "__main__":
+    if config.BOT_WORKERS > 1:
+        # Один процесс принимает апдейты, BOT_WORKERS процессов их обрабатывают (см. workers.py)
+        from workers import run_receiver
 
-# ▶️ Запуск
-print("Бот запущен! 🐾 Жду команд...")
-app.run()
+        run_receiver(config.BOT_WORKERS)
+    else:
+        bot_app = create_app()
+        bot_app.run(main(bot_app))
@@ -0,0 +1,118 @@
+"""
+Benchmark сжатия фото в боте: старый путь (Pillow прямо в event loop, без draft)
+vs пул процессов (services/image_pool.py).
+
+Меряет photos/sec и лаг event loop (насколько опаздывает таймер 10 мс,
+пока идёт сжатие) — это задержка, которую видят остальные пользователи.
+
+Запуск из папки telegram-bot/:
+    python scripts/bench_photo_compress.py --photos 16 --concurrency 4
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image  # noqa: E402
+
+from services.image_pool import (  # noqa: E402
+    JPEG_QUALITY,
+    MAX_PHOTO_SIDE,
+    PHOTO_WORKERS,
+    compress_photo,
+    shutdown_image_pool,
+)
+
+TICK_SEC = 0.01
+
+
+def make_photo(width: int, height: int) -> bytes:
+    # Градиент + шум: JPEG похож по размеру на реальное фото с телефона
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    image = Image.blend(image, noise, 0.35)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def legacy_compress(raw_bytes: bytes) -> bytes:
+    # Как было в handlers/question.py: полный decode + thumbnail + optimize
+    with Image.open(io.BytesIO(raw_bytes)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+async def _measure_lag(stop: asyncio.Event, lags: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK_SEC)
+        lags.append(max(0.0, loop.time() - started - TICK_SEC))
+
+
+async def _run(label: str, compress, photo: bytes, photos: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    lags: list[float] = []
+
+    async def one() -> int:
+        async with semaphore:
+            return len(await compress(photo))
+
+    lag_task = asyncio.create_task(_measure_lag(stop, lags))
+    started = time.perf_counter()
+    sizes = await asyncio.gather(*(one() for _ in range(photos)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(
+        f"{label:<28} photos/sec={photos / elapsed:7.2f} "
+        f"loop_lag_ms p50={statistics.median(lags_ms):7.1f} p99={p99:7.1f} max={lags_ms[-1]:7.1f} "
+        f"out_kb={sizes[0] // 1024}"
+    )
+
+
+async def main_async(args) -> None:
+    photo = make_photo(args.width, args.height)
+    print(
+        f"input={args.width}x{args.height} size_kb={len(photo) // 1024} "
+        f"photos={args.photos} concurrency={args.concurrency} PHOTO_WORKERS={PHOTO_WORKERS}"
+    )
+
+    async def inline(raw: bytes) -> bytes:
+        return legacy_compress(raw)
+
+    await _run("inline (before)", inline, photo, args.photos, args.concurrency)
+    # Прогрев: первый вызов поднимает процессы пула
+    await compress_photo(photo)
+    await _run("process pool + draft (after)", compress_photo, photo, args.photos, args.concurrency)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Photo compression benchmark")
+    parser.add_argument("--photos", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutdown_image_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Memory benchmark фото-пайплайна бота: пиковая память на одно фото.
+
+legacy — как было до потоковой обработки: download_media(in_memory=True) → getvalue() →
+         bytes() → Pillow → BytesIO.getvalue() → base64 → json.dumps → encode.
+files  — сейчас: файл Telegram на диске → compress_photo_file (файл → файл) →
+         тело запроса читается чанками (_iter_file).
+
+Каждый пайплайн запускается в отдельном процессе; сжатие идёт в этом же процессе
+(в боте оно в пуле), чтобы сравнивать полный путь одного фото.
+Печатается прирост пикового RSS (VmHWM) и пик Python-аллокаций (tracemalloc).
+
+Запуск из папки telegram-bot/:
+    python scripts/bench_photo_memory.py --width 4000 --height 3000
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image  # noqa: E402
+
+from services.backend_client import _iter_file  # noqa: E402
+from services.image_pool import compress_photo_bytes, compress_photo_file  # noqa: E402
+
+
+def make_photo(path: Path, width: int, height: int) -> None:
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    Image.blend(image, noise, 0.35).save(path, format="JPEG", quality=92)
+
+
+def run_legacy(src: Path, tmp_dir: Path) -> int:
+    downloaded = io.BytesIO(src.read_bytes())  # download_media(in_memory=True)
+    raw_bytes = downloaded.getvalue()
+    compressed = compress_photo_bytes(bytes(raw_bytes))
+    data = base64.b64encode(compressed).decode("ascii")
+    payload = {"attachments": [{"type": "image", "source": "inline", "data": data}]}
+    body = json.dumps(payload).encode("utf-8")
+    return len(body)
+
+
+def run_files(src: Path, tmp_dir: Path) -> int:
+    photo_path = Path(compress_photo_file(str(src), str(tmp_dir / "photo.jpg")))
+
+    async def drain() -> int:
+        sent = 0
+        async for chunk in _iter_file(photo_path):
+            sent += len(chunk)
+        return sent
+
+    return asyncio.run(drain())
+
+
+PIPELINES = {"legacy": run_legacy, "files": run_files}
+
+
+def _proc_status_kb(key: str) -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(key + ":"):
+            return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reset_peak_rss() -> None:
+    # Linux: сбрасывает VmHWM до текущего RSS, чтобы пик импорта не маскировал пик пайплайна
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _child(pipeline: str, src: Path) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _reset_peak_rss()
+        base_rss = _proc_status_kb("VmRSS")
+        tracemalloc.start()
+        sent = PIPELINES[pipeline](src, Path(tmp_dir))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_rss = _proc_status_kb("VmHWM")
+    print(json.dumps({"rss_kb": peak_rss - base_rss, "py_peak_kb": peak // 1024, "sent_kb": sent // 1024}))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Photo pipeline memory benchmark")
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--child", choices=sorted(PIPELINES))
+    parser.add_argument("--src")
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, Path(args.src))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = Path(tmp_dir) / "src.jpg"
+        make_photo(src, args.width, args.height)
+        print(f"input={args.width}x{args.height} size_kb={src.stat().st_size // 1024}")
+        for name in ("legacy", "files"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", name, "--src", str(src)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(out)
+            print(
+                f"{name:<8} rss_growth_mb={result['rss_kb'] / 1024:7.1f} "
+                f"python_peak_mb={result['py_peak_kb'] / 1024:7.1f} body_kb={result['sent_kb']}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
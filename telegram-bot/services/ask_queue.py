@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from services.metrics import ASK_QUEUE_DEPTH, ASK_QUEUE_WAIT_SECONDS, HANDLER_SECONDS
+
+# Вопрос, ждущий в очереди за уже идущим запросом, склеивается с сообщениями, пришедшими в пределах окна.
+# Первый вопрос свободного пользователя уходит в backend сразу, без окна
+BOT_COALESCE_WINDOW_MS = int(os.getenv("BOT_COALESCE_WINDOW_MS", "1000"))
+# Дольше этого склейка не держит вопрос, даже если пользователь продолжает писать
+BOT_COALESCE_MAX_WAIT_MS = int(os.getenv("BOT_COALESCE_MAX_WAIT_MS", "4000"))
+# Сколько фото уходит в один запрос (на backend — VISION_MAX_ATTACHMENTS)
+MAX_ATTACHMENTS_PER_ASK = int(os.getenv("BOT_MAX_PHOTOS_PER_ASK", "4"))
+STATS_WINDOW = 500
+STATS_LOG_EVERY = 100
+
+
+@dataclass
+class AskJob:
+    client: Any
+    message: Any  # на последнее сообщение пользователя и отвечаем
+    texts: list[str] = field(default_factory=list)
+    attachments: list[dict] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    last_at: float = field(default_factory=time.monotonic)
+    merged: int = 1
+    # True — вопрос встал за уже идущим запросом: перед отправкой ждём окно склейки
+    queued_behind: bool = False
+    trace: Any = None  # корневой span вопроса (services/tracing.py) или None
+    pending: Any = None  # плейсхолдер «обрабатывается» (handlers/question.py:PendingAnswer) или None
+
+    @property
+    def question_text(self) -> str:
+        return "\n".join(text for text in self.texts if text)
+
+
+class UserAskQueue:
+    """
+    Последовательная очередь вопросов на пользователя: у каждого не больше одного
+    запроса к backend одновременно. Вопрос свободного пользователя уходит сразу;
+    пока идёт запрос, новые сообщения копятся и склеиваются в следующий вопрос.
+    Общий лимит запросов к backend — семафор в services/backend_client.py.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[int, AskJob], Awaitable[None]],
+        window_ms: int = BOT_COALESCE_WINDOW_MS,
+        max_wait_ms: int = BOT_COALESCE_MAX_WAIT_MS,
+    ):
+        self._runner = runner
+        self.window_sec = max(0, window_ms) / 1000
+        self.max_wait_sec = max(window_ms, max_wait_ms) / 1000
+        self._pending: dict[int, deque[AskJob]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._wait_ms: deque[float] = deque(maxlen=STATS_WINDOW)
+        self.jobs_total = 0
+        self.merged_total = 0
+
+    def _can_merge(self, job: AskJob, attachments: list[dict], now: float) -> bool:
+        return (
+            now - job.last_at <= self.window_sec
+            and now - job.enqueued_at <= self.max_wait_sec
+            and len(job.attachments) + len(attachments) <= MAX_ATTACHMENTS_PER_ASK
+        )
+
+    def submit(
+        self,
+        client,
+        message,
+        user_id: int,
+        text: str | None,
+        attachments: list[dict] | None = None,
+        trace=None,
+    ) -> AskJob | None:
+        """
+        Новый вопрос в очереди или None, если сообщение склеено с уже ждущим.
+        """
+        attachments = list(attachments or [])
+        now = time.monotonic()
+        queue = self._pending.setdefault(user_id, deque())
+        last = queue[-1] if queue else None
+        if last is not None and self._can_merge(last, attachments, now):
+            self._merge(last, message, text, attachments, now)
+            if trace is not None:
+                # Склеенное сообщение продолжает трейс первого вопроса
+                trace.end(merged_into=last.trace.trace_id if last.trace is not None else None)
+            job = None
+        else:
+            job = AskJob(
+                client=client,
+                message=message,
+                texts=[(text or "").strip()],
+                attachments=attachments,
+                enqueued_at=now,
+                last_at=now,
+                queued_behind=user_id in self._workers,
+                trace=trace,
+            )
+            queue.append(job)
+            ASK_QUEUE_DEPTH.inc()
+        if user_id not in self._workers:
+            self._workers[user_id] = asyncio.create_task(self._drain(user_id))
+        return job
+
+    def try_coalesce(self, user_id: int, message, text: str | None) -> bool:
+        """
+        Дописывает текст к ещё не отправленному вопросу пользователя.
+        False — вопрос уже ушёл в backend (или его нет).
+        """
+        queue = self._pending.get(user_id)
+        if not queue:
+            return False
+        now = time.monotonic()
+        last = queue[-1]
+        if not self._can_merge(last, [], now):
+            return False
+        self._merge(last, message, text, [], now)
+        return True
+
+    def _merge(self, job: AskJob, message, text: str | None, attachments: list[dict], now: float) -> None:
+        job.texts.append((text or "").strip())
+        job.attachments.extend(attachments)
+        job.message = message
+        job.last_at = now
+        job.merged += 1
+        self.merged_total += 1
+
+    async def _drain(self, user_id: int) -> None:
+        queue = self._pending[user_id]
+        try:
+            while queue:
+                job = queue[0]
+                # Вопрос, ждавший чужой запрос, ещё window собирает сообщения (но не дольше max_wait);
+                # первый вопрос свободного пользователя не ждёт
+                while job.queued_behind:
+                    now = time.monotonic()
+                    deadline = min(job.last_at + self.window_sec, job.enqueued_at + self.max_wait_sec)
+                    if now >= deadline:
+                        break
+                    await asyncio.sleep(deadline - now)
+                queue.popleft()
+                ASK_QUEUE_DEPTH.dec()
+                wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+                self._wait_ms.append(wait_ms)
+                ASK_QUEUE_WAIT_SECONDS.observe(wait_ms / 1000)
+                self.jobs_total += 1
+                print(
+                    f"[ASK_QUEUE] user_id={user_id} merged={job.merged} "
+                    f"attachments={len(job.attachments)} wait_ms={wait_ms:.0f} "
+                    f"depth={self.depth()} users={len(self._workers)}"
+                )
+                if self.jobs_total % STATS_LOG_EVERY == 0:
+                    print(f"[ASK_QUEUE_STATS] {self.stats()}")
+                started = time.perf_counter()
+                outcome = "ok"
+                try:
+                    await self._runner(user_id, job)
+                except Exception as exc:
+                    outcome = "error"
+                    print(f"[ASK_QUEUE] job failed user_id={user_id} err={type(exc).__name__}: {exc}")
+                finally:
+                    HANDLER_SECONDS.labels("ask_job", outcome).observe(time.perf_counter() - started)
+        finally:
+            self._workers.pop(user_id, None)
+            if not queue:
+                self._pending.pop(user_id, None)
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_ms)
+
+        def pct(value: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * value))], 1)
+
+        return {
+            "depth": self.depth(),
+            "active_users": len(self._workers),
+            "jobs_total": self.jobs_total,
+            "merged_total": self.merged_total,
+            "wait_ms_p50": pct(0.5),
+            "wait_ms_p95": pct(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+        }
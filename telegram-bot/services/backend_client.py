@@ -1,11 +1,109 @@
+import asyncio
 import json
 import os
+import time
 import uuid
-from urllib import request
-from urllib.error import HTTPError, URLError
+from pathlib import Path
 
+import httpx
 
-def ask_backend(
+from services.metrics import BACKEND_SECONDS
+
+# Таймауты по эндпоинтам (сек): /v1/chat/ask ждёт LLM, остальное — быстрые запросы
+ASK_TIMEOUT_SEC = 90
+SAVE_PET_TIMEOUT_SEC = 15
+GET_PET_TIMEOUT_SEC = 10
+GET_ME_TIMEOUT_SEC = 5
+UPLOAD_TIMEOUT_SEC = 30
+CONNECT_TIMEOUT_SEC = 5
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+# Один общий keep-alive пул на процесс бота + ограничение одновременных запросов к backend
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "20"))
+BACKEND_MAX_CONCURRENCY = int(os.getenv("BACKEND_MAX_CONCURRENCY", "50"))
+
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+async def open_client() -> httpx.AsyncClient:
+    """
+    Создаёт общий httpx.AsyncClient. Вызывается один раз при старте бота (main.py).
+    """
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_CONNECTIONS,
+                keepalive_expiry=30,
+            ),
+            timeout=httpx.Timeout(ASK_TIMEOUT_SEC, connect=CONNECT_TIMEOUT_SEC),
+        )
+        _semaphore = asyncio.Semaphore(BACKEND_MAX_CONCURRENCY)
+    return _client
+
+
+async def close_client() -> None:
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+def _backend_config() -> tuple[str, str]:
+    base_url = os.getenv("BACKEND_BASE_URL", "").strip().rstrip("/")
+    token = os.getenv("BOT_BACKEND_TOKEN", "").strip()
+    return base_url, token
+
+
+async def _send(
+    method: str,
+    url: str,
+    *,
+    timeout: float,
+    headers: dict,
+    with_headers: bool = False,
+    **kwargs,
+):
+    """
+    Отправляет запрос через общий пул и возвращает (status_code, raw_body),
+    с with_headers=True — (status_code, raw_body, response_headers).
+    Сетевые ошибки и таймауты → (0, b""). Отмена задачи (CancelledError)
+    не глотается: httpx закрывает соединение, слот семафора освобождается.
+    """
+    client = await open_client()
+    path = httpx.URL(url).path
+    started = time.perf_counter()
+    status = "error"
+    failed = (0, b"", httpx.Headers()) if with_headers else (0, b"")
+    try:
+        # Время включает ожидание слота семафора — это тоже задержка для пользователя
+        async with _semaphore:
+            resp = await client.request(
+                method,
+                url,
+                headers=headers,
+                timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT_SEC),
+                **kwargs,
+            )
+        status = str(resp.status_code)
+    except httpx.TimeoutException:
+        status = "timeout"
+        print(f"[BACKEND] timeout method={method} path={path} timeout={timeout}")
+        return failed
+    except httpx.TransportError as exc:
+        print(f"[BACKEND] unreachable method={method} path={path} err={type(exc).__name__}")
+        return failed
+    finally:
+        BACKEND_SECONDS.labels(method, path, status).observe(time.perf_counter() - started)
+    if with_headers:
+        return resp.status_code, resp.content, resp.headers
+    return resp.status_code, resp.content
+
+
+async def ask_backend(
     base_url: str,
     token: str,
     telegram_user_id: int,
@@ -15,6 +113,7 @@ def ask_backend(
     profile: dict | None = None,
     pet_profile: dict | None = None,
     attachments: list[dict] | None = None,
+    traceparent: str | None = None,
 ) -> dict:
     if not base_url or not token:
         raise RuntimeError("missing_backend_config")
@@ -32,25 +131,23 @@ def ask_backend(
     if attachments:
         payload["attachments"] = attachments
     data = json.dumps(payload).encode("utf-8")
-    req = request.Request(
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "X-Request-Id": request_id,
+        "Content-Type": "application/json",
+    }
+    if traceparent:
+        # W3C Trace Context: backend продолжает трейс бота (services/tracing.py)
+        headers["traceparent"] = traceparent
+
+    status_code, raw = await _send(
+        "POST",
         f"{base_url}/v1/chat/ask",
-        data=data,
-        method="POST",
-        headers={
-            "Authorization": f"Bearer {token}",
-            "X-Request-Id": request_id,
-            "Content-Type": "application/json",
-        },
+        timeout=ASK_TIMEOUT_SEC,
+        headers=headers,
+        content=data,
     )
-
-    try:
-        with request.urlopen(req, timeout=90) as resp:
-            status_code = resp.getcode()
-            raw = resp.read()
-    except HTTPError as exc:
-        status_code = exc.code
-        raw = exc.read()
-    except URLError as exc:
+    if status_code == 0:
         return {
             "ok": False,
             "status": 0,
@@ -86,12 +183,11 @@ def ask_backend(
     }
 
 
-def save_active_pet_profile(telegram_user_id: int, pet_profile: dict) -> dict:
+async def save_active_pet_profile(telegram_user_id: int, pet_profile: dict) -> dict:
     """
     Calls POST /v1/pets/active/save and returns response dict.
     """
-    base_url = os.getenv("BACKEND_BASE_URL", "").strip().rstrip("/")
-    token = os.getenv("BOT_BACKEND_TOKEN", "").strip()
+    base_url, token = _backend_config()
     if not base_url or not token:
         print("[BACKEND] missing config for save_active_pet_profile")
         return {"ok": False, "status": 0, "error": "missing_backend_config"}
@@ -102,25 +198,18 @@ def save_active_pet_profile(telegram_user_id: int, pet_profile: dict) -> dict:
     }
     data = json.dumps(payload).encode("utf-8")
     request_id = str(uuid.uuid4())
-    req = request.Request(
+    status_code, raw = await _send(
+        "POST",
         f"{base_url}/v1/pets/active/save",
-        data=data,
-        method="POST",
+        timeout=SAVE_PET_TIMEOUT_SEC,
         headers={
             "Authorization": f"Bearer {token}",
             "X-Request-Id": request_id,
             "Content-Type": "application/json",
         },
+        content=data,
     )
-
-    try:
-        with request.urlopen(req, timeout=15) as resp:
-            status_code = resp.getcode()
-            raw = resp.read()
-    except HTTPError as exc:
-        status_code = exc.code
-        raw = exc.read()
-    except URLError as exc:
+    if status_code == 0:
         return {
             "ok": False,
             "status": 0,
@@ -150,32 +239,97 @@ def save_active_pet_profile(telegram_user_id: int, pet_profile: dict) -> dict:
     }
 
 
-def get_active_pet(telegram_user_id: int) -> dict | str | None:
+async def _iter_file(path: Path):
+    # Тело запроса читается с диска чанками — файл целиком в память не попадает;
+    # open/read в потоке, чтобы большой файл не тормозил обработку апдейтов
+    fh = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(fh.read, UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        fh.close()
+
+
+async def upload_media(
+    telegram_user_id: int,
+    image: bytes | Path,
+    mime: str = "image/jpeg",
+) -> dict:
+    """
+    Calls POST /v1/media/init with raw image bytes (or a file streamed from disk)
+    and returns response dict. On success data contains media_id for attachments (source=media).
+    """
+    base_url, token = _backend_config()
+    if not base_url or not token:
+        print("[BACKEND] missing config for upload_media")
+        return {"ok": False, "status": 0, "error": "missing_backend_config"}
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": mime,
+    }
+    if isinstance(image, Path):
+        headers["Content-Length"] = str(image.stat().st_size)
+        content = _iter_file(image)
+    else:
+        content = image
+    status_code, raw = await _send(
+        "POST",
+        f"{base_url}/v1/media/init",
+        timeout=UPLOAD_TIMEOUT_SEC,
+        headers=headers,
+        params={"telegram_user_id": telegram_user_id},
+        content=content,
+    )
+    if status_code == 0:
+        return {
+            "ok": False,
+            "status": 0,
+            "error": "backend_unreachable",
+        }
+
+    body = {}
+    if raw:
+        try:
+            body = json.loads(raw.decode("utf-8"))
+        except json.JSONDecodeError:
+            body = {}
+
+    if status_code == 200 and isinstance(body, dict) and body.get("media_id"):
+        return {"ok": True, "data": body}
+
+    error = "unknown_error"
+    if isinstance(body, dict):
+        error = body.get("error") or "unknown_error"
+
+    return {
+        "ok": False,
+        "status": status_code,
+        "error": error,
+    }
+
+
+async def get_active_pet(telegram_user_id: int) -> dict | str | None:
     """
     Calls GET /v1/pets/active and returns pet dict, status string, or None.
     """
-    base_url = os.getenv("BACKEND_BASE_URL", "").strip().rstrip("/")
-    token = os.getenv("BOT_BACKEND_TOKEN", "").strip()
+    base_url, token = _backend_config()
     if not base_url or not token:
         print("[BACKEND] missing config for get_active_pet")
         return None
 
-    url = f"{base_url}/v1/pets/active?telegram_user_id={telegram_user_id}"
-    req = request.Request(
-        url,
-        method="GET",
+    status_code, raw = await _send(
+        "GET",
+        f"{base_url}/v1/pets/active",
+        timeout=GET_PET_TIMEOUT_SEC,
         headers={"Authorization": f"Bearer {token}"},
+        params={"telegram_user_id": telegram_user_id},
     )
-
-    try:
-        with request.urlopen(req, timeout=10) as resp:
-            status_code = resp.getcode()
-            raw = resp.read()
-    except HTTPError as exc:
-        status_code = exc.code
-        raw = exc.read()
-    except URLError as exc:
-        print(f"[BACKEND] get_active_pet unreachable user_id={telegram_user_id} err={exc}")
+    if status_code == 0:
+        print(f"[BACKEND] get_active_pet unreachable user_id={telegram_user_id}")
         return None
 
     body = {}
@@ -208,3 +362,42 @@ def get_active_pet(telegram_user_id: int) -> dict | str | None:
 
     print(f"[BACKEND] get_active_pet status={status_code} user_id={telegram_user_id} err={body}")
     return None
+
+
+async def get_me(telegram_user_id: int, etag: str | None = None) -> dict | None:
+    """
+    Calls GET /v1/me and returns {"plan", "limits", ..., "etag"} or None if backend is unavailable.
+    With etag (from the previous answer) sends If-None-Match: unchanged data gives
+    {"not_modified": True, "etag": ...} without a body — use the cached limits.
+    """
+    base_url, token = _backend_config()
+    if not base_url or not token:
+        print("[BACKEND] missing config for get_me")
+        return None
+
+    headers = {"Authorization": f"Bearer {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    status_code, raw, resp_headers = await _send(
+        "GET",
+        f"{base_url}/v1/me",
+        timeout=GET_ME_TIMEOUT_SEC,
+        headers=headers,
+        params={"telegram_user_id": telegram_user_id},
+        with_headers=True,
+    )
+    if status_code == 304:
+        return {"not_modified": True, "etag": resp_headers.get("etag") or etag}
+    if status_code != 200:
+        if status_code:
+            print(f"[BACKEND] get_me status={status_code} user_id={telegram_user_id}")
+        return None
+    try:
+        body = json.loads(raw.decode("utf-8"))
+    except json.JSONDecodeError:
+        print(f"[BACKEND] get_me invalid json user_id={telegram_user_id}")
+        return None
+    if not isinstance(body, dict) or not isinstance(body.get("limits"), dict):
+        return None
+    body["etag"] = resp_headers.get("etag")
+    return body
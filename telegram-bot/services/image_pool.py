@@ -0,0 +1,108 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from services.metrics import PHOTO_COMPRESS_SECONDS, PHOTO_QUEUE_DEPTH
+
+Image.MAX_IMAGE_PIXELS = 20_000_000
+MAX_PHOTO_SIDE = 1280
+JPEG_QUALITY = 70
+
+# Сжатие фото идёт в отдельных процессах: Pillow не блокирует event loop и GIL бота
+PHOTO_WORKERS = max(1, int(os.getenv("PHOTO_WORKERS", "2")))
+# Сколько фото может одновременно ждать/сжиматься; сверх лимита — сразу отказ (backpressure)
+PHOTO_QUEUE_MAX = max(1, int(os.getenv("PHOTO_QUEUE_MAX", "8")))
+
+_executor: ProcessPoolExecutor | None = None
+_in_flight = 0
+
+
+class PhotoQueueFull(RuntimeError):
+    pass
+
+
+def compress_photo_bytes(raw_bytes: bytes) -> bytes:
+    """
+    Выполняется в процессе пула. Для JPEG draft() декодирует сразу
+    в уменьшенном масштабе (1/2, 1/4, 1/8) — в разы быстрее полного decode.
+    """
+    with Image.open(io.BytesIO(raw_bytes)) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        image = image.convert("RGB")
+        image.thumbnail((MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+def compress_photo_file(src_path: str, dst_path: str) -> str:
+    """
+    Файл → файл в процессе пула: между процессами передаются только пути, не байты.
+    JPEG, который уже не больше MAX_PHOTO_SIDE, не перекодируется — возвращается src_path.
+    """
+    with Image.open(src_path) as image:
+        if image.format == "JPEG" and max(image.size) <= MAX_PHOTO_SIDE:
+            image.verify()
+            return src_path
+        if image.format == "JPEG":
+            image.draft("RGB", (MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        image = image.convert("RGB")
+        image.thumbnail((MAX_PHOTO_SIDE, MAX_PHOTO_SIDE))
+        image.save(dst_path, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return dst_path
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: fork процесса с event loop и потоками httpx небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=PHOTO_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def photo_queue_depth() -> int:
+    return _in_flight
+
+
+async def _run_in_pool(fn, *args):
+    """
+    Запускает fn в пуле процессов. Если в работе уже PHOTO_QUEUE_MAX фото —
+    PhotoQueueFull (хендлер отвечает пользователю «попробуйте позже»).
+    """
+    global _in_flight
+    if _in_flight >= PHOTO_QUEUE_MAX:
+        raise PhotoQueueFull("photo_queue_full")
+    _in_flight += 1
+    PHOTO_QUEUE_DEPTH.inc()
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+        PHOTO_QUEUE_DEPTH.dec()
+        PHOTO_COMPRESS_SECONDS.labels(fn.__name__).observe(time.perf_counter() - started)
+
+
+async def compress_photo(raw_bytes: bytes) -> bytes:
+    return await _run_in_pool(compress_photo_bytes, raw_bytes)
+
+
+async def compress_photo_path(src_path: str, dst_path: str) -> str:
+    return await _run_in_pool(compress_photo_file, src_path, dst_path)
+
+
+def shutdown_image_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+# Части альбома (одинаковый media_group_id) приходят отдельными сообщениями почти одновременно
+BOT_MEDIA_GROUP_WINDOW_MS = int(os.getenv("BOT_MEDIA_GROUP_WINDOW_MS", "800"))
+
+
+@dataclass
+class MediaGroup:
+    client: Any
+    user_id: int
+    last_at: float = field(default_factory=time.monotonic)
+    pending: int = 0
+    # (message, результат обработки части или исключение)
+    parts: list[tuple[Any, Any]] = field(default_factory=list)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class MediaGroupBuffer:
+    """
+    Собирает части альбома: каждая часть обрабатывается сразу (скачивание/сжатие/загрузка
+    идут параллельно), а on_ready вызывается один раз — когда новых частей нет
+    дольше окна и все начатые части готовы.
+    """
+
+    def __init__(
+        self,
+        on_ready: Callable[[Any, int, list[tuple[Any, Any]]], Awaitable[None]],
+        window_ms: int = BOT_MEDIA_GROUP_WINDOW_MS,
+    ):
+        self._on_ready = on_ready
+        self.window_sec = max(0, window_ms) / 1000
+        self._groups: dict[str, MediaGroup] = {}
+
+    async def add(self, client, message, user_id: int, work: Awaitable) -> None:
+        group_id = str(message.media_group_id)
+        group = self._groups.get(group_id)
+        if group is None:
+            group = MediaGroup(client=client, user_id=user_id)
+            self._groups[group_id] = group
+            asyncio.create_task(self._flush_when_ready(group_id, group))
+        group.last_at = time.monotonic()
+        group.pending += 1
+        try:
+            result = await work
+        except Exception as exc:
+            result = exc
+        finally:
+            group.pending -= 1
+        group.parts.append((message, result))
+        group.changed.set()
+
+    async def _flush_when_ready(self, group_id: str, group: MediaGroup) -> None:
+        try:
+            while True:
+                wait = group.last_at + self.window_sec - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                if group.pending > 0:
+                    group.changed.clear()
+                    await group.changed.wait()
+                    continue
+                break
+        finally:
+            self._groups.pop(group_id, None)
+        parts = sorted(group.parts, key=lambda item: item[0].id)
+        print(f"[MEDIA_GROUP] user_id={group.user_id} group={group_id} parts={len(parts)}")
+        try:
+            await self._on_ready(group.client, group.user_id, parts)
+        except Exception as exc:
+            print(f"[MEDIA_GROUP] on_ready failed user_id={group.user_id} err={type(exc).__name__}: {exc}")
@@ -0,0 +1,84 @@
+import glob
+import os
+import tempfile
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from prometheus_client import multiprocess
+
+# Порт /metrics бота (0 = выкл). При BOT_WORKERS>1 сервер один — в receiver,
+# воркеры пишут значения в PROMETHEUS_MULTIPROC_DIR, receiver их суммирует.
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0") or 0)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_duration_seconds",
+    "Pyrogram handler and ask job latency",
+    ["handler", "outcome"],
+    buckets=BUCKETS,
+)
+BACKEND_SECONDS = Histogram(
+    "bot_backend_request_duration_seconds",
+    "Backend HTTP call latency",
+    ["method", "path", "status"],
+    buckets=BUCKETS,
+)
+PHOTO_COMPRESS_SECONDS = Histogram(
+    "bot_photo_compress_seconds",
+    "Photo compression time in the process pool (including wait for a worker)",
+    ["kind"],
+    buckets=BUCKETS,
+)
+PHOTO_QUEUE_DEPTH = Gauge(
+    "bot_photo_queue_depth",
+    "Photos being compressed or waiting for the pool",
+    multiprocess_mode="livesum",
+)
+ASK_QUEUE_DEPTH = Gauge(
+    "bot_ask_queue_depth",
+    "Questions waiting in per-user ask queues",
+    multiprocess_mode="livesum",
+)
+ASK_QUEUE_WAIT_SECONDS = Histogram(
+    "bot_ask_queue_wait_seconds",
+    "Time from first message to backend call (coalescing window included)",
+    buckets=BUCKETS,
+)
+TRACE_SPANS_DROPPED = Counter(
+    "bot_trace_spans_dropped_total",
+    "Finished spans not exported",
+    ["reason"],  # buffer_full | export_failed
+)
+
+
+def prepare_multiprocess_dir() -> str:
+    """
+    Для BOT_WORKERS>1: каталог значений метрик до запуска воркеров (переменная наследуется при spawn).
+    Старые файлы прошлых запусков удаляются.
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR", "").strip()
+    if not path:
+        path = tempfile.mkdtemp(prefix="bot-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+    return path
+
+
+def start_metrics_server(multiprocess_dir: str | None = None) -> None:
+    if not BOT_METRICS_PORT:
+        return
+    if multiprocess_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=multiprocess_dir)
+        start_http_server(BOT_METRICS_PORT, registry=registry)
+    else:
+        start_http_server(BOT_METRICS_PORT)
+    print(f"[METRICS] http://0.0.0.0:{BOT_METRICS_PORT}/metrics")
+
+
+def mark_process_dead() -> None:
+    # livesum-гейджи остановленного воркера не должны оставаться в сумме
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,6 +1,12 @@
-from collections import defaultdict
+import os
+import time
 
-_user_profiles = defaultdict(dict)
+from services.state_store import UserState, create_state_backend
+
+# Хранилище состояний: memory (LRU + TTL) или sqlite (BOT_STATE_BACKEND)
+_backend = create_state_backend()
+# Сколько кэш тарифа/лимитов (last_limits) считается свежим без запроса GET /v1/me
+BOT_LIMITS_TTL_SEC = int(os.getenv("BOT_LIMITS_TTL_SEC", "600"))
 
 PRO_STEP_NONE = "pro_none"
 PRO_STEP_SPECIES = "pro_species"
@@ -29,74 +35,108 @@ PRO_STEP_LIFE_ACTIVITY = "life_activity"
 PRO_STEP_LIFE_WALKS = "life_walks"
 
 
+def _get_state(user_id: int) -> UserState | None:
+    return _backend.get(user_id)
+
+
+def _get_state_for_write(user_id: int) -> UserState:
+    state = _backend.get(user_id)
+    if state is None:
+        state = UserState()
+        _backend.put(user_id, state)
+    else:
+        _backend.mark_dirty(user_id)
+    return state
+
+
+async def start_state_store() -> None:
+    await _backend.start()
+
+
+async def stop_state_store() -> None:
+    await _backend.stop()
+
+
+
 def get_profile(user_id: int) -> dict | None:
-    return _user_profiles.get(user_id)
+    state = _get_state(user_id)
+    if state is None:
+        return None
+    return state.to_dict()
 
 
 def get_pro_profile(user_id: int) -> dict:
-    p = _user_profiles.get(user_id) or {}
-    return p.get("profile") or {}
+    state = _get_state(user_id)
+    if state is None or not state.profile:
+        return {}
+    # Вызывающий код может менять профиль на месте — помечаем для записи
+    _backend.mark_dirty(user_id)
+    return state.profile
 
 
 def set_pro_profile(user_id: int, profile: dict) -> None:
-    p = _user_profiles[user_id]
-    p["profile"] = profile
-    p["pet_profile"] = profile
+    state = _get_state_for_write(user_id)
+    state.profile = profile
+    state.pet_profile = profile
 
 
 def get_pet_profile(user_id: int) -> dict | None:
-    p = _user_profiles.get(user_id) or {}
-    return p.get("pet_profile")
+    state = _get_state(user_id)
+    if state is None:
+        return None
+    if state.pet_profile is not None:
+        _backend.mark_dirty(user_id)
+    return state.pet_profile
 
 
 def set_pet_profile(user_id: int, profile: dict) -> None:
-    p = _user_profiles[user_id]
-    p["pet_profile"] = profile
+    state = _get_state_for_write(user_id)
+    state.pet_profile = profile
 
 
 def get_pet_profile_loaded(user_id: int) -> bool:
-    p = _user_profiles.get(user_id) or {}
-    return bool(p.get("pet_profile_loaded"))
+    state = _get_state(user_id)
+    return bool(state and state.pet_profile_loaded)
 
 
 def set_pet_profile_loaded(user_id: int, loaded: bool) -> None:
-    p = _user_profiles[user_id]
-    p["pet_profile_loaded"] = loaded
+    state = _get_state_for_write(user_id)
+    state.pet_profile_loaded = loaded
 
 
 def set_profile_dirty(user_id: int, value: bool) -> None:
-    p = _user_profiles[user_id]
-    p["profile_dirty"] = bool(value)
+    state = _get_state_for_write(user_id)
+    state.profile_dirty = bool(value)
 
 
 def is_profile_dirty(user_id: int) -> bool:
-    p = _user_profiles.get(user_id) or {}
-    return bool(p.get("profile_dirty"))
+    state = _get_state(user_id)
+    return bool(state and state.profile_dirty)
 
 
 def set_profile_saving(user_id: int, value: bool) -> None:
-    p = _user_profiles[user_id]
-    p["profile_saving"] = bool(value)
+    state = _get_state_for_write(user_id)
+    state.profile_saving = bool(value)
 
 
 def is_profile_saving(user_id: int) -> bool:
-    p = _user_profiles.get(user_id) or {}
-    return bool(p.get("profile_saving"))
+    state = _get_state(user_id)
+    return bool(state and state.profile_saving)
 
 
 def set_skip_basic_info(user_id: int, value: bool) -> None:
-    p = _user_profiles[user_id]
-    p["skip_basic_info"] = bool(value)
+    state = _get_state_for_write(user_id)
+    state.skip_basic_info = bool(value)
 
 
 def get_skip_basic_info(user_id: int) -> bool:
-    p = _user_profiles.get(user_id) or {}
-    return bool(p.get("skip_basic_info"))
+    state = _get_state(user_id)
+    return bool(state and state.skip_basic_info)
 
 
 def set_profile_field(user_id: int, path: str, value) -> None:
-    p = _user_profiles[user_id]
-    profile = p.get("profile") or p.get("pet_profile") or {}
+    state = _get_state_for_write(user_id)
+    profile = state.profile or state.pet_profile or {}
     cursor = profile
     parts = path.split(".")
     for part in parts[:-1]:
@@ -106,57 +146,60 @@ def set_profile_field(user_id: int, path: str, value) -> None:
             cursor[part] = node
         cursor = node
     cursor[parts[-1]] = value
-    p["profile"] = profile
-    p["pet_profile"] = profile
+    state.profile = profile
+    state.pet_profile = profile
 
 
 def get_pro_step(user_id: int) -> str:
-    p = _user_profiles.get(user_id) or {}
-    return p.get("pro_step") or PRO_STEP_NONE
+    state = _get_state(user_id)
+    return (state.pro_step if state else None) or PRO_STEP_NONE
 
 
 def set_pro_step(user_id: int, step: str, awaiting_button: bool) -> None:
-    p = _user_profiles[user_id]
-    p["pro_step"] = step
-    p["awaiting_button"] = awaiting_button
+    state = _get_state_for_write(user_id)
+    state.pro_step = step
+    state.awaiting_button = awaiting_button
 
 
 def is_awaiting_button(user_id: int) -> bool:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return False
-    return bool(p.get("awaiting_button"))
+    return bool(state.awaiting_button)
 
 
 def get_pro_temp(user_id: int) -> dict:
-    p = _user_profiles.get(user_id) or {}
-    return p.get("pro_temp") or {}
+    state = _get_state(user_id)
+    return (state.pro_temp if state else None) or {}
 
 
 def set_pro_temp_field(user_id: int, key: str, value) -> None:
-    p = _user_profiles[user_id]
-    temp = p.get("pro_temp") or {}
+    state = _get_state_for_write(user_id)
+    temp = state.pro_temp or {}
     temp[key] = value
-    p["pro_temp"] = temp
+    state.pro_temp = temp
 
 
 def reset_pro_profile(user_id: int) -> None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return
-    p.pop("profile", None)
-    p.pop("pro_step", None)
-    p.pop("awaiting_button", None)
-    p.pop("pro_temp", None)
-    p.pop("pro_profile_created_shown", None)
-    p.pop("last_limits", None)
-    p.pop("profile_dirty", None)
-    p.pop("profile_saving", None)
+    _backend.mark_dirty(user_id)
+    state.profile = None
+    state.pro_step = None
+    state.awaiting_button = None
+    state.pro_temp = None
+    state.pro_profile_created_shown = None
+    state.last_limits = None
+    state.last_limits_at = None
+    state.me_etag = None
+    state.profile_dirty = None
+    state.profile_saving = None
 
 
 def add_health_tag(user_id: int, tag: str) -> None:
-    p = _user_profiles[user_id]
-    profile = p.get("profile") or {}
+    state = _get_state_for_write(user_id)
+    profile = state.profile or {}
     health = profile.get("health") or {}
     tags = health.get("tags") or []
     if tag not in tags:
@@ -164,21 +207,21 @@ def add_health_tag(user_id: int, tag: str) -> None:
     health["tags"] = tags
     health["notes_by_tag"] = health.get("notes_by_tag") or {}
     profile["health"] = health
-    p["profile"] = profile
-    p["pet_profile"] = profile
+    state.profile = profile
+    state.pet_profile = profile
 
 
 def set_health_note(user_id: int, tag: str, note: str) -> None:
-    p = _user_profiles[user_id]
-    profile = p.get("profile") or {}
+    state = _get_state_for_write(user_id)
+    profile = state.profile or {}
     health = profile.get("health") or {}
     notes_by_tag = health.get("notes_by_tag") or {}
     notes_by_tag[tag] = note
     health["notes_by_tag"] = notes_by_tag
     health["tags"] = health.get("tags") or []
     profile["health"] = health
-    p["profile"] = profile
-    p["pet_profile"] = profile
+    state.profile = profile
+    state.pet_profile = profile
 
 
 def set_health_category(user_id: int, category: str | None) -> None:
@@ -193,28 +236,47 @@ def set_owner_note(user_id: int, note: str) -> None:
     set_profile_field(user_id, "owner_note", note)
 
 
-def get_last_limits(user_id: int) -> dict | None:
-    p = _user_profiles.get(user_id)
-    if not p:
+def get_last_limits(user_id: int, fresh_only: bool = False) -> dict | None:
+    """
+    fresh_only=True — только если лимиты обновлялись не раньше BOT_LIMITS_TTL_SEC назад.
+    """
+    state = _get_state(user_id)
+    if not state:
         return None
-    return p.get("last_limits")
+    if fresh_only and (
+        state.last_limits_at is None or time.time() - state.last_limits_at >= BOT_LIMITS_TTL_SEC
+    ):
+        return None
+    return state.last_limits
 
 
-def set_last_limits(user_id: int, limits: dict | None) -> None:
-    p = _user_profiles[user_id]
-    p["last_limits"] = limits
+def set_last_limits(user_id: int, limits: dict | None, me_etag: str | None = None) -> None:
+    """
+    me_etag — только для лимитов из GET /v1/me; лимиты из ответа chat/ask ETag сбрасывают.
+    """
+    state = _get_state_for_write(user_id)
+    state.last_limits = limits
+    state.last_limits_at = time.time() if limits is not None else None
+    state.me_etag = me_etag if limits is not None else None
+
+
+def get_me_etag(user_id: int) -> str | None:
+    state = _get_state(user_id)
+    if not state or state.last_limits is None:
+        return None
+    return state.me_etag
 
 
 def get_profile_created_shown(user_id: int) -> bool:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return False
-    return bool(p.get("pro_profile_created_shown"))
+    return bool(state.pro_profile_created_shown)
 
 
 def set_profile_created_shown(user_id: int, shown: bool) -> None:
-    p = _user_profiles[user_id]
-    p["pro_profile_created_shown"] = shown
+    state = _get_state_for_write(user_id)
+    state.pro_profile_created_shown = shown
 
 def start_profile(
     user_id: int,
@@ -222,84 +284,100 @@ def start_profile(
     context: str = "unknown",
     current_mode: str | None = None,
 ) -> dict:
-    existing = _user_profiles.get(user_id) or {}
-    pending_question = existing.get("pending_question")
-    pending_action = existing.get("pending_action")
-    preserved = {
-        "profile": existing.get("profile"),
-        "pet_profile": existing.get("pet_profile"),
-        "pet_profile_loaded": existing.get("pet_profile_loaded"),
-        "last_limits": existing.get("last_limits"),
-        "pro_profile_created_shown": existing.get("pro_profile_created_shown"),
-        "skip_basic_info": existing.get("skip_basic_info"),
-        "profile_dirty": existing.get("profile_dirty"),
-        "profile_saving": existing.get("profile_saving"),
-    }
-    _user_profiles[user_id] = {"type": pet_type, "context": context, "step": "basic_info"}
-    if pending_question:
-        _user_profiles[user_id]["pending_question"] = pending_question
-    if pending_action is not None:
-        _user_profiles[user_id]["pending_action"] = pending_action
-    if current_mode:
-        _user_profiles[user_id]["current_mode"] = current_mode
-    for key, value in preserved.items():
-        if value is not None:
-            _user_profiles[user_id][key] = value
-    return _user_profiles[user_id]
+    existing = _get_state(user_id) or UserState()
+    # Новая анкета: Free-поля сбрасываются, Pro-профиль и служебные флаги сохраняются
+    state = UserState(
+        pet_type=pet_type,
+        context=context,
+        step="basic_info",
+        current_mode=current_mode or None,
+        pending_question=existing.pending_question or None,
+        pending_action=existing.pending_action,
+        profile=existing.profile,
+        pet_profile=existing.pet_profile,
+        pet_profile_loaded=existing.pet_profile_loaded,
+        last_limits=existing.last_limits,
+        last_limits_at=existing.last_limits_at,
+        me_etag=existing.me_etag,
+        pro_profile_created_shown=existing.pro_profile_created_shown,
+        skip_basic_info=existing.skip_basic_info,
+        profile_dirty=existing.profile_dirty,
+        profile_saving=existing.profile_saving,
+    )
+    _backend.put(user_id, state)
+    return state.to_dict()
 
 def set_basic_info(user_id: int, text: str) -> None:
-    p = _user_profiles[user_id]
-    p["basic_info"] = text.strip()
-    p["step"] = "question"
+    state = _get_state_for_write(user_id)
+    state.basic_info = text.strip()
+    state.step = "question"
 
 def set_question(user_id: int, text: str) -> None:
-    p = _user_profiles[user_id]
-    p["question"] = text.strip()
-    p["step"] = "done"
+    state = _get_state_for_write(user_id)
+    state.question = text.strip()
+    state.step = "done"
 
 def set_waiting_question(user_id: int) -> None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
+        return
+    _backend.mark_dirty(user_id)
+    state.step = "question"
+
+def set_step(user_id: int, step: str) -> None:
+    state = _get_state(user_id)
+    if not state:
         return
-    p["step"] = "question"
+    _backend.mark_dirty(user_id)
+    state.step = step
 
 def set_pending_question(user_id: int, text: str) -> None:
-    p = _user_profiles[user_id]
-    p["pending_question"] = text.strip()
+    state = _get_state_for_write(user_id)
+    state.pending_question = text.strip()
 
 def get_pending_question(user_id: int) -> str | None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return None
-    return p.get("pending_question")
+    return state.pending_question
 
 def pop_pending_question(user_id: int) -> str | None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return None
-    return p.pop("pending_question", None)
+    question = state.pending_question
+    if question is not None:
+        _backend.mark_dirty(user_id)
+        state.pending_question = None
+    return question
 
 def set_pending_action(user_id: int, action: dict) -> None:
-    p = _user_profiles[user_id]
-    p["pending_action"] = action
+    state = _get_state_for_write(user_id)
+    state.pending_action = action
 
 def get_pending_action(user_id: int) -> dict | None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return None
-    return p.get("pending_action")
+    return state.pending_action
 
 def pop_pending_action(user_id: int) -> dict | None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return None
-    return p.pop("pending_action", None)
+    action = state.pending_action
+    if action is not None:
+        _backend.mark_dirty(user_id)
+        state.pending_action = None
+    return action
 
 def clear_pending_action(user_id: int) -> None:
-    p = _user_profiles.get(user_id)
-    if not p:
+    state = _get_state(user_id)
+    if not state:
         return
-    p.pop("pending_action", None)
+    if state.pending_action is not None:
+        _backend.mark_dirty(user_id)
+        state.pending_action = None
 
 def clear_profile(user_id: int) -> None:
-    _user_profiles.pop(user_id, None)
+    _backend.delete(user_id)
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, fields
+
+# memory — только RAM (LRU + TTL); sqlite — RAM-кэш + батчевая запись на диск
+BOT_STATE_BACKEND = (os.getenv("BOT_STATE_BACKEND") or "memory").strip().lower()
+BOT_STATE_SQLITE_PATH = os.getenv("BOT_STATE_SQLITE_PATH", "bot_state.sqlite3")
+BOT_STATE_MAX_USERS = int(os.getenv("BOT_STATE_MAX_USERS", "10000"))
+BOT_STATE_TTL_SEC = int(os.getenv("BOT_STATE_TTL_SEC", str(7 * 24 * 3600)))
+BOT_STATE_FLUSH_SEC = float(os.getenv("BOT_STATE_FLUSH_SEC", "2"))
+
+
+@dataclass
+class UserState:
+    """
+    Состояние диалога одного пользователя (раньше — dict с произвольными ключами).
+    """
+
+    # Free-анкета
+    pet_type: str | None = None
+    context: str | None = None
+    step: str | None = None
+    current_mode: str | None = None
+    basic_info: str | None = None
+    question: str | None = None
+    pending_question: str | None = None
+    pending_action: dict | None = None
+    # Pro-профиль питомца
+    profile: dict | None = None
+    pet_profile: dict | None = None
+    pet_profile_loaded: bool | None = None
+    profile_dirty: bool | None = None
+    profile_saving: bool | None = None
+    skip_basic_info: bool | None = None
+    pro_step: str | None = None
+    awaiting_button: bool | None = None
+    pro_temp: dict | None = None
+    pro_profile_created_shown: bool | None = None
+    last_limits: dict | None = None
+    # служебное: когда last_limits пришли от backend (для TTL кэша тарифа)
+    last_limits_at: float | None = None
+    # служебное: ETag ответа GET /v1/me, из которого взяты last_limits (If-None-Match → 304)
+    me_etag: str | None = None
+    # служебное: время последнего обращения (для TTL)
+    touched_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        """
+        Dict в прежнем формате (_user_profiles[user_id]) — только заданные поля.
+        """
+        data = {}
+        for item in fields(self):
+            if item.name in ("touched_at", "last_limits_at", "me_etag"):
+                continue
+            value = getattr(self, item.name)
+            if value is None:
+                continue
+            data["type" if item.name == "pet_type" else item.name] = value
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "UserState":
+        data = json.loads(raw)
+        known = {item.name for item in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+class MemoryStateBackend:
+    """
+    LRU с TTL: не больше max_users записей, неактивные дольше ttl_sec вытесняются.
+    """
+
+    def __init__(self, max_users: int = BOT_STATE_MAX_USERS, ttl_sec: int = BOT_STATE_TTL_SEC):
+        self.max_users = max_users
+        self.ttl_sec = ttl_sec
+        self._items: OrderedDict[int, UserState] = OrderedDict()
+
+    def get(self, user_id: int) -> UserState | None:
+        state = self._items.get(user_id)
+        if state is None:
+            return None
+        now = time.time()
+        if now - state.touched_at >= self.ttl_sec:
+            self._items.pop(user_id, None)
+            return None
+        state.touched_at = now
+        self._items.move_to_end(user_id)
+        return state
+
+    def put(self, user_id: int, state: UserState) -> None:
+        state.touched_at = time.time()
+        self._items[user_id] = state
+        self._items.move_to_end(user_id)
+        self._evict()
+
+    def delete(self, user_id: int) -> None:
+        self._items.pop(user_id, None)
+
+    def mark_dirty(self, user_id: int) -> None:
+        return None
+
+    def _evict(self) -> list[tuple[int, UserState]]:
+        evicted = []
+        now = time.time()
+        # Самые старые по обращению — в начале OrderedDict
+        while self._items:
+            user_id, state = next(iter(self._items.items()))
+            if len(self._items) <= self.max_users and now - state.touched_at < self.ttl_sec:
+                break
+            self._items.popitem(last=False)
+            evicted.append((user_id, state))
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+
+class SqliteStateBackend(MemoryStateBackend):
+    """
+    RAM-кэш (тот же LRU) + SQLite. Изменения копятся в dirty-наборе
+    и пишутся одной транзакцией раз в BOT_STATE_FLUSH_SEC; при остановке — финальный flush.
+    """
+
+    def __init__(
+        self,
+        path: str = BOT_STATE_SQLITE_PATH,
+        max_users: int = BOT_STATE_MAX_USERS,
+        ttl_sec: int = BOT_STATE_TTL_SEC,
+        flush_sec: float = BOT_STATE_FLUSH_SEC,
+    ):
+        super().__init__(max_users=max_users, ttl_sec=ttl_sec)
+        self.path = path
+        self.flush_sec = flush_sec
+        self._dirty: set[int] = set()
+        self._deleted: set[int] = set()
+        # Вытесненные из кэша, но ещё не записанные состояния
+        self._pending: dict[int, UserState] = {}
+        # dirty-записи пачки, которая сейчас пишется: при ошибке записи возвращаются в _dirty
+        self._in_flight: set[int] = set()
+        self._db_lock = threading.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute("pragma journal_mode=wal")
+            self._conn.execute("pragma synchronous=normal")
+            self._conn.execute(
+                "create table if not exists user_state ("
+                "user_id integer primary key, "
+                "state text not null, "
+                "updated_at real not null)"
+            )
+            self._conn.commit()
+        # Чтение при промахе кэша — своим соединением из event loop, без _db_lock:
+        # в WAL оно не ждёт пишущую транзакцию flush-потока
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+
+    def get(self, user_id: int) -> UserState | None:
+        state = super().get(user_id)
+        if state is not None:
+            return state
+        if user_id in self._deleted:
+            return None
+        state = self._pending.pop(user_id, None)
+        if state is None:
+            row = self._read_conn.execute(
+                "select state from user_state where user_id = ? and updated_at > ?",
+                (user_id, time.time() - self.ttl_sec),
+            ).fetchone()
+            if not row:
+                return None
+            state = UserState.from_json(row[0])
+        else:
+            self._dirty.add(user_id)
+        super().put(user_id, state)
+        return state
+
+    def put(self, user_id: int, state: UserState) -> None:
+        self._deleted.discard(user_id)
+        self._pending.pop(user_id, None)
+        super().put(user_id, state)
+        self._dirty.add(user_id)
+
+    def delete(self, user_id: int) -> None:
+        super().delete(user_id)
+        self._pending.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._deleted.add(user_id)
+
+    def mark_dirty(self, user_id: int) -> None:
+        self._dirty.add(user_id)
+
+    def _evict(self) -> list[tuple[int, UserState]]:
+        evicted = super()._evict()
+        for user_id, state in evicted:
+            if user_id in self._dirty or user_id in self._in_flight:
+                self._dirty.discard(user_id)
+                self._pending[user_id] = state
+        return evicted
+
+    def _take_batch(self) -> tuple[list[tuple[int, str, float]], dict[int, UserState], list[int]]:
+        """
+        Снимок изменений в event loop (без гонок с хендлерами); запись — в отдельном потоке.
+        _pending и _deleted не очищаются до commit: при ошибке записи пачка не теряется.
+        """
+        rows = []
+        for user_id in self._dirty:
+            state = self._items.get(user_id)
+            if state is not None:
+                rows.append((user_id, state.to_json(), state.touched_at))
+        pending = dict(self._pending)
+        for user_id, state in pending.items():
+            rows.append((user_id, state.to_json(), state.touched_at))
+        deleted = list(self._deleted)
+        self._in_flight = set(self._dirty)
+        self._dirty.clear()
+        return rows, pending, deleted
+
+    def _finish_batch(self, pending: dict[int, UserState], deleted: list[int], ok: bool) -> None:
+        in_flight, self._in_flight = self._in_flight, set()
+        if not ok:
+            # Вытесненные за время записи уже лежат в _pending (см. _evict)
+            self._dirty.update(user_id for user_id in in_flight if user_id in self._items)
+            return
+        for user_id, state in pending.items():
+            # Состояние могли вернуть в кэш (get) или заменить (put) за время записи
+            if self._pending.get(user_id) is state:
+                del self._pending[user_id]
+        self._deleted.difference_update(deleted)
+
+    def _write_batch(self, rows: list[tuple[int, str, float]], deleted: list[int]) -> None:
+        with self._db_lock:
+            if rows:
+                self._conn.executemany(
+                    "insert into user_state (user_id, state, updated_at) values (?, ?, ?) "
+                    "on conflict(user_id) do update set "
+                    "state = excluded.state, updated_at = excluded.updated_at",
+                    rows,
+                )
+            if deleted:
+                self._conn.executemany(
+                    "delete from user_state where user_id = ?",
+                    [(user_id,) for user_id in deleted],
+                )
+            self._conn.execute(
+                "delete from user_state where updated_at <= ?",
+                (time.time() - self.ttl_sec,),
+            )
+            self._conn.commit()
+
+    async def flush(self) -> int:
+        rows, pending, deleted = self._take_batch()
+        if not rows and not deleted:
+            self._in_flight = set()
+            return 0
+        try:
+            await asyncio.to_thread(self._write_batch, rows, deleted)
+        except BaseException:
+            self._finish_batch(pending, deleted, ok=False)
+            raise
+        self._finish_batch(pending, deleted, ok=True)
+        return len(rows) + len(deleted)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            try:
+                await self.flush()
+            except Exception as exc:
+                print(f"[STATE] flush failed err={type(exc).__name__}: {exc}")
+
+    async def start(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            await self.flush()
+        finally:
+            self._read_conn.close()
+            with self._db_lock:
+                self._conn.close()
+
+
+def create_state_backend() -> MemoryStateBackend:
+    if BOT_STATE_BACKEND == "sqlite":
+        print(f"[STATE] backend=sqlite path={BOT_STATE_SQLITE_PATH}")
+        return SqliteStateBackend()
+    if BOT_STATE_BACKEND != "memory":
+        print(f"[STATE] unknown BOT_STATE_BACKEND={BOT_STATE_BACKEND}, using memory")
+    return MemoryStateBackend()
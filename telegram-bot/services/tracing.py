@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import random
+import time
+from urllib import request
+
+from services.metrics import TRACE_SPANS_DROPPED
+
+# Трейс вопроса пользователя: бот открывает его в send_backend_response и передаёт в backend
+# заголовком traceparent (рядом с X-Request-Id). Экспорт: jsonl (файл) или otlp (коллектор), пусто = выкл.
+BOT_TRACE_EXPORT = os.getenv("BOT_TRACE_EXPORT", "").strip().lower()
+BOT_TRACE_FILE = os.getenv("BOT_TRACE_FILE", "bot_traces.jsonl")
+BOT_TRACE_OTLP_ENDPOINT = os.getenv("BOT_TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+BOT_TRACE_SAMPLE_RATE = float(os.getenv("BOT_TRACE_SAMPLE_RATE", "1.0"))
+BOT_TRACE_SERVICE_NAME = os.getenv("BOT_TRACE_SERVICE_NAME", "hvostosovet-bot")
+TRACE_FLUSH_SEC = 2.0
+# Больше законченных span'ов между выгрузками не держим (коллектор недоступен) — остальные теряются
+TRACE_BUFFER_MAX = 10000
+
+# W3C Trace Context: traceparent = 00-<trace_id 32 hex>-<parent span_id 16 hex>-<flags>
+TRACEPARENT_VERSION = "00"
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+# Span'ы создаются и закрываются только в event loop бота: буфер без блокировок,
+# выгрузка — задачей loop, запись файла/HTTP — в потоке (asyncio.to_thread)
+_buffer: list["Span"] = []
+_flush_task: asyncio.Task | None = None
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, kind: int, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = False
+
+    def child(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind, attributes)
+
+    def traceparent(self) -> str:
+        return f"{TRACEPARENT_VERSION}-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error: bool = False, **attributes) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        self.error = self.error or error
+        self.attributes.update(attributes)
+        _buffer_span(self)
+
+
+def start_trace(name: str, **attributes) -> Span | None:
+    """
+    Корневой span вопроса. None — трейсинг выключен или вопрос не попал в выборку.
+    """
+    if not BOT_TRACE_EXPORT or random.random() >= BOT_TRACE_SAMPLE_RATE:
+        return None
+    return Span(name, _new_id(16), None, SPAN_KIND_INTERNAL, attributes)
+
+
+def _buffer_span(span: Span) -> None:
+    global _flush_task
+    if len(_buffer) >= TRACE_BUFFER_MAX:
+        TRACE_SPANS_DROPPED.labels("buffer_full").inc()
+        return
+    _buffer.append(span)
+    if _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+def span_to_json(span: Span) -> dict:
+    return {
+        "service": BOT_TRACE_SERVICE_NAME,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "kind": span.kind,
+        "start_ns": span.start_ns,
+        "end_ns": span.end_ns,
+        "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+        "error": span.error,
+        "attributes": span.attributes,
+    }
+
+
+def _otlp_attr(key: str, value) -> dict:
+    # Атрибуты бота — только строки, числа и флаги
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_body(spans: list[Span]) -> bytes:
+    """
+    OTLP/HTTP JSON (POST /v1/traces).
+    """
+    otlp_spans = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_otlp_attr(key, value) for key, value in span.attributes.items() if value is not None],
+            "status": {"code": 2 if span.error else 1},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        otlp_spans.append(item)
+    body = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attr("service.name", BOT_TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "hvostosovet"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+    return json.dumps(body).encode("utf-8")
+
+
+def _write(batch: list[Span]) -> None:
+    if BOT_TRACE_EXPORT == "otlp":
+        req = request.Request(
+            BOT_TRACE_OTLP_ENDPOINT,
+            data=_otlp_body(batch),
+            method="POST",
+            headers={"Content-Type": "application/json"},
+        )
+        with request.urlopen(req, timeout=5) as resp:
+            resp.read()
+        return
+    with open(BOT_TRACE_FILE, "a", encoding="utf-8") as fh:
+        for span in batch:
+            fh.write(json.dumps(span_to_json(span), ensure_ascii=False, default=str) + "\n")
+
+
+async def _flush() -> None:
+    global _buffer
+    if not _buffer:
+        return
+    batch, _buffer = _buffer, []
+    try:
+        await asyncio.to_thread(_write, batch)
+    except Exception as exc:
+        TRACE_SPANS_DROPPED.labels("export_failed").inc(len(batch))
+        print(f"[TRACE] export failed kind={BOT_TRACE_EXPORT} spans={len(batch)} err={type(exc).__name__}: {exc}")
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_SEC)
+        await _flush()
+
+
+async def shutdown_tracing() -> None:
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await _flush()
@@ -0,0 +1,194 @@
+"""
+Режим нескольких процессов (BOT_WORKERS > 1).
+
+receiver — один Pyrogram-клиент, который только получает апдейты от Telegram
+и раскладывает их по воркерам: telegram user_id % BOT_WORKERS. Все апдейты
+одного пользователя попадают в один и тот же процесс, поэтому порядок
+и локальный кэш состояния не расходятся между процессами.
+
+worker — отдельный процесс со своим Pyrogram-клиентом (no_updates=True,
+своя сессия), своим event loop, httpx-пулом и хранилищем состояний.
+Апдейты приходят через multiprocessing.Queue и попадают в обычный
+dispatcher Pyrogram, так что хендлеры (question, pro_flow, menu, ...) не меняются.
+
+Состояние между рестартами и при изменении BOT_WORKERS — через BOT_STATE_BACKEND=sqlite.
+"""
+import asyncio
+import io
+import multiprocessing
+import signal
+
+from pyrogram import Client, idle
+from pyrogram.dispatcher import Dispatcher
+from pyrogram.raw.core import TLObject
+
+import config
+from services.backend_client import open_client, close_client
+from services.image_pool import shutdown_image_pool
+from services.metrics import (
+    BOT_METRICS_PORT,
+    mark_process_dead,
+    prepare_multiprocess_dir,
+    start_metrics_server,
+)
+from services.state import start_state_store, stop_state_store
+from services.state_store import BOT_STATE_BACKEND
+from services.tracing import shutdown_tracing
+
+WORKER_STOP_TIMEOUT_SEC = 30
+
+
+def _update_user_id(update) -> int:
+    user_id = getattr(update, "user_id", None)
+    if user_id:
+        return user_id
+    message = getattr(update, "message", None)
+    for peer in (getattr(message, "from_id", None), getattr(message, "peer_id", None)):
+        user_id = getattr(peer, "user_id", None)
+        if user_id:
+            return user_id
+    return 0
+
+
+def _encode_packet(update, users: dict, chats: dict) -> tuple[bytes, list[bytes], list[bytes]]:
+    # TL-объекты сериализуются родным MTProto-форматом: компактно и без pickle
+    return (
+        update.write(),
+        [user.write() for user in users.values()],
+        [chat.write() for chat in chats.values()],
+    )
+
+
+def _decode_packet(packet: tuple[bytes, list[bytes], list[bytes]]):
+    raw_update, raw_users, raw_chats = packet
+    update = TLObject.read(io.BytesIO(raw_update))
+    users = [TLObject.read(io.BytesIO(item)) for item in raw_users]
+    chats = [TLObject.read(io.BytesIO(item)) for item in raw_chats]
+    return update, users, chats
+
+
+class ForwardingDispatcher(Dispatcher):
+    """
+    Dispatcher receiver'а: не парсит апдейты и не вызывает хендлеры,
+    а отправляет сырой апдейт в очередь воркера пользователя.
+    """
+
+    def __init__(self, client: Client, queues: list):
+        super().__init__(client)
+        self.queues = queues
+
+    async def handler_worker(self, lock):
+        while True:
+            packet = await self.updates_queue.get()
+            if packet is None:
+                break
+            try:
+                update, users, chats = packet
+                user_id = _update_user_id(update)
+                index = user_id % len(self.queues)
+                self.queues[index].put(_encode_packet(update, users, chats))
+                if config.BOT_DEBUG:
+                    print(f"[RECEIVER] update={type(update).__name__} user_id={user_id} worker={index}")
+            except Exception as exc:
+                print(f"[RECEIVER] forward failed err={type(exc).__name__}: {exc}")
+
+
+async def _feed_updates(app: Client, queue) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        packet = await loop.run_in_executor(None, queue.get)
+        if packet is None:
+            return
+        try:
+            update, users, chats = _decode_packet(packet)
+            # Peer'ы нужны локальной сессии воркера, чтобы отвечать пользователю
+            await app.fetch_peers(users)
+            await app.fetch_peers(chats)
+            app.dispatcher.updates_queue.put_nowait(
+                (
+                    update,
+                    {user.id: user for user in users},
+                    {chat.id: chat for chat in chats},
+                )
+            )
+        except Exception as exc:
+            print(f"[WORKER] bad update packet err={type(exc).__name__}: {exc}")
+
+
+async def _run_worker(app: Client, index: int, queue) -> None:
+    await open_client()
+    await start_state_store()
+    dispatcher = app.dispatcher
+    handler_tasks = []
+    try:
+        async with app:
+            # no_updates=True не запускает handler-задачи dispatcher'а — стартуем их сами
+            for _ in range(app.workers):
+                lock = asyncio.Lock()
+                dispatcher.locks_list.append(lock)
+                handler_tasks.append(asyncio.create_task(dispatcher.handler_worker(lock)))
+            print(f"[WORKER] #{index} started handlers={app.workers}")
+            await _feed_updates(app, queue)
+            for _ in handler_tasks:
+                dispatcher.updates_queue.put_nowait(None)
+            await asyncio.gather(*handler_tasks)
+    finally:
+        await stop_state_store()
+        await close_client()
+        shutdown_image_pool()
+        mark_process_dead()
+        await shutdown_tracing()
+        print(f"[WORKER] #{index} stopped")
+
+
+def worker_main(index: int, queue) -> None:
+    # Остановкой управляет receiver (None в очередь), чтобы воркер успел сделать flush состояния
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    from main import create_app
+
+    app = create_app(f"hvostosovet_bot_w{index}", no_updates=True)
+    app.run(_run_worker(app, index, queue))
+
+
+async def _run_receiver(app: Client) -> None:
+    async with app:
+        print("Бот запущен! 🐾 Жду команд...")
+        await idle()
+
+
+def run_receiver(workers: int) -> None:
+    if BOT_STATE_BACKEND == "memory":
+        print("[RECEIVER] BOT_STATE_BACKEND=memory: состояние не переживёт рестарт воркеров, лучше sqlite")
+
+    metrics_dir = prepare_multiprocess_dir() if BOT_METRICS_PORT else None
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=worker_main, args=(index, queue), name=f"bot-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    print(f"[RECEIVER] workers={workers}")
+    start_metrics_server(metrics_dir)
+
+    # Один handler-таск: апдейты уходят в очереди в порядке получения
+    app = Client(
+        "hvostosovet_bot",
+        bot_token=config.BOT_TOKEN,
+        api_id=config.API_ID,
+        api_hash=config.API_HASH,
+        workers=1,
+    )
+    app.dispatcher = ForwardingDispatcher(app, queues)
+    try:
+        app.run(_run_receiver(app))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join(WORKER_STOP_TIMEOUT_SEC)
+            if process.is_alive():
+                print(f"[RECEIVER] worker {process.name} did not stop, terminating")
+                process.terminate()